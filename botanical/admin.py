@@ -1,9 +1,16 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Count, Avg, Sum
+from django.db import transaction
+from django.db.models import Count, Avg, Sum, Q
+from django.utils import timezone
+from .catalog import bump_catalog_version
+from .changelists import IndexedValuesFilter, LargeTableAdmin, users_matching
+from .exports import export_as_csv, export_as_jsonl, export_order_items_as_csv
+from .images import thumbnail_url
+from .search import TEXT_INDEXES, search_products
 from .models import (
     UserProfile, Product, Review, Wishlist, 
-    Order, OrderItem, PlantDiagnosis, Newsletter
+    Order, OrderItem, PlantDiagnosis, Newsletter, DiagnosisResult, DiagnosisJob
 )
 
 
@@ -11,6 +18,7 @@ from .models import (
 class UserProfileAdmin(admin.ModelAdmin):
     """Admin interface for User Profiles"""
     list_display = ['user', 'membership_tier', 'phone_number', 'city', 'created_at', 'profile_image_preview']
+    list_select_related = ['user']
     list_filter = ['membership_tier', 'created_at', 'state']
     search_fields = ['user__username', 'user__email', 'phone_number', 'city']
     readonly_fields = ['created_at', 'updated_at', 'profile_image_preview']
@@ -30,7 +38,7 @@ class UserProfileAdmin(admin.ModelAdmin):
     
     def profile_image_preview(self, obj):
         if obj.profile_picture:
-            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.profile_picture.url)
+            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', thumbnail_url(obj.profile_picture, obj.profile_picture_hash, obj.profile_picture_width, 100))
         return "No Image"
     profile_image_preview.short_description = 'Profile Picture'
 
@@ -40,13 +48,13 @@ class ProductAdmin(admin.ModelAdmin):
     """Admin interface for Products"""
     list_display = ['name', 'category', 'price', 'stock_quantity', 'featured', 'is_active', 'average_rating', 'review_count', 'product_image_preview']
     list_filter = ['category', 'is_active', 'featured', 'created_at']
-    search_fields = ['name', 'scientific_name', 'description']
+    search_fields = ['sku', 'name', 'scientific_name', 'description']
     list_editable = ['price', 'stock_quantity', 'featured', 'is_active']
-    readonly_fields = ['created_at', 'updated_at', 'product_image_preview', 'average_rating', 'review_count']
+    readonly_fields = ['created_at', 'updated_at', 'product_image_preview', 'average_rating', 'review_count', 'rating_histogram']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'scientific_name', 'category', 'description')
+            'fields': ('name', 'scientific_name', 'sku', 'category', 'description')
         }),
         ('Pricing & Stock', {
             'fields': ('price', 'stock_quantity')
@@ -58,7 +66,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('tags', 'is_active', 'featured')
         }),
         ('Statistics', {
-            'fields': ('average_rating', 'review_count'),
+            'fields': ('average_rating', 'review_count', 'rating_histogram'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -69,42 +77,51 @@ class ProductAdmin(admin.ModelAdmin):
     
     def product_image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 150px; max-width: 150px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 150px; max-width: 150px;" />', thumbnail_url(obj.image, obj.image_hash, obj.image_width, 150))
         elif obj.image_url:
             return format_html('<img src="{}" style="max-height: 150px; max-width: 150px;" />', obj.image_url)
         return "No Image"
     product_image_preview.short_description = 'Product Image'
     
-    actions = ['mark_as_featured', 'mark_as_not_featured', 'activate_products', 'deactivate_products']
+    actions = ['mark_as_featured', 'mark_as_not_featured', 'activate_products', 'deactivate_products',
+               export_as_csv, export_as_jsonl]
     
     def mark_as_featured(self, request, queryset):
-        queryset.update(featured=True)
-        self.message_user(request, f"{queryset.count()} products marked as featured.")
+        updated = queryset.update(featured=True, updated_at=timezone.now())
+        transaction.on_commit(bump_catalog_version)
+        self.message_user(request, f"{updated} products marked as featured.")
     mark_as_featured.short_description = "Mark selected as featured"
     
     def mark_as_not_featured(self, request, queryset):
-        queryset.update(featured=False)
-        self.message_user(request, f"{queryset.count()} products unmarked as featured.")
+        updated = queryset.update(featured=False, updated_at=timezone.now())
+        transaction.on_commit(bump_catalog_version)
+        self.message_user(request, f"{updated} products unmarked as featured.")
     mark_as_not_featured.short_description = "Unmark selected as featured"
     
     def activate_products(self, request, queryset):
-        queryset.update(is_active=True)
-        self.message_user(request, f"{queryset.count()} products activated.")
+        updated = queryset.update(is_active=True, updated_at=timezone.now())
+        transaction.on_commit(bump_catalog_version)
+        self.message_user(request, f"{updated} products activated.")
     activate_products.short_description = "Activate selected products"
     
     def deactivate_products(self, request, queryset):
-        queryset.update(is_active=False)
-        self.message_user(request, f"{queryset.count()} products deactivated.")
+        updated = queryset.update(is_active=False, updated_at=timezone.now())
+        transaction.on_commit(bump_catalog_version)
+        self.message_user(request, f"{updated} products deactivated.")
     deactivate_products.short_description = "Deactivate selected products"
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     """Admin interface for Product Reviews"""
     list_display = ['user', 'product', 'rating', 'comment_preview', 'created_at']
-    list_filter = ['rating', 'created_at', 'product__category']
-    search_fields = ['user__username', 'product__name', 'comment']
+    list_select_related = ['user', 'product']
+    list_filter = [('rating', IndexedValuesFilter), 'product__category']
+    date_hierarchy = 'created_at'
+    search_fields = ['user__username', 'product__name', 'comment']  # see search_filter
+    raw_id_fields = ['user', 'product']
     readonly_fields = ['created_at', 'updated_at']
+    actions = [export_as_csv, export_as_jsonl]
     
     fieldsets = (
         ('Review Information', {
@@ -120,11 +137,17 @@ class ReviewAdmin(admin.ModelAdmin):
         return obj.comment[:50] + '...' if len(obj.comment) > 50 else obj.comment
     comment_preview.short_description = 'Comment'
 
+    def search_filter(self, term):
+        return (Q(user__in=users_matching(term)) |
+                Q(product__in=search_products(Product.objects.all(), term).values('pk')) |
+                TEXT_INDEXES[Review].matches(term))
+
 
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     """Admin interface for Wishlist"""
     list_display = ['user', 'product', 'added_at']
+    list_select_related = ['user', 'product']
     list_filter = ['added_at', 'product__category']
     search_fields = ['user__username', 'product__name']
     readonly_fields = ['added_at']
@@ -136,14 +159,18 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ['subtotal']
     fields = ['product', 'quantity', 'price', 'subtotal']
+    raw_id_fields = ['product']
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     """Admin interface for Orders"""
     list_display = ['order_number', 'user', 'status', 'final_total', 'created_at', 'status_badge']
-    list_filter = ['status', 'created_at', 'shipping_state']
-    search_fields = ['order_number', 'user__username', 'user__email', 'tracking_number']
+    list_select_related = ['user']
+    list_filter = ['status', ('shipping_state', IndexedValuesFilter)]
+    date_hierarchy = 'created_at'
+    search_fields = ['order_number', 'user__username', 'user__email', 'tracking_number']  # see search_filter
+    raw_id_fields = ['user']
     readonly_fields = ['order_number', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
     
@@ -180,28 +207,39 @@ class OrderAdmin(admin.ModelAdmin):
             color, obj.status
         )
     status_badge.short_description = 'Status'
+
+    def search_filter(self, term):
+        # Order and tracking numbers are matched whole, through their unique/plain indexes
+        return (Q(order_number__in={term, term.upper()}) | Q(tracking_number=term) |
+                Q(user__in=users_matching(term)))
     
-    actions = ['mark_as_shipped', 'mark_as_delivered']
+    actions = ['mark_as_shipped', 'mark_as_delivered', export_as_csv, export_as_jsonl, export_order_items_as_csv]
     
+    # update() sends no signals, so a cancelled order moved back into the sales
+    # rollups and the profile counters this way would be missing from both: the
+    # actions leave cancelled orders alone; reinstate them from the change form.
     def mark_as_shipped(self, request, queryset):
-        queryset.update(status='Shipped')
-        self.message_user(request, f"{queryset.count()} orders marked as shipped.")
+        updated = queryset.exclude(status='Cancelled').update(status='Shipped')
+        self.message_user(request, f"{updated} orders marked as shipped.")
     mark_as_shipped.short_description = "Mark selected as shipped"
     
     def mark_as_delivered(self, request, queryset):
-        from django.utils import timezone
-        queryset.update(status='Delivered', delivered_at=timezone.now())
-        self.message_user(request, f"{queryset.count()} orders marked as delivered.")
+        updated = queryset.exclude(status='Cancelled').update(status='Delivered', delivered_at=timezone.now())
+        self.message_user(request, f"{updated} orders marked as delivered.")
     mark_as_delivered.short_description = "Mark selected as delivered"
 
 
 @admin.register(PlantDiagnosis)
-class PlantDiagnosisAdmin(admin.ModelAdmin):
+class PlantDiagnosisAdmin(LargeTableAdmin):
     """Admin interface for Plant Diagnoses"""
     list_display = ['user_display', 'diagnosis_preview', 'created_at', 'diagnosis_image_preview']
-    list_filter = ['created_at']
-    search_fields = ['user__username', 'diagnosis', 'recommendations']
+    # user is nullable, so the changelist's automatic select_related() would skip it
+    list_select_related = ['user']
+    date_hierarchy = 'created_at'
+    search_fields = ['user__username', 'diagnosis', 'recommendations']  # see search_filter
+    raw_id_fields = ['user']
     readonly_fields = ['created_at', 'diagnosis_image_preview']
+    actions = [export_as_csv, export_as_jsonl]
     
     fieldsets = (
         ('Diagnosis Information', {
@@ -222,10 +260,33 @@ class PlantDiagnosisAdmin(admin.ModelAdmin):
     
     def diagnosis_image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 200px; max-width: 200px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 200px; max-width: 200px;" />', thumbnail_url(obj.image, obj.image_hash, obj.image_width, 200))
         return "No Image"
     diagnosis_image_preview.short_description = 'Plant Image'
 
+    def search_filter(self, term):
+        return Q(user__in=users_matching(term)) | TEXT_INDEXES[PlantDiagnosis].matches(term)
+
+
+@admin.register(DiagnosisResult)
+class DiagnosisResultAdmin(admin.ModelAdmin):
+    """Admin interface for the Plant Doctor result cache"""
+    list_display = ['content_hash', 'perceptual_hash', 'hits', 'last_used_at', 'created_at']
+    search_fields = ['content_hash', 'perceptual_hash', 'diagnosis']
+    readonly_fields = ['content_hash', 'perceptual_hash', 'hits', 'last_used_at', 'created_at']
+    exclude = ['phash_band_0', 'phash_band_1', 'phash_band_2', 'phash_band_3']
+
+
+@admin.register(DiagnosisJob)
+class DiagnosisJobAdmin(admin.ModelAdmin):
+    """Admin interface for the Plant Doctor job queue"""
+    list_display = ['id', 'user', 'status', 'attempts', 'cached', 'worker', 'created_at', 'finished_at']
+    list_select_related = ['user']
+    list_filter = ['status', 'cached', 'created_at']
+    search_fields = ['id', 'user__username', 'content_hash']
+    readonly_fields = ['content_hash', 'perceptual_hash', 'attempts', 'worker', 'error', 'diagnosis',
+                       'created_at', 'started_at', 'finished_at']
+
 
 @admin.register(Newsletter)
 class NewsletterAdmin(admin.ModelAdmin):
@@ -235,16 +296,16 @@ class NewsletterAdmin(admin.ModelAdmin):
     search_fields = ['email', 'name']
     readonly_fields = ['subscribed_at']
     
-    actions = ['activate_subscriptions', 'deactivate_subscriptions']
+    actions = ['activate_subscriptions', 'deactivate_subscriptions', export_as_csv, export_as_jsonl]
     
     def activate_subscriptions(self, request, queryset):
-        queryset.update(is_active=True)
-        self.message_user(request, f"{queryset.count()} subscriptions activated.")
+        updated = queryset.update(is_active=True)
+        self.message_user(request, f"{updated} subscriptions activated.")
     activate_subscriptions.short_description = "Activate selected subscriptions"
     
     def deactivate_subscriptions(self, request, queryset):
-        queryset.update(is_active=False)
-        self.message_user(request, f"{queryset.count()} subscriptions deactivated.")
+        updated = queryset.update(is_active=False)
+        self.message_user(request, f"{updated} subscriptions deactivated.")
     deactivate_subscriptions.short_description = "Deactivate selected subscriptions"
 
 
@@ -7,5 +7,6 @@ class BotanicalConfig(AppConfig):
     verbose_name = 'Botanical Management'
 
     def ready(self):
-        # Import signals
+        # Import signals and system checks
+        import botanical.checks
         import botanical.signals
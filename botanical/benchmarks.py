@@ -0,0 +1,153 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks never touch the configured database: they run against a throwaway
+test database created for the duration of the command.
+"""
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from .models import Order, OrderItem, Product
+from .order_numbers import new_order_number
+
+
+WORDS = [
+    'monstera', 'lily', 'fern', 'cactus', 'succulent', 'orchid', 'basil', 'tomato',
+    'lavender', 'compost', 'seaweed', 'terracotta', 'copper', 'trailing', 'tropical',
+    'indoor', 'outdoor', 'organic', 'heirloom', 'fragrant', 'shade', 'sunny', 'green',
+    'leaf', 'root', 'bloom', 'seed', 'soil', 'pot', 'water', 'growth', 'harvest',
+]
+SYLLABLES = ['ba', 'ko', 'ri', 'ta', 'mel', 'zu', 'nor', 'phi', 'sa', 'den', 'vo', 'lu']
+# The rest of the vocabulary is made-up words with a Zipf-like frequency, so
+# common words match many rows and rare ones only a handful
+VOCABULARY = WORDS + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+TAGS = [
+    'indoor', 'outdoor', 'tropical', 'low-light', 'beginner-friendly', 'organic',
+    'edible', 'fragrant', 'air-purifying', 'pollinator-friendly', 'trailing', 'tools',
+]
+
+STATES = ['AP', 'AS', 'BR', 'DL', 'GA', 'GJ', 'HR', 'KA', 'KL', 'MH', 'MP', 'OR', 'PB', 'RJ', 'TN', 'TS', 'UP', 'WB']
+
+
+@contextmanager
+def scratch_database(on_disk=False):
+    """
+    Create (and afterwards destroy) a test database to benchmark against.
+
+    SQLite test databases live in memory unless `on_disk` is set, which
+    benchmarks writing from several threads need.
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test = connection.settings_dict['TEST']
+    with tempfile.TemporaryDirectory() as directory:
+        if on_disk and connection.vendor == 'sqlite':
+            connection.settings_dict['TEST'] = {**old_test, 'NAME': os.path.join(directory, 'bench.sqlite3')}
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict['TEST'] = old_test
+
+
+def seed_products(count, batch_size=5000, seed=0):
+    """Bulk insert `count` random products (signals are not sent)"""
+    rng = random.Random(seed)
+    categories = [value for value, label in Product.CATEGORY_CHOICES]
+    created = 0
+    while created < count:
+        batch = []
+        for i in range(created, min(count, created + batch_size)):
+            batch.append(Product(
+                name=' '.join(rng.choices(VOCABULARY, WEIGHTS, k=2)).title() + f' {i}',
+                scientific_name=' '.join(rng.choices(VOCABULARY, WEIGHTS, k=2)),
+                price=Decimal(rng.randint(100, 10000)) / 100,
+                description=' '.join(rng.choices(VOCABULARY, WEIGHTS, k=30)),
+                category=rng.choice(categories),
+                tags=rng.sample(TAGS, rng.randint(0, 4)),
+                stock_quantity=rng.randint(0, 200),
+                featured=rng.random() < 0.05,
+            ))
+        Product.objects.bulk_create(batch)
+        created += len(batch)
+
+
+def insert_rows(model, columns, rows):
+    """Plain executemany: seeding millions of rows through the ORM would dominate the run"""
+    sql = (f'INSERT INTO {model._meta.db_table} ({", ".join(columns)}) '
+           f'VALUES ({", ".join(["%s"] * len(columns))})')
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def seed_orders(count, days, user, batch_size=10_000, seed=0):
+    """
+    Insert `count` orders of 1-5 items from the existing products, spread over
+    the last `days` days, all placed by `user`. Returns the number of items.
+    """
+    rng = random.Random(seed)
+    products = list(Product.objects.values_list('pk', 'price'))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    seconds = days * 86400
+    order_columns = ['user_id', 'order_number', 'status', 'total', 'discount', 'final_total', 'shipping_address',
+                     'shipping_city', 'shipping_state', 'shipping_zip', 'created_at', 'updated_at']
+    item_columns = ['order_id', 'product_id', 'quantity', 'price', 'subtotal']
+    next_id = (Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+    items = 0
+    for batch_start in range(0, count, batch_size):
+        orders, lines = [], []
+        for order_id in range(next_id, next_id + min(batch_size, count - batch_start)):
+            created = connection.ops.adapt_datetimefield_value(now - datetime.timedelta(seconds=rng.randrange(seconds)))
+            total = Decimal('0.00')
+            for product_id, price in rng.sample(products, rng.randint(1, 5)):
+                quantity = rng.randint(1, 3)
+                lines.append((order_id, product_id, quantity, price, price * quantity))
+                total += price * quantity
+            status = 'Cancelled' if rng.random() < 0.05 else 'Delivered'
+            orders.append((user.pk, new_order_number(), status, total, 0, total, '1 Fern Way', 'Leafton',
+                           rng.choice(STATES), '12345', created, created))
+        next_id += len(orders)
+        items += len(lines)
+        with transaction.atomic():
+            insert_rows(Order, order_columns, orders)
+            insert_rows(OrderItem, item_columns, lines)
+    return items
+
+
+def measure(func, repeat=5):
+    """Run `func` `repeat` times and return (median, max) wall time in ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def reset_peak_rss():
+    """Restart the process's peak RSS count (Linux); False where that is not possible"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB since the last reset (Linux)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
@@ -0,0 +1,277 @@
+"""
+Product catalog serialization and cache validators shared by the views.
+
+Products are read with values() so a `?fields=` projection only loads the
+columns the requested keys need, and large result sets are written out as a
+stream of JSON chunks instead of one list built in memory.
+
+The catalog version is a counter in the Django cache, bumped by the Product
+and Review signals and the ProductAdmin bulk actions. Point CACHES at a shared
+backend (Redis, memcached) in production so every worker sees the bumps.
+Each process keeps a snapshot of the serialized active catalog, rebuilt when
+the version moves.
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .images import srcsets
+from .models import Product
+
+
+PLACEHOLDER_IMAGE = '/static/images/placeholder.jpg'
+
+
+def _image_url(row):
+    if row['image']:
+        return Product._meta.get_field('image').storage.url(row['image'])
+    return row['image_url'] or PLACEHOLDER_IMAGE
+
+
+def _average_rating(row):
+    if row['rating_count']:
+        return row['rating_sum'] / row['rating_count']
+    return 0
+
+
+# API key -> (model fields it needs, function building the value from a values() row)
+PRODUCT_API_FIELDS = {
+    'id': (('id',), lambda row: row['id']),
+    'name': (('name',), lambda row: row['name']),
+    'scientificName': (('scientific_name',), lambda row: row['scientific_name']),
+    'price': (('price',), lambda row: float(row['price'])),
+    'image': (('image', 'image_url'), _image_url),
+    'imageSrcset': (('image', 'image_hash', 'image_width'),
+                    lambda row: srcsets(row['image_hash'], row['image_width']) if row['image'] else {}),
+    'description': (('description',), lambda row: row['description']),
+    'category': (('category',), lambda row: row['category']),
+    'tags': (('tags',), lambda row: row['tags']),
+    'rating': (('rating_sum', 'rating_count'), _average_rating),
+    'reviews': (('rating_count',), lambda row: row['rating_count']),
+}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """Turn a `?fields=a,b` parameter into a list of API keys (all of them if empty)"""
+    if not value:
+        return list(PRODUCT_API_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_API_FIELDS]
+    if unknown or not fields:
+        raise InvalidFields(', '.join(unknown))
+    return fields
+
+
+def product_values(queryset, fields, extra=()):
+    """values() queryset loading only the columns `fields` (plus `extra`) need"""
+    columns = dict.fromkeys(extra)
+    for field in fields:
+        columns.update(dict.fromkeys(PRODUCT_API_FIELDS[field][0]))
+    return queryset.values(*columns)
+
+
+def serialize_row(row, fields):
+    return {field: PRODUCT_API_FIELDS[field][1](row) for field in fields}
+
+
+def serialize_products(queryset, fields=None):
+    """List of API dicts for a (small) product queryset"""
+    fields = fields or list(PRODUCT_API_FIELDS)
+    return [serialize_row(row, fields) for row in product_values(queryset, fields)]
+
+
+def paginate_products(queryset, per_page, cursor=None, fields=None):
+    """Keyset page of a product queryset, with rows serialized to API dicts"""
+    from .pagination import CursorPaginator
+    fields = fields or list(PRODUCT_API_FIELDS)
+    key_fields = CursorPaginator(queryset, per_page).key_fields
+    rows = product_values(queryset, fields, extra=key_fields)
+    page = CursorPaginator(rows, per_page).get_page_or_first(cursor)
+    page.object_list = [serialize_row(row, fields) for row in page.object_list]
+    return page
+
+
+def stream_products_json(queryset, fields=None, chunk_size=2000):
+    """
+    Yield a JSON array of API dicts piece by piece.
+
+    Rows are read with iterator() so at most one database chunk is held in
+    memory, and each chunk is encoded and flushed before the next is read.
+    """
+    fields = fields or list(PRODUCT_API_FIELDS)
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    rows = product_values(queryset, fields).iterator(chunk_size=chunk_size)
+
+    yield '['
+    buffer = []
+    first = True
+    for row in rows:
+        buffer.append(encode(serialize_row(row, fields)))
+        if len(buffer) >= chunk_size:
+            yield ('' if first else ',') + ','.join(buffer)
+            buffer, first = [], False
+    if buffer:
+        yield ('' if first else ',') + ','.join(buffer)
+    yield ']'
+
+
+# ============= CATALOG VERSION & VALIDATORS =============
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    """
+    Current catalog version: the time of the last change in milliseconds.
+
+    A missing key (first use, eviction) starts from the current time, so the
+    version never goes back to a value an old ETag was built from.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Record a catalog change. Writers call it through transaction.on_commit(),
+    so the new version is never visible before the rows it stands for.
+    """
+    version = max(int(time.time() * 1000), (cache.get(CATALOG_VERSION_KEY) or 0) + 1)
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def version_datetime(version):
+    return datetime.datetime.fromtimestamp(version / 1000, tz=datetime.timezone.utc)
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def catalog_validators(queryset, params=None):
+    """
+    (etag, last_modified) for a filtered product list and its QueryDict params.
+
+    Costs one aggregate query (newest updated_at and row count, both served
+    by the product indexes) plus a cache read; no rows are fetched.
+    """
+    version = get_catalog_version()
+    stats = queryset.order_by().aggregate(latest=Max('updated_at'), count=Count('id'))
+    latest = stats['latest'] or timezone.make_aware(datetime.datetime(2000, 1, 1))
+    params = sorted(params.lists()) if params else []
+    etag = make_etag(version, latest.isoformat(), stats['count'], params)
+    return etag, max(latest, version_datetime(version))
+
+
+# ============= CATALOG SNAPSHOT =============
+
+SNAPSHOT_SORT_FIELDS = ('featured', 'created_at')
+
+
+class CatalogSnapshot:
+    """
+    In-process copy of the serialized active products, per category.
+
+    Rows are API dicts plus the catalog sort keys (`featured`, `created_at`),
+    in Product.Meta.ordering order, so they can be paged with CursorPaginator.
+    The copy is tagged with the catalog version it was built at and rebuilt
+    with a single query once the shared version moves on. Catalogs larger
+    than settings.CATALOG_SNAPSHOT_MAX_PRODUCTS are not held in memory;
+    products() then returns None and callers read the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (version, rows by category, encoded JSON bodies); swapped as a whole
+        self._state = (None, None, {})
+        self.hits = 0
+        self.misses = 0
+
+    def _build(self):
+        limit = getattr(settings, 'CATALOG_SNAPSHOT_MAX_PRODUCTS', 20000)
+        fields = list(PRODUCT_API_FIELDS)
+        queryset = product_values(Product.objects.filter(is_active=True), fields, extra=SNAPSHOT_SORT_FIELDS)
+        by_category = {'All': []}
+        for row in queryset[:limit + 1].iterator(chunk_size=2000):
+            item = serialize_row(row, fields)
+            for field in SNAPSHOT_SORT_FIELDS:
+                item[field] = row[field]
+            by_category['All'].append(item)
+            by_category.setdefault(item['category'], []).append(item)
+        if len(by_category['All']) > limit:
+            return None
+        return by_category
+
+    def _current(self):
+        """The (version, rows by category, JSON bodies) state, rebuilt if stale"""
+        version = get_catalog_version()
+        state = self._state
+        if state[0] == version:
+            self.hits += 1
+            return state
+        with self._lock:
+            state = self._state
+            if state[0] == version:
+                self.hits += 1
+                return state
+            self.misses += 1
+            # The version is read before the rows, so a change made while
+            # building moves the version on and forces another rebuild
+            state = self._state = (version, self._build(), {})
+            return state
+
+    def products(self, category='All'):
+        """Serialized active products of a category, or None if not snapshotted"""
+        version, by_category, bodies = self._current()
+        if by_category is None:
+            return None
+        return by_category.get(category, [])
+
+    def products_json(self, category='All', fields=None):
+        """The api_products JSON body for a category, or None if not snapshotted"""
+        version, by_category, bodies = self._current()
+        if by_category is None:
+            return None
+        fields = fields or list(PRODUCT_API_FIELDS)
+        full = fields == list(PRODUCT_API_FIELDS)
+        # Only the full-field body is kept, encoded once per version and category
+        if full and category in bodies:
+            return bodies[category]
+        body = json.dumps(
+            [{field: row[field] for field in fields} for row in by_category.get(category, [])],
+            separators=(',', ':'),
+        )
+        if full:
+            bodies[category] = body
+        return body
+
+    def stats(self):
+        version, by_category, bodies = self._state
+        lookups = self.hits + self.misses
+        return {
+            'pid': os.getpid(),
+            'version': version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups, 4) if lookups else None,
+            'products': len(by_category['All']) if by_category else None,
+        }
+
+
+catalog_snapshot = CatalogSnapshot()
@@ -0,0 +1,277 @@
+"""
+Admin changelists for the tables that grow without bound (orders, reviews,
+diagnoses).
+
+Stock changelists cost a full scan or two on every page load: COUNT(*) of the
+filtered and of the whole table, SELECT DISTINCT for each AllValues filter and
+for each date_hierarchy level, and icontains across joins for the search box.
+LargeTableAdmin replaces each of those with index lookups: a cached row
+estimate for the unfiltered count, MIN() seeks that walk an index one distinct
+value at a time (a loose index scan) for filters and date drill-downs, and a
+per-admin `search_filter` built from indexed lookups and the full-text indexes.
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils import formats, timezone
+from django.utils.functional import cached_property
+from django.utils.text import capfirst, smart_split, unescape_string_literal
+from django.utils.translation import gettext as _
+
+
+# ============= COUNTS =============
+
+def table_statistics_count(model, using='default'):
+    """Row count of the model's table from the database statistics, None without any"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once ANALYZE (or PRAGMA optimize) has run; each
+            # row's stat starts with the number of rows in that index
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    # Postgres reports -1 for tables that were never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+def estimated_count(queryset):
+    """Rows in the queryset's table: the statistics estimate or an exact count, cached"""
+    key = f'admin-count:{queryset.db}:{queryset.model._meta.label_lower}'
+    count = cache.get(key)
+    if count is None:
+        count = table_statistics_count(queryset.model, queryset.db)
+        if count is None:
+            count = queryset.count()
+        cache.set(key, count, getattr(settings, 'ADMIN_COUNT_CACHE_TIMEOUT', 300))
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that does not count big unfiltered tables.
+
+    Past settings.ADMIN_EXACT_COUNT_LIMIT rows the count of an unfiltered list
+    is estimated_count(); filtered lists go through indexes and are counted
+    exactly. An estimate from stale statistics can leave the last pages out of
+    reach or empty, which is the price of not scanning the table.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate > getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 100_000):
+                return estimate
+        return super().count
+
+
+# ============= LOOSE INDEX SCANS =============
+
+def distinct_values(queryset, field_name):
+    """Sorted distinct non-null values of an indexed column, with one MIN() seek per value"""
+    values = []
+    while True:
+        rows = queryset.filter(**{f'{field_name}__gt': values[-1]}) if values else queryset
+        value = rows.aggregate(value=Min(field_name))['value']
+        if value is None:
+            return values
+        values.append(value)
+
+
+def _period_start(value, kind):
+    if kind == 'year':
+        value = value.replace(month=1, day=1)
+    elif kind == 'month':
+        value = value.replace(day=1)
+    if isinstance(value, datetime.datetime):
+        value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value
+
+
+def _next_period(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + datetime.timedelta(days=1)
+
+
+def _local(value):
+    return timezone.localtime(value) if isinstance(value, datetime.datetime) and timezone.is_aware(value) else value
+
+
+def period_starts(queryset, field_name, kind, start=None, end=None):
+    """
+    What queryset.dates()/datetimes(field_name, kind) returns for [start, end),
+    found with one MIN() seek per year, month or day rather than by truncating
+    every row. `queryset` must not bound field_name itself: given two lower
+    bounds, SQLite ranges the index on the first and each seek rescans from it.
+    """
+    periods = []
+    rows = queryset.filter(**{f'{field_name}__lt': end}) if end is not None else queryset
+    while True:
+        lower = _next_period(periods[-1], kind) if periods else start
+        first = (rows.filter(**{f'{field_name}__gte': lower}) if lower is not None else rows) \
+            .aggregate(first=Min(field_name))['first']
+        if first is None:
+            return periods
+        periods.append(_period_start(_local(first), kind))
+
+
+class IndexedValuesFilter(admin.AllValuesFieldListFilter):
+    """AllValuesFieldListFilter for an indexed local column, without the SELECT DISTINCT scan"""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        rows = model_admin.get_queryset(request)
+        self.lookup_choices = distinct_values(rows, field.name)
+        if field.null and rows.filter(**{f'{field.name}__isnull': True}).exists():
+            self.lookup_choices.append(None)
+
+
+class DateHierarchyChangeList(ChangeList):
+    """
+    ChangeList that keeps its queryset from before the date_hierarchy bounds
+    (`undated_queryset`) and the bounds themselves, for date_hierarchy().
+    """
+
+    def get_filters(self, request):
+        filter_specs, has_filters, lookup_params, may_have_duplicates, has_active_filters = \
+            super().get_filters(request)
+        self.date_bounds = (None, None)
+        if self.date_hierarchy and f'{self.date_hierarchy}__year' in self.params:
+            self.date_bounds = (lookup_params.pop(f'{self.date_hierarchy}__gte')[-1],
+                                lookup_params.pop(f'{self.date_hierarchy}__lt')[-1])
+        return filter_specs, has_filters, lookup_params, may_have_duplicates, has_active_filters
+
+    def get_queryset(self, request, exclude_parameters=None):
+        self.undated_queryset = super().get_queryset(request, exclude_parameters)
+        start, end = self.date_bounds
+        if start is None:
+            return self.undated_queryset
+        return self.undated_queryset.filter(**{f'{self.date_hierarchy}__gte': start,
+                                               f'{self.date_hierarchy}__lt': end})
+
+
+def date_hierarchy(cl):
+    """
+    Context for admin/date_hierarchy.html, as Django's date_hierarchy tag builds
+    it, with the date range and the periods read by index seeks.
+    """
+    if not cl.date_hierarchy:
+        return None
+    field_name = cl.date_hierarchy
+    queryset, (start, end) = cl.undated_queryset, cl.date_bounds
+    year_field, month_field, day_field = (f'{field_name}__{part}' for part in ('year', 'month', 'day'))
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if not (year_lookup or month_lookup or day_lookup):
+        # Separate MIN() and MAX() queries: SQLite only seeks the index for a lone one
+        first = queryset.aggregate(first=Min(field_name))['first']
+        last = queryset.aggregate(last=Max(field_name))['last']
+        if first and last:
+            first, last = _local(first), _local(last)
+            if first.year == last.year:
+                year_lookup = first.year
+                if first.month == last.month:
+                    month_lookup = first.month
+
+    if year_lookup and month_lookup and day_lookup:
+        day = datetime.date(int(year_lookup), int(month_lookup), int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup, month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+    if year_lookup and month_lookup:
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year_lookup}), 'title': str(year_lookup)},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day.day}),
+                    'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT')),
+                }
+                for day in period_starts(queryset, field_name, 'day', start, end)
+            ],
+        }
+    if year_lookup:
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month.month}),
+                    'title': capfirst(formats.date_format(month, 'YEAR_MONTH_FORMAT')),
+                }
+                for month in period_starts(queryset, field_name, 'month', start, end)
+            ],
+        }
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({year_field: str(year.year)}), 'title': str(year.year)}
+            for year in period_starts(queryset, field_name, 'year', start, end)
+        ],
+    }
+
+
+# ============= ADMIN =============
+
+def users_matching(term):
+    """Ids of the users whose username or email contains `term`, to filter big tables by"""
+    return User.objects.filter(Q(username__icontains=term) | Q(email__icontains=term)).values('pk')
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin for tables too big to scan on every changelist load.
+
+    Subclasses set `date_hierarchy` to an indexed date column (rendered by the
+    indexed_date_hierarchy tag in admin/botanical/large_table_change_list.html),
+    use IndexedValuesFilter for value filters, and implement search_filter().
+    """
+    change_list_template = 'admin/botanical/large_table_change_list.html'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return DateHierarchyChangeList
+
+    def search_filter(self, term):
+        """Q matching one search term, built from indexed lookups only"""
+        raise NotImplementedError
+
+    def get_search_results(self, request, queryset, search_term):
+        # Same term splitting as ModelAdmin.get_search_results: every term must match
+        for term in smart_split(search_term):
+            if term.startswith(('"', "'")) and term[0] == term[-1]:
+                term = unescape_string_literal(term)
+            queryset = queryset.filter(self.search_filter(term))
+        # Subqueries, not joins, so no row can come back twice
+        return queryset, False
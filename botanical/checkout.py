@@ -0,0 +1,130 @@
+"""
+Session cart and checkout.
+
+The cart is a {product id: quantity} dict in the user's session. Checkout
+turns it into an Order in one transaction: the products are locked in id
+order (SELECT ... FOR UPDATE where the database supports it), each line's
+stock is taken with a conditional UPDATE that only succeeds while enough is
+left, then the order and all of its items are inserted. Any line that
+cannot be filled rolls the whole order back, so stock never goes negative
+and no partial order is left behind.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderItem, Product
+
+
+CART_SESSION_KEY = 'cart'
+MAX_LINE_QUANTITY = 99
+
+
+class CheckoutError(ValueError):
+    pass
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, product_ids):
+        super().__init__(f'Not enough stock for products {sorted(product_ids)}')
+        self.product_ids = sorted(product_ids)
+
+
+# ============= CART =============
+
+def get_cart(session):
+    """{product id: quantity} held in the session"""
+    return {int(pk): quantity for pk, quantity in session.get(CART_SESSION_KEY, {}).items()}
+
+
+def _save_cart(session, cart):
+    # Session data is JSON, whose object keys are strings
+    session[CART_SESSION_KEY] = {str(pk): quantity for pk, quantity in cart.items()}
+
+
+def add_to_cart(session, product_id, quantity=1):
+    """Add `quantity` of a product; returns the quantity now in the cart"""
+    cart = get_cart(session)
+    cart[product_id] = min(cart.get(product_id, 0) + quantity, MAX_LINE_QUANTITY)
+    _save_cart(session, cart)
+    return cart[product_id]
+
+
+def set_cart_quantity(session, product_id, quantity):
+    """Set a line's quantity; 0 removes it"""
+    cart = get_cart(session)
+    if quantity > 0:
+        cart[product_id] = min(quantity, MAX_LINE_QUANTITY)
+    else:
+        cart.pop(product_id, None)
+    _save_cart(session, cart)
+
+
+def clear_cart(session):
+    session.pop(CART_SESSION_KEY, None)
+
+
+def cart_summary(cart, discount_percentage=0):
+    """Lines with current prices, and the totals an order placed now would have"""
+    products = Product.objects.filter(pk__in=cart, is_active=True).only('pk', 'name', 'price', 'stock_quantity')
+    lines = []
+    for product in products.order_by('pk'):
+        quantity = cart[product.pk]
+        lines.append({
+            'productId': product.pk,
+            'name': product.name,
+            'price': product.price,
+            'quantity': quantity,
+            'subtotal': product.price * quantity,
+            'inStock': product.stock_quantity >= quantity,
+        })
+    total, discount = order_totals([line['subtotal'] for line in lines], discount_percentage)
+    return {'lines': lines, 'total': total, 'discount': discount, 'finalTotal': total - discount}
+
+
+# ============= CHECKOUT =============
+
+def order_totals(subtotals, discount_percentage):
+    """(total, discount) for line subtotals and a membership discount percentage"""
+    total = sum(subtotals, Decimal('0.00'))
+    return total, Order.membership_discount(total, discount_percentage)
+
+
+def place_order(user, cart, shipping):
+    """
+    Create an order for `cart` ({product id: quantity}) and take its stock.
+
+    `shipping` holds shipping_address, shipping_city, shipping_state and
+    shipping_zip. The user's membership discount is applied. Raises
+    OutOfStock (naming every short product) or CheckoutError; in either case
+    nothing is written.
+    """
+    cart = {pk: quantity for pk, quantity in cart.items() if quantity > 0}
+    if not cart:
+        raise CheckoutError('The cart is empty')
+    discount_percentage = user.profile.discount_percentage
+    with transaction.atomic():
+        # Locking in id order keeps two checkouts from deadlocking on each other
+        products = list(
+            Product.objects.select_for_update().filter(pk__in=cart, is_active=True).order_by('pk')
+        )
+        short = set(cart) - {product.pk for product in products}
+        now = timezone.now()
+        for product in products:
+            taken = Product.objects.filter(pk=product.pk, stock_quantity__gte=cart[product.pk]).update(
+                stock_quantity=F('stock_quantity') - cart[product.pk], updated_at=now
+            )
+            if not taken:
+                short.add(product.pk)
+        if short:
+            raise OutOfStock(short)
+
+        order = Order(user=user, **shipping)
+        OrderItem.objects.bulk_create_items(
+            [OrderItem(order=order, product=product, quantity=cart[product.pk], price=product.price)
+             for product in products],
+            discount_percentage=discount_percentage,
+        )
+    return order
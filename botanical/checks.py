@@ -0,0 +1,25 @@
+"""System checks for deployment settings the app depends on."""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The catalog version and the rate limits only hold across workers in a shared cache"""
+    aliases = {'default', getattr(settings, 'RATE_LIMIT_CACHE', 'default')}
+    return [
+        Warning(
+            f"The '{alias}' cache is per process ({settings.CACHES[alias]['BACKEND']}).",
+            hint='Catalog versions and rate-limit buckets are not shared between worker processes; '
+                 'set REDIS_URL or point CACHES at another shared backend.',
+            id='botanical.W001',
+        )
+        for alias in sorted(aliases)
+        if alias in settings.CACHES and settings.CACHES[alias]['BACKEND'] in PER_PROCESS_CACHES
+    ]
@@ -0,0 +1,275 @@
+"""
+Plant Doctor diagnosis: image storage, deduplication and the result cache.
+
+Uploads are stored content-addressed under `diagnoses/<sha256[:2]>/<sha256>`,
+so a photo submitted again reuses the stored file. Model answers are cached
+in DiagnosisResult by content hash; re-encoded or resized copies of a photo
+are matched by a 64-bit difference hash (dHash) within a few bits. The cache
+keeps the most recently used settings.DIAGNOSIS_CACHE_MAX_ENTRIES answers.
+
+Photos the cache cannot answer become DiagnosisJob rows. run_diagnosis_worker
+claims queued jobs oldest first, calls the configured model backend on a
+bounded pool of threads and records the result; clients poll the job.
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .diagnosis_backends import get_diagnosis_backend
+from .models import DiagnosisJob, DiagnosisResult, PlantDiagnosis
+from .uploads import InvalidImage
+
+
+PHASH_BANDS = 4
+# Near-duplicate lookups match on a whole 16-bit band, which only finds every
+# hash within PHASH_BANDS - 1 bits
+MAX_NEAR_DUPLICATE_DISTANCE = PHASH_BANDS - 1
+
+
+def content_hash(upload):
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(upload):
+    """
+    64-bit difference hash of an image as 16 hex digits.
+
+    The image is shrunk to 9x8 grayscale and each bit records whether a pixel
+    is brighter than its right-hand neighbour, so recompression and resizing
+    flip only a few bits.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            image.draft('L', (64, 64))
+            small = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(small.getdata())
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImage(str(e))
+    finally:
+        upload.seek(0)
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def phash_bands(phash):
+    value = int(phash, 16)
+    return [(value >> (16 * (PHASH_BANDS - 1 - i))) & 0xFFFF for i in range(PHASH_BANDS)]
+
+
+def hamming_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def store_image(upload, digest):
+    """Save an upload under its content hash unless that file already exists; return its name"""
+    ext = os.path.splitext(upload.name)[1].lower()[:10]
+    name = f'diagnoses/{digest[:2]}/{digest}{ext}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, upload)
+    return name
+
+
+def find_result(digest, phash):
+    """Cached result for an exact copy, else for the nearest near-duplicate"""
+    result = DiagnosisResult.objects.filter(content_hash=digest).first()
+    distance = min(getattr(settings, 'DIAGNOSIS_NEAR_DUPLICATE_DISTANCE', 2), MAX_NEAR_DUPLICATE_DISTANCE)
+    if result is None and phash and distance > 0:
+        same_band = Q()
+        for i, band in enumerate(phash_bands(phash)):
+            same_band |= Q(**{f'phash_band_{i}': band})
+        candidates = [
+            (hamming_distance(phash, candidate.perceptual_hash), candidate)
+            for candidate in DiagnosisResult.objects.filter(same_band)
+        ]
+        candidates = [(d, c) for d, c in candidates if d <= distance]
+        if candidates:
+            result = min(candidates, key=lambda item: (item[0], -item[1].hits))[1]
+    if result is not None:
+        DiagnosisResult.objects.filter(pk=result.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return result
+
+
+def remember_result(digest, phash, answer):
+    """Cache a model answer, evicting the least recently used entries over the limit"""
+    bands = dict(zip([f'phash_band_{i}' for i in range(PHASH_BANDS)], phash_bands(phash))) if phash else {}
+    try:
+        with transaction.atomic():
+            result = DiagnosisResult.objects.create(
+                content_hash=digest, perceptual_hash=phash,
+                diagnosis=answer['diagnosis'], recommendations=answer['recommendations'], **bands
+            )
+    except IntegrityError:
+        # Another request diagnosed the same photo meanwhile
+        return DiagnosisResult.objects.get(content_hash=digest)
+    limit = getattr(settings, 'DIAGNOSIS_CACHE_MAX_ENTRIES', 10000)
+    evicted = DiagnosisResult.objects.order_by('-last_used_at', '-pk').values_list('pk', flat=True)[limit:]
+    DiagnosisResult.objects.filter(pk__in=list(evicted)).delete()
+    return result
+
+
+def run_model(image_file):
+    """Ask the configured diagnosis backend about an image"""
+    return get_diagnosis_backend().diagnose(image_file)
+
+
+def _finish(job, result, cached):
+    job.diagnosis = PlantDiagnosis.objects.create(
+        user=job.user,
+        image=job.image.name,
+        diagnosis=result.diagnosis,
+        recommendations=result.recommendations,
+    )
+    job.status = 'Done'
+    job.cached = cached
+    job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['diagnosis', 'status', 'cached', 'error', 'finished_at'])
+    return job
+
+
+def enqueue_diagnosis(upload, user=None):
+    """
+    Store an uploaded photo and queue it for diagnosis.
+
+    Photos the result cache can answer come back as an already finished job.
+    Raises InvalidImage for unreadable files.
+    """
+    phash = perceptual_hash(upload)
+    digest = content_hash(upload)
+    job = DiagnosisJob.objects.create(
+        user=user,
+        image=store_image(upload, digest),
+        content_hash=digest,
+        perceptual_hash=phash,
+    )
+    result = find_result(digest, phash)
+    if result is not None:
+        _finish(job, result, cached=True)
+    return job
+
+
+def queue_is_full():
+    """True once settings.DIAGNOSIS_MAX_QUEUED_JOBS jobs are waiting for a worker"""
+    limit = getattr(settings, 'DIAGNOSIS_MAX_QUEUED_JOBS', None)
+    # Stops reading at the limit instead of counting the whole queue
+    return limit is not None and DiagnosisJob.objects.filter(status='Queued')[limit - 1:].exists()
+
+
+def claim_job(worker):
+    """Mark the oldest queued job as running for `worker` and return it (None if the queue is empty)"""
+    while True:
+        job_id = DiagnosisJob.objects.filter(status='Queued').order_by('created_at') \
+            .values_list('pk', flat=True).first()
+        if job_id is None:
+            return None
+        # Only one worker's conditional update can win the job
+        claimed = DiagnosisJob.objects.filter(pk=job_id, status='Queued').update(
+            status='Running', worker=worker, started_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            return DiagnosisJob.objects.select_related('user').get(pk=job_id)
+
+
+def run_job(job):
+    """Diagnose a claimed job; failures are retried up to DIAGNOSIS_JOB_MAX_ATTEMPTS times"""
+    try:
+        # An earlier job may have answered the same photo since this one was queued
+        result = find_result(job.content_hash, job.perceptual_hash)
+        cached = result is not None
+        if result is None:
+            with job.image.open('rb') as image_file:
+                answer = run_model(image_file)
+            result = remember_result(job.content_hash, job.perceptual_hash, answer)
+        return _finish(job, result, cached)
+    except Exception as e:
+        max_attempts = getattr(settings, 'DIAGNOSIS_JOB_MAX_ATTEMPTS', 3)
+        job.status = 'Failed' if job.attempts >= max_attempts else 'Queued'
+        job.error = f'{type(e).__name__}: {e}'
+        job.finished_at = timezone.now() if job.status == 'Failed' else None
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+
+def requeue_stale_jobs():
+    """Put jobs left running longer than DIAGNOSIS_JOB_TIMEOUT (a dead worker) back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'DIAGNOSIS_JOB_TIMEOUT', 300))
+    max_attempts = getattr(settings, 'DIAGNOSIS_JOB_MAX_ATTEMPTS', 3)
+    stale = DiagnosisJob.objects.filter(status='Running', started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='Failed', error='Timed out', finished_at=timezone.now()
+    )
+    return failed + stale.update(status='Queued')
+
+
+def run_worker(concurrency=4, poll_interval=0.5, burst=False, stop=None, name=None):
+    """
+    Process queued jobs on `concurrency` threads until `stop` is set, or, with
+    `burst`, until the queue is empty. A concurrency of 1 runs in the calling
+    thread. Returns the number of jobs processed.
+    """
+    stop = stop or threading.Event()
+    name = name or f'{socket.gethostname()}:{os.getpid()}'
+    processed = [0]
+    lock = threading.Lock()
+
+    def loop(index):
+        try:
+            while not stop.is_set():
+                job = claim_job(f'{name}/{index}')
+                if job is None:
+                    if burst:
+                        return
+                    stop.wait(poll_interval)
+                    continue
+                run_job(job)
+                with lock:
+                    processed[0] += 1
+        finally:
+            if concurrency > 1:
+                connection.close()  # the thread's own connection
+
+    requeue_stale_jobs()
+    if concurrency > 1:
+        threads = [threading.Thread(target=loop, args=(i,), name=f'diagnosis-worker-{i}') for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # Let running jobs finish, then stop
+            stop.set()
+            for thread in threads:
+                thread.join()
+    else:
+        loop(0)
+    return processed[0]
+
+
+def wait_for_job(job_id, timeout, interval=0.25):
+    """Re-read a job until it has finished or `timeout` seconds have passed"""
+    deadline = time.monotonic() + timeout
+    job = DiagnosisJob.objects.select_related('diagnosis').get(pk=job_id)
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(interval)
+        job = DiagnosisJob.objects.select_related('diagnosis').get(pk=job_id)
+    return job
@@ -0,0 +1,296 @@
+"""
+Pluggable Plant Doctor model backends.
+
+settings.DIAGNOSIS_BACKEND names the backend class; one instance is created
+per process. PlaceholderBackend returns the canned answer used until a model
+is configured; StubBackend returns it after a configurable delay, so the job
+queue can be load-tested without calling a real model. GeminiBackend calls
+Gemini through one long-lived client per process, with a concurrency cap,
+retries, a circuit breaker and latency/error metrics; point
+GEMINI_API_ENDPOINT at `manage.py gemini_standin` to exercise it offline.
+"""
+import collections
+import json
+import mimetypes
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+PLACEHOLDER_ANSWER = {
+    'diagnosis': 'Your plant appears to be healthy with some minor issues.',
+    'recommendations': 'Ensure adequate watering and sunlight. Consider using organic fertilizer.',
+}
+
+
+class DiagnosisUnavailable(RuntimeError):
+    """The model could not be asked (circuit open, no free slot)"""
+
+
+class DiagnosisBackend:
+    """Interface: turn an image file into {'diagnosis': ..., 'recommendations': ...}"""
+
+    def diagnose(self, image_file):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'backend': type(self).__name__}
+
+
+class PlaceholderBackend(DiagnosisBackend):
+    def diagnose(self, image_file):
+        return dict(PLACEHOLDER_ANSWER)
+
+
+class StubBackend(DiagnosisBackend):
+    """
+    Placeholder answer after DIAGNOSIS_STUB_LATENCY seconds, give or take
+    DIAGNOSIS_STUB_JITTER, failing a DIAGNOSIS_STUB_ERROR_RATE share of calls.
+    """
+
+    def __init__(self, latency=None, jitter=None, error_rate=None):
+        self.latency = latency if latency is not None else getattr(settings, 'DIAGNOSIS_STUB_LATENCY', 2.0)
+        self.jitter = jitter if jitter is not None else getattr(settings, 'DIAGNOSIS_STUB_JITTER', 0.5)
+        self.error_rate = error_rate if error_rate is not None else getattr(settings, 'DIAGNOSIS_STUB_ERROR_RATE', 0)
+
+    def diagnose(self, image_file):
+        time.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+        if random.random() < self.error_rate:
+            raise RuntimeError('Stub diagnosis failure')
+        return dict(PLACEHOLDER_ANSWER)
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing service for a while.
+
+    After `threshold` consecutive failures the circuit opens and calls are
+    refused for `reset_timeout` seconds; then one trial call is let through
+    (half-open), and its outcome closes or re-opens the circuit.
+
+    allow() returns a falsy value to refuse a call and otherwise a ticket,
+    unique to the trial call, that release() takes back.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None  # the ticket of the half-open trial call in flight
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._trial or self.clock() - self._opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or self.clock() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = object()
+            return self._trial
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = self.clock()
+            self._trial = None
+
+    def release(self, ticket):
+        """
+        End a call that never reached the service. If it was the trial, the next
+        call is; a call let through before the circuit opened changes nothing.
+        """
+        with self._lock:
+            if ticket is self._trial:
+                self._trial = None
+
+
+class BackendMetrics:
+    """Thread-safe call counters and a window of recent latencies"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.latencies = collections.deque(maxlen=window)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            counts = dict(self.counts)
+        data = {'counts': counts}
+        if latencies:
+            data['latencyMs'] = {
+                'p50': round(statistics.median(latencies) * 1000, 1),
+                'p95': round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 1),
+                'max': round(latencies[-1] * 1000, 1),
+            }
+        return data
+
+
+DIAGNOSIS_PROMPT = (
+    'You are a plant doctor. Look at this photo of a plant and reply with JSON '
+    'holding two strings: "diagnosis" (what is wrong with the plant, or that it '
+    'looks healthy) and "recommendations" (what the owner should do).'
+)
+# HTTP statuses worth another attempt
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiBackend(DiagnosisBackend):
+    """
+    Gemini model calls with bounded concurrency and failure handling.
+
+    The SDK is imported and configured on the first diagnosis, not at
+    process start. Its REST transport keeps one HTTP session, so connections
+    are reused across calls. GEMINI_MAX_CONCURRENCY calls run at once;
+    timeouts, 429s and 5xx answers are retried up to GEMINI_MAX_RETRIES
+    times with full-jitter exponential backoff, and GEMINI_CIRCUIT_THRESHOLD
+    failed diagnoses in a row open the circuit for GEMINI_CIRCUIT_RESET
+    seconds.
+    """
+
+    def __init__(self):
+        self.api_key = getattr(settings, 'GEMINI_API_KEY', '')
+        self.model_name = getattr(settings, 'GEMINI_MODEL', 'gemini-1.5-flash')
+        self.endpoint = getattr(settings, 'GEMINI_API_ENDPOINT', None)
+        self.timeout = getattr(settings, 'GEMINI_TIMEOUT', 30.0)
+        self.max_retries = getattr(settings, 'GEMINI_MAX_RETRIES', 3)
+        self.backoff_base = getattr(settings, 'GEMINI_BACKOFF_BASE', 0.5)
+        self.backoff_max = getattr(settings, 'GEMINI_BACKOFF_MAX', 8.0)
+        self.slots = threading.BoundedSemaphore(getattr(settings, 'GEMINI_MAX_CONCURRENCY', 4))
+        self.breaker = CircuitBreaker(
+            threshold=getattr(settings, 'GEMINI_CIRCUIT_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'GEMINI_CIRCUIT_RESET', 30.0),
+        )
+        self.metrics = BackendMetrics()
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                import google.generativeai as genai
+                client_options = {'api_endpoint': self.endpoint} if self.endpoint else None
+                genai.configure(api_key=self.api_key, transport='rest', client_options=client_options)
+                self._model = genai.GenerativeModel(
+                    self.model_name,
+                    generation_config={'response_mime_type': 'application/json'},
+                )
+            return self._model
+
+    def _retryable(self, error):
+        # api_core errors carry the HTTP status as `code`; network errors are OSErrors
+        return getattr(error, 'code', None) in RETRYABLE_STATUSES or isinstance(error, (OSError, TimeoutError))
+
+    def _parse(self, text):
+        try:
+            data = json.loads(text)
+            return {'diagnosis': str(data['diagnosis']), 'recommendations': str(data['recommendations'])}
+        except (ValueError, TypeError, KeyError):
+            return {'diagnosis': text.strip(), 'recommendations': ''}
+
+    def _call(self, image):
+        if not self.slots.acquire(timeout=self.timeout):
+            self.metrics.incr('slot_timeouts')
+            raise DiagnosisUnavailable('No free Gemini slot')
+        start = time.monotonic()
+        try:
+            response = self._get_model().generate_content(
+                [DIAGNOSIS_PROMPT, image], request_options={'timeout': self.timeout, 'retry': None}
+            )
+            return self._parse(response.text)
+        finally:
+            self.slots.release()
+            self.metrics.observe(time.monotonic() - start)
+
+    def diagnose(self, image_file):
+        ticket = self.breaker.allow()
+        if not ticket:
+            self.metrics.incr('rejected')
+            raise DiagnosisUnavailable('Gemini circuit is open')
+        # Every way out records a success or a failure, or releases a half-open
+        # trial, so that a trial cut short cannot hold the circuit open for good
+        settled = False
+        try:
+            name = getattr(image_file, 'name', '') or ''
+            image = {'mime_type': mimetypes.guess_type(name)[0] or 'image/jpeg', 'data': image_file.read()}
+            self.metrics.incr('calls')
+            for attempt in range(self.max_retries + 1):
+                try:
+                    answer = self._call(image)
+                except DiagnosisUnavailable:
+                    raise
+                except Exception as e:
+                    self.metrics.incr(f'errors.{getattr(e, "code", None) or type(e).__name__}')
+                    if attempt == self.max_retries or not self._retryable(e):
+                        self.metrics.incr('failures')
+                        self.breaker.record_failure()
+                        settled = True
+                        raise
+                    self.metrics.incr('retries')
+                    time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                else:
+                    self.metrics.incr('successes')
+                    self.breaker.record_success()
+                    settled = True
+                    return answer
+        finally:
+            if not settled:
+                self.breaker.release(ticket)
+
+    def stats(self):
+        return {
+            'backend': type(self).__name__,
+            'circuit': self.breaker.state,
+            'sdkLoaded': self._model is not None,
+            **self.metrics.snapshot(),
+        }
+
+
+_backend = None
+
+
+def get_diagnosis_backend():
+    """Return the configured diagnosis backend (one instance per process)"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'DIAGNOSIS_BACKEND', 'botanical.diagnosis_backends.PlaceholderBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_diagnosis_backend(setting, **kwargs):
+    global _backend
+    if setting.startswith(('DIAGNOSIS_', 'GEMINI_')):
+        _backend = None
@@ -0,0 +1,160 @@
+"""
+Streaming CSV and JSON Lines exports, for the admin actions and `export_data`.
+
+An export is a values_list() projection read with iterator(), so rows come
+off a (server-side, where the database has them) cursor one chunk at a time
+and each chunk is encoded and written before the next is fetched: memory
+stays flat however many rows there are. Gzip is applied to the encoded
+stream as it goes.
+"""
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from .models import Newsletter, Order, OrderItem, PlantDiagnosis, Product, Review
+
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/jsonl', 'jsonl'),
+}
+
+
+class Export:
+    """Columns of one export: {column name: values() lookup}, plus its date field"""
+
+    def __init__(self, model, columns, date_field):
+        self.model = model
+        self.columns = columns
+        self.date_field = date_field
+
+    def queryset(self, start=None, end=None):
+        """Every row with `date_field` in [start, end), in date order"""
+        queryset = self.model._default_manager.all()
+        if start is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': end})
+        return queryset.order_by(self.date_field, 'pk')
+
+    def rows(self, queryset, chunk_size=2000):
+        return queryset.values_list(*self.columns.values()).iterator(chunk_size=chunk_size)
+
+
+# name -> Export; the first one for a model is what its admin actions export
+EXPORTS = {
+    'orders': Export(Order, {
+        'order_number': 'order_number', 'username': 'user__username', 'email': 'user__email',
+        'status': 'status', 'total': 'total', 'discount': 'discount', 'final_total': 'final_total',
+        'shipping_address': 'shipping_address', 'shipping_city': 'shipping_city',
+        'shipping_state': 'shipping_state', 'shipping_zip': 'shipping_zip',
+        'tracking_number': 'tracking_number', 'created_at': 'created_at', 'delivered_at': 'delivered_at',
+    }, 'created_at'),
+    'order_items': Export(OrderItem, {
+        'order_number': 'order__order_number', 'order_created_at': 'order__created_at',
+        'order_status': 'order__status', 'shipping_state': 'order__shipping_state',
+        'product_id': 'product_id', 'product': 'product__name', 'category': 'product__category',
+        'quantity': 'quantity', 'price': 'price', 'subtotal': 'subtotal',
+    }, 'order__created_at'),
+    'products': Export(Product, {
+        'id': 'id', 'sku': 'sku', 'name': 'name', 'scientific_name': 'scientific_name', 'category': 'category',
+        'price': 'price', 'stock_quantity': 'stock_quantity', 'is_active': 'is_active', 'featured': 'featured',
+        'rating_sum': 'rating_sum', 'rating_count': 'rating_count', 'created_at': 'created_at',
+    }, 'created_at'),
+    'reviews': Export(Review, {
+        'product_id': 'product_id', 'product': 'product__name', 'username': 'user__username',
+        'rating': 'rating', 'comment': 'comment', 'created_at': 'created_at',
+    }, 'created_at'),
+    'diagnoses': Export(PlantDiagnosis, {
+        'id': 'id', 'username': 'user__username', 'email': 'user__email', 'image': 'image',
+        'diagnosis': 'diagnosis', 'recommendations': 'recommendations', 'created_at': 'created_at',
+    }, 'created_at'),
+    'newsletter': Export(Newsletter, {
+        'email': 'email', 'name': 'name', 'is_active': 'is_active', 'subscribed_at': 'subscribed_at',
+    }, 'subscribed_at'),
+}
+
+
+def export_for(model):
+    return next(export for export in EXPORTS.values() if export.model is model)
+
+
+def csv_chunks(export, rows, chunk_size=2000):
+    """Yield the CSV text: the header, then one string per `chunk_size` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.columns)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            chunk = []
+    writer.writerows(chunk)
+    yield buffer.getvalue()
+
+
+def jsonl_chunks(export, rows, chunk_size=2000):
+    """Yield JSON Lines, one object per row, `chunk_size` lines per string"""
+    encode = DjangoJSONEncoder(separators=(',', ':')).encode
+    columns = list(export.columns)
+    lines = []
+    for row in rows:
+        lines.append(encode(dict(zip(columns, row))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_stream(export, queryset, format, compress=False, chunk_size=2000):
+    """Bytes of `queryset` exported as `format`, gzipped when `compress` is set"""
+    encode = csv_chunks if format == 'csv' else jsonl_chunks
+    chunks = (text.encode() for text in encode(export, export.rows(queryset, chunk_size), chunk_size))
+    return compress_sequence(chunks) if compress else chunks
+
+
+def export_response(request, queryset, format, export=None):
+    """
+    Download of `queryset` as a streamed attachment (the admin actions).
+
+    Clients that accept gzip get it compressed on the fly.
+    """
+    export = export or export_for(queryset.model)
+    name = next(name for name, candidate in EXPORTS.items() if candidate is export)
+    content_type, extension = FORMATS[format]
+    compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = StreamingHttpResponse(export_stream(export, queryset, format, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}-{timezone.now():%Y%m%d-%H%M%S}.{extension}"'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+# ============= ADMIN ACTIONS =============
+
+def export_as_csv(modeladmin, request, queryset):
+    return export_response(request, queryset, 'csv')
+export_as_csv.short_description = 'Export selected as CSV'
+
+
+def export_as_jsonl(modeladmin, request, queryset):
+    return export_response(request, queryset, 'jsonl')
+export_as_jsonl.short_description = 'Export selected as JSON Lines'
+
+
+def export_order_items_as_csv(modeladmin, request, queryset):
+    export = EXPORTS['order_items']
+    items = export.queryset().filter(order__in=queryset.values('pk'))
+    return export_response(request, items, 'csv', export)
+export_order_items_as_csv.short_description = 'Export items of selected orders as CSV'
@@ -0,0 +1,69 @@
+"""
+Faceted counts for the catalog sidebar and /api/products/facets/.
+
+Category counts and price buckets come from one conditional aggregate over the
+filtered products; tag counts are one grouped query over the tag index.
+Results are cached per filter signature and catalog version.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .catalog import get_catalog_version, make_etag
+from .models import Product
+from .tags import tag_counts
+
+
+# (low, high) price ranges; high is exclusive, None means open ended
+PRICE_BUCKETS = [(0, 10), (10, 25), (25, 50), (50, 100), (100, None)]
+FACETS_CACHE_TIMEOUT = 60 * 10
+# Parameters that change the page shown but not the matching set
+NON_FILTER_PARAMS = {'cursor', 'page', 'limit', 'fields'}
+
+
+def _price_label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def catalog_facets(queryset, category='All', tag_limit=30):
+    """
+    Facet counts for a catalog listing.
+
+    `queryset` carries every filter except the category one, so category
+    counts show what choosing another category would give; price and tag
+    counts are for the current category.
+    """
+    in_category = Q() if category == 'All' else Q(category=category)
+    aggregates = {'total': Count('pk')}
+    for i, (value, label) in enumerate(Product.CATEGORY_CHOICES):
+        aggregates[f'category_{i}'] = Count('pk', filter=Q(category=value))
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        bucket = in_category & Q(price__gte=low)
+        if high is not None:
+            bucket &= Q(price__lt=high)
+        aggregates[f'price_{i}'] = Count('pk', filter=bucket)
+    stats = queryset.order_by().aggregate(**aggregates)
+
+    scoped = queryset if category == 'All' else queryset.filter(category=category)
+    return {
+        'total': stats['total'],
+        'categories': [
+            {'value': value, 'label': label, 'count': stats[f'category_{i}']}
+            for i, (value, label) in enumerate(Product.CATEGORY_CHOICES)
+        ],
+        'price': [
+            {'label': _price_label(low, high), 'min': low, 'max': high, 'count': stats[f'price_{i}']}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'tags': [{'tag': tag, 'count': count} for tag, count in tag_counts(scoped, limit=tag_limit)],
+    }
+
+
+def cached_catalog_facets(queryset, category, params):
+    """catalog_facets() cached under the filter parameters and the catalog version"""
+    signature = sorted((key, values) for key, values in params.lists() if key not in NON_FILTER_PARAMS)
+    key = 'catalog:facets:' + make_etag(get_catalog_version(), signature)
+    facets = cache.get(key)
+    if facets is None:
+        facets = catalog_facets(queryset, category)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,76 @@
+"""
+Local stand-in for the Gemini generateContent REST endpoint.
+
+Answers `POST /v1beta/models/<model>:generateContent` with a canned diagnosis
+after a configurable latency, and can fail a share of requests (or the first
+few) with a chosen HTTP status, so GeminiBackend's pooling, retries and
+circuit breaker can be benchmarked without network access.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .diagnosis_backends import PLACEHOLDER_ANSWER
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests += 1
+            fail = server.requests <= server.fail_first or random.random() < server.error_rate
+        time.sleep(max(0.0, random.uniform(server.latency - server.jitter, server.latency + server.jitter)))
+        if not self.path.endswith(':generateContent') and ':generateContent?' not in self.path:
+            self._reply(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+        elif fail:
+            self._reply(server.error_status, {'error': {'code': server.error_status, 'message': 'Stand-in failure'}})
+        else:
+            self._reply(200, {
+                'candidates': [{
+                    'content': {'role': 'model', 'parts': [{'text': json.dumps(PLACEHOLDER_ANSWER)}]},
+                    'finishReason': 'STOP',
+                    'index': 0,
+                }],
+            })
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.5, jitter=0.0, error_rate=0.0,
+                 error_status=503, fail_first=0):
+        super().__init__(address, StandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_first = fail_first
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Serve from a daemon thread; returns self"""
+        threading.Thread(target=self.serve_forever, name='gemini-standin', daemon=True).start()
+        return self
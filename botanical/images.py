@@ -0,0 +1,196 @@
+"""
+Resized WebP/JPEG renditions of uploaded images.
+
+Renditions are content-addressed: they live under
+`derivatives/<sha256[:2]>/<sha256>/<width>.<format>`, so uploading a picture
+that was seen before (under any name, on any model) finds its renditions
+already in storage and only hashes the file. Work runs on a small thread
+pool after the upload commits; when it is done the model's `<field>_hash`
+and `<field>_width` columns are filled in and templates start emitting
+srcset attributes through the `picture` template tag.
+"""
+import hashlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.html import format_html
+from PIL import Image, ImageOps
+
+
+# Image fields that get renditions, by model label
+IMAGE_FIELDS = {
+    'botanical.Product': 'image',
+    'botanical.UserProfile': 'profile_picture',
+    'botanical.PlantDiagnosis': 'image',
+}
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+# format -> (Pillow format, file extension, save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def derivative_name(image_hash, width, fmt):
+    return f'derivatives/{image_hash[:2]}/{image_hash}/{width}.{DERIVATIVE_FORMATS[fmt][1]}'
+
+
+def derivative_widths(image_width):
+    """Rendition widths made for an image `image_width` pixels wide (never upscaled)"""
+    return [width for width in DERIVATIVE_WIDTHS if image_width and width < image_width]
+
+
+def derivative_url(image_hash, width, fmt='jpeg'):
+    return default_storage.url(derivative_name(image_hash, width, fmt))
+
+
+def srcsets(image_hash, image_width):
+    """{format: srcset attribute value}, or {} if the image has no renditions"""
+    widths = derivative_widths(image_width) if image_hash else []
+    return {
+        fmt: ', '.join(f'{derivative_url(image_hash, width, fmt)} {width}w' for width in widths)
+        for fmt in DERIVATIVE_FORMATS
+    } if widths else {}
+
+
+def thumbnail_url(field_file, image_hash, image_width, max_width):
+    """URL of the smallest rendition at least `max_width` wide, else of the original"""
+    for width in derivative_widths(image_width) if image_hash else []:
+        if width >= max_width:
+            return derivative_url(image_hash, width)
+    return field_file.url
+
+
+def picture_html(src, sources=None, alt='', css_class='', sizes='100vw'):
+    """<picture> with WebP and JPEG srcsets, or a plain <img> without renditions"""
+    img = format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', src, alt, css_class)
+    if not sources:
+        return img
+    img = format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy">',
+        src, sources['jpeg'], sizes, alt, css_class,
+    )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        sources['webp'], sizes, img,
+    )
+
+
+def write_derivatives(image, image_hash, storage=default_storage, widths=None):
+    """
+    Save every missing rendition of an upright Pillow image; return how many
+    were written. Pass the `widths` of the original when `image` is a draft
+    decoded at a smaller size.
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    written = 0
+    for width in derivative_widths(image.width) if widths is None else widths:
+        resized = None
+        for fmt, (pil_format, ext, options) in DERIVATIVE_FORMATS.items():
+            name = derivative_name(image_hash, width, fmt)
+            if storage.exists(name):
+                continue
+            if resized is None:
+                height = max(round(image.height * width / image.width), 1)
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            out = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            buffer = io.BytesIO()
+            out.save(buffer, pil_format, **options)
+            storage.save(name, ContentFile(buffer.getvalue()))
+            written += 1
+    return written
+
+
+def process_image(model, pk, field_name):
+    """
+    Hash an uploaded image, write its renditions and record them on the row.
+
+    Returns the number of renditions written (0 when they already existed).
+    """
+    obj = model.objects.filter(pk=pk).first()
+    field_file = getattr(obj, field_name, None)
+    if not field_file:
+        return 0
+    image_hash = content_hash(field_file)
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as image:
+            image_width = image.height if image.getexif().get(0x0112, 1) > 4 else image.width
+            written = 0
+            widths = derivative_widths(image_width)
+            if widths:
+                # Let the JPEG decoder downscale by a power of two while still
+                # covering the largest rendition, whatever the orientation. The
+                # draft can come out exactly that wide, so the widths recorded
+                # below (from image_width) are the ones written.
+                largest = max(widths)
+                image.draft('RGB', (largest, largest))
+                written = write_derivatives(ImageOps.exif_transpose(image), image_hash, widths=widths)
+    finally:
+        field_file.close()
+
+    changes = {f'{field_name}_hash': image_hash, f'{field_name}_width': image_width}
+    if any(field.name == 'updated_at' for field in model._meta.fields):
+        changes['updated_at'] = timezone.now()
+    # Only if the same upload is still in place; a newer one gets its own run
+    updated = model.objects.filter(pk=pk, **{field_name: field_file.name}).update(**changes)
+    if updated and model._meta.label == 'botanical.Product':
+        from .catalog import bump_catalog_version
+        transaction.on_commit(bump_catalog_version)
+    return written
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def _run_in_worker(model, pk, field_name):
+    try:
+        return process_image(model, pk, field_name)
+    finally:
+        connection.close()  # the worker thread's own connection
+
+
+def submit_image(model, pk, field_name):
+    """Process an image on the worker pool; returns a Future"""
+    return _get_executor().submit(_run_in_worker, model, pk, field_name)
+
+
+def schedule_image(model, pk, field_name):
+    """
+    Process an image once the current transaction commits, on the worker pool
+    or inline when settings.IMAGE_DERIVATIVES_ASYNC is False.
+    """
+    if getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        transaction.on_commit(lambda: submit_image(model, pk, field_name))
+    else:
+        transaction.on_commit(lambda: process_image(model, pk, field_name))
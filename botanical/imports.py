@@ -0,0 +1,266 @@
+"""
+Bulk product import from supplier feeds, for `import_products`.
+
+A feed (CSV or JSON Lines, optionally gzipped) is read a batch at a time. Each
+batch is matched against the catalog on its natural key, the SKU or the
+(name, scientific name) pair, with one query; rows whose content hash equals
+that of the stored product are skipped and the rest are written with one
+upsert, or a bulk_create plus a bulk_update, per batch.
+
+Bulk writes send no signals, so the search index, the tag index and the
+catalog version that the Product signals keep up are brought up to date once,
+at the end, for the products that changed.
+"""
+import csv
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Product
+from .search import get_search_backend
+from .tags import reindex_product_tags
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+CATEGORIES = {value.lower(): value for value, label in Product.CATEGORY_CHOICES}
+TRUE = {'1', 'true', 't', 'yes', 'y'}
+FALSE = {'0', 'false', 'f', 'no', 'n', ''}
+
+
+def _text(field_name, required=False):
+    max_length = Product._meta.get_field(field_name).max_length
+
+    def parse(value):
+        value = '' if value is None else str(value).strip()
+        if max_length and len(value) > max_length:
+            raise InvalidRow(f'{field_name} is longer than {max_length} characters')
+        if required and not value:
+            raise InvalidRow(f'{field_name} is empty')
+        # The optional columns are nullable: an empty cell stores NULL, as the admin does
+        return value or (None if Product._meta.get_field(field_name).null else '')
+    return parse
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value).strip())
+        if not price.is_finite():
+            raise ValueError
+        price = price.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise InvalidRow(f'price {value!r} is not a number')
+    if not 0 <= price < 10 ** 8:
+        raise InvalidRow(f'price {value} is out of range')
+    return price
+
+
+def _quantity(value):
+    try:
+        quantity = int(str(value).strip())
+    except ValueError:
+        raise InvalidRow(f'stock_quantity {value!r} is not a whole number')
+    if quantity < 0:
+        raise InvalidRow('stock_quantity is negative')
+    return quantity
+
+
+def _flag(field_name):
+    def parse(value):
+        if isinstance(value, bool):
+            return value
+        value = str(value).strip().lower()
+        if value not in TRUE | FALSE:
+            raise InvalidRow(f'{field_name} {value!r} is not a boolean')
+        return value in TRUE
+    return parse
+
+
+def _category(value):
+    category = CATEGORIES.get(str(value).strip().lower())
+    if category is None:
+        raise InvalidRow(f'unknown category {value!r}')
+    return category
+
+
+def _tags(value):
+    # JSON Lines feeds carry a list; CSV cells a comma-separated string (or a JSON list)
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.lstrip().startswith('[') else value.split(',')
+        except ValueError:
+            raise InvalidRow(f'tags {value!r} are not a JSON list')
+    if not isinstance(value, list):
+        raise InvalidRow('tags must be a list')
+    return [str(tag).strip() for tag in value if str(tag).strip()]
+
+
+# Feed column -> parser returning the Product field value; other columns are ignored
+IMPORT_FIELDS = {
+    'sku': _text('sku'),
+    'name': _text('name', required=True),
+    'scientific_name': _text('scientific_name'),
+    'price': _price,
+    'image_url': _text('image_url'),
+    'description': _text('description'),
+    'category': _category,
+    'tags': _tags,
+    'stock_quantity': _quantity,
+    'is_active': _flag('is_active'),
+    'featured': _flag('featured'),
+}
+REQUIRED_FIELDS = ('name', 'price', 'category')
+
+
+def feed_rows(file, format):
+    """(line number, {column: value}) for every record of an open text feed"""
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row
+
+
+def content_hash(values):
+    """Digest of a {field: value} dict, equal for a feed row and the product it would leave unchanged"""
+    encoded = json.dumps(sorted(values.items()), cls=DjangoJSONEncoder)
+    return hashlib.blake2b(encoded.encode(), digest_size=16).digest()
+
+
+class ProductImporter:
+    """
+    Upserts feed rows into Product, `batch_size` rows at a time.
+
+    `key` is 'sku', matched through the unique sku column with
+    bulk_create(update_conflicts=True), or 'name', the (name, scientific_name)
+    pair, which nothing keeps unique, so new products are bulk_create()d and
+    changed ones bulk_update()d. Columns missing from the feed are left as
+    they are on existing products and get their defaults on new ones.
+    """
+
+    def __init__(self, key='sku', batch_size=1000, max_errors=20):
+        self.key = key
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.counts = dict.fromkeys(['read', 'created', 'updated', 'unchanged', 'invalid'], 0)
+        self.errors = []
+        self.changed_ids = []
+
+    def run(self, rows):
+        """
+        Import (line number, row) pairs, then refresh what the Product signals
+        maintain; also when the import stops part-way, for the batches written.
+        """
+        batch = {}
+        try:
+            for line_number, row in rows:
+                self.counts['read'] += 1
+                try:
+                    values = self.parse(row)
+                except InvalidRow as e:
+                    self.counts['invalid'] += 1
+                    if len(self.errors) < self.max_errors:
+                        self.errors.append(f'line {line_number}: {e}')
+                    continue
+                # A key repeated within a batch: the last row wins
+                batch[self.key_of(values)] = values
+                if len(batch) >= self.batch_size:
+                    self.write(batch)
+                    batch = {}
+            if batch:
+                self.write(batch)
+        finally:
+            self.finish()
+        return self.counts
+
+    def parse(self, row):
+        if not isinstance(row, dict):
+            raise InvalidRow('not a JSON object')
+        values = {field: parse(row[field]) for field, parse in IMPORT_FIELDS.items() if field in row}
+        if self.key == 'sku' and not values.get('sku'):
+            raise InvalidRow('no sku')
+        if 'name' not in values:
+            raise InvalidRow('no name')
+        return values
+
+    def key_of(self, values):
+        if self.key == 'sku':
+            return values['sku']
+        return values['name'], values.get('scientific_name') or None
+
+    def stored(self, keys):
+        """{key: {field: value, 'pk': pk}} of the products the batch keys match"""
+        if self.key == 'sku':
+            products = Product.objects.filter(sku__in=keys)
+        else:
+            products = Product.objects.filter(name__in={name for name, scientific_name in keys})
+        stored = {}
+        # Of several products sharing a name key, the oldest is the one updated
+        for row in products.order_by('-pk').values('pk', *IMPORT_FIELDS):
+            stored[self.key_of(row)] = row
+        return stored
+
+    @transaction.atomic
+    def write(self, batch):
+        stored = self.stored(list(batch))
+        fields = set().union(*batch.values())
+        now = timezone.now()
+        new, changed, changes = [], [], defaultdict(list)
+        for key, values in batch.items():
+            current = stored.get(key)
+            if current is None:
+                missing = [field for field in REQUIRED_FIELDS if field not in values]
+                if missing:
+                    self.counts['invalid'] += 1
+                    if len(self.errors) < self.max_errors:
+                        self.errors.append(f'{values.get("sku") or values["name"]}: '
+                                           f'a new product needs {", ".join(missing)}')
+                    continue
+                new.append(Product(**values))
+            elif content_hash(values) != content_hash({field: current[field] for field in values}):
+                product = Product(**{**current, **values, 'updated_at': now})
+                if self.key == 'sku':
+                    # Matched on sku by the upsert; an explicit pk would conflict on the primary key first
+                    product.pk = None
+                changed.append(product)
+                changes[tuple(field for field in values if values[field] != current[field])].append(product)
+            else:
+                self.counts['unchanged'] += 1
+
+        if self.key == 'sku':
+            # One INSERT ... ON CONFLICT (sku) DO UPDATE for the whole batch
+            Product.objects.bulk_create(new + changed, update_conflicts=True, unique_fields=['sku'],
+                                        update_fields=sorted(fields - {'sku'}) + ['updated_at'])
+        else:
+            Product.objects.bulk_create(new)
+            # bulk_update() builds a CASE per field and row, so only the fields that differ are set
+            for fields_changed, products in changes.items():
+                Product.objects.bulk_update(products, [*fields_changed, 'updated_at'])
+        self.counts['created'] += len(new)
+        self.counts['updated'] += len(changed)
+        self.changed_ids.extend(product.pk for product in new + changed)
+
+    def finish(self):
+        if not self.changed_ids:
+            return
+        backend = get_search_backend()
+        with transaction.atomic():
+            for start in range(0, len(self.changed_ids), self.batch_size):
+                backend.index_products(Product.objects.filter(pk__in=self.changed_ids[start:start + self.batch_size]))
+            reindex_product_tags(self.changed_ids, self.batch_size)
+        transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,182 @@
+import datetime
+import random
+import time
+
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test import RequestFactory
+from botanical.benchmarks import STATES, VOCABULARY, WEIGHTS, insert_rows, measure, scratch_database, seed_products
+from botanical.models import Order, PlantDiagnosis, Product, Review
+from botanical.order_numbers import new_order_number
+from botanical.search import TEXT_INDEXES
+
+
+STATUSES = ['Delivered'] * 14 + ['Shipped'] * 2 + ['Processing', 'Confirmed', 'Cancelled']
+
+# How these three admins were configured before LargeTableAdmin, on Django's defaults
+STOCK = {
+    Order: {'list_filter': ['status', 'created_at', 'shipping_state']},
+    Review: {'list_filter': ['rating', 'created_at', 'product__category']},
+    PlantDiagnosis: {'list_filter': ['created_at']},
+}
+
+
+def stock_admin(model):
+    model_admin = admin.site._registry[model]
+    options = {
+        **STOCK[model], 'date_hierarchy': None, 'paginator': Paginator, 'show_full_result_count': True,
+        'get_search_results': admin.ModelAdmin.get_search_results,
+    }
+    return type(f'Stock{type(model_admin).__name__}', (type(model_admin),), options)(model, admin.site)
+
+
+def words(rng, count):
+    return ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=count))
+
+
+class Command(BaseCommand):
+    help = 'Seed millions of orders, reviews and diagnoses, then time admin changelists against stock Django'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5_000_000)
+        parser.add_argument('--reviews', type=int, default=500_000)
+        parser.add_argument('--diagnoses', type=int, default=200_000)
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--days', type=int, default=730)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--no-stock', action='store_true', help='Skip the (slow) stock Django timings')
+
+    def handle(self, *args, **options):
+        with scratch_database(on_disk=True):
+            sample = self.seed(options)
+            start = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(f'ANALYZE: {time.perf_counter() - start:.1f} s')
+
+            superuser = User.objects.create_superuser('boss', 'boss@example.com', 'testpass123')
+            factory = RequestFactory()
+            day = sample['created']
+            month = {'created_at__year': day.year, 'created_at__month': day.month}
+            scenarios = [
+                (Order, 'first page', {}),
+                (Order, 'page 50', {'p': 50}),
+                (Order, 'status', {'status__exact': 'Shipped'}),
+                (Order, 'state', {'shipping_state': 'KA'}),
+                (Order, 'year', {'created_at__year': day.year}),
+                (Order, 'month', month),
+                (Order, 'day', {**month, 'created_at__day': day.day}),
+                (Order, 'order number', {'q': sample['order_number']}),
+                (Order, 'tracking number', {'q': sample['tracking_number']}),
+                (Order, 'username', {'q': sample['username']}),
+                (Review, 'first page', {}),
+                (Review, 'rating', {'rating': 5}),
+                (Review, 'month', month),
+                (Review, 'comment word', {'q': VOCABULARY[40]}),
+                (Review, 'rare word', {'q': VOCABULARY[-1]}),
+                (PlantDiagnosis, 'first page', {}),
+                (PlantDiagnosis, 'month', month),
+                (PlantDiagnosis, 'text word', {'q': VOCABULARY[60]}),
+            ]
+            self.stdout.write(f"{'changelist':<32}{'rows':>9}{'ms':>9}{'queries':>9}"
+                              f"{'stock ms':>10}{'queries':>9}")
+            for model, label, params in scenarios:
+                variants = [admin.site._registry[model]] + ([] if options['no_stock'] else [stock_admin(model)])
+                line = f'{model.__name__ + " " + label:<32}'
+                for position, model_admin in enumerate(variants):
+                    def load():
+                        request = factory.get(f'/admin/botanical/{model._meta.model_name}/', params)
+                        request.user = superuser
+                        request._messages = CookieStorage(request)
+                        response = model_admin.changelist_view(request)
+                        response.render()
+                        return response
+                    response = load()
+                    queries = self.count_queries(load)
+                    median, _ = measure(load, options['repeat'])
+                    if position == 0:
+                        line += f"{response.context_data['cl'].result_count:>9}"
+                        line += f'{median:>9.1f}{queries:>9}'
+                    else:
+                        line += f'{median:>10.1f}{queries:>9}'
+                self.stdout.write(line)
+
+    def count_queries(self, func):
+        cache.clear()
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(count):
+            func()
+        return len(queries)
+
+    def seed(self, options):
+        rng = random.Random(0)
+        start = time.perf_counter()
+        seed_products(2_000)
+        products = list(Product.objects.values_list('pk', flat=True))
+
+        password = make_password(None)
+        joined = connection.ops.adapt_datetimefield_value(datetime.datetime.now(datetime.timezone.utc))
+        insert_rows(User, ['password', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+                           'is_staff', 'is_active', 'date_joined'],
+                    [(password, False, f'shopper{i}', '', '', f'shopper{i}@example.com', False, True, joined)
+                     for i in range(options['users'])])
+        users = list(User.objects.values_list('pk', flat=True))
+
+        # Orders arrive in time order, as they would in production
+        now = datetime.datetime.now(datetime.timezone.utc)
+        first = now - datetime.timedelta(days=options['days'])
+        step = (now - first) / options['orders']
+        columns = ['user_id', 'order_number', 'status', 'total', 'discount', 'final_total', 'shipping_address',
+                   'shipping_city', 'shipping_state', 'shipping_zip', 'tracking_number', 'created_at', 'updated_at']
+        adapt = connection.ops.adapt_datetimefield_value
+        for batch_start in range(0, options['orders'], 10_000):
+            rows = []
+            for i in range(batch_start, min(batch_start + 10_000, options['orders'])):
+                created = first + step * i
+                status = rng.choice(STATUSES)
+                tracking = f'TRK{i:010d}' if status in ('Shipped', 'Delivered') else None
+                rows.append((rng.choice(users), new_order_number(), status, '25.00', '0.00', '25.00', '1 Fern Way',
+                             'Leafton', rng.choice(STATES), '12345', tracking, adapt(created), adapt(created)))
+            with transaction.atomic():
+                insert_rows(Order, columns, rows)
+        middle = Order.objects.filter(tracking_number__isnull=False, created_at__gte=first + (now - first) / 2) \
+            .select_related('user').order_by('created_at').first()
+        sample = {'order_number': middle.order_number, 'tracking_number': middle.tracking_number,
+                  'username': middle.user.username, 'created': middle.created_at}
+
+        # One review per (user, product) pair
+        for batch_start in range(0, options['reviews'], 10_000):
+            rows = []
+            for i in range(batch_start, min(batch_start + 10_000, options['reviews'])):
+                created = adapt(first + (now - first) * i / options['reviews'])
+                rows.append((products[i // len(users) % len(products)], users[i % len(users)], rng.randint(1, 5),
+                             words(rng, 12), created, created))
+            with transaction.atomic():
+                insert_rows(Review, ['product_id', 'user_id', 'rating', 'comment', 'created_at', 'updated_at'], rows)
+
+        for batch_start in range(0, options['diagnoses'], 10_000):
+            rows = []
+            for i in range(batch_start, min(batch_start + 10_000, options['diagnoses'])):
+                created = adapt(first + (now - first) * i / options['diagnoses'])
+                user = rng.choice(users) if rng.random() < 0.9 else None
+                rows.append((user, f'diagnoses/{i}.jpg', '', words(rng, 20), words(rng, 30), created))
+            with transaction.atomic():
+                insert_rows(PlantDiagnosis, ['user_id', 'image', 'image_hash', 'diagnosis', 'recommendations',
+                                             'created_at'], rows)
+
+        with transaction.atomic():
+            for index in TEXT_INDEXES.values():
+                index.rebuild()
+        self.stdout.write(f"seeded {options['orders']} orders, {options['reviews']} reviews and "
+                          f"{options['diagnoses']} diagnoses in {time.perf_counter() - start:.1f} s")
+        return sample
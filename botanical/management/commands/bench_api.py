@@ -0,0 +1,72 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from botanical.benchmarks import scratch_database, seed_products
+from botanical.catalog import parse_fields, stream_products_json
+from botanical.models import Product
+
+
+def build_list(queryset):
+    """The pre-streaming api_products: every row as a dict, then one dumps"""
+    data = [{
+        'id': p.id,
+        'name': p.name,
+        'scientificName': p.scientific_name,
+        'price': float(p.price),
+        'image': p.get_image_url,
+        'description': p.description,
+        'category': p.category,
+        'tags': p.tags,
+        'rating': p.average_rating,
+        'reviews': p.review_count,
+    } for p in queryset]
+    yield JsonResponse(data, safe=False).content
+
+
+def run(chunks):
+    """Consume a response body; return (first byte ms, total ms, bytes)"""
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in chunks:
+        if first_byte is None and len(chunk) > 1:
+            first_byte = time.perf_counter()
+        size += len(chunk)
+    end = time.perf_counter()
+    return ((first_byte or end) - start) * 1000, (end - start) * 1000, size
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory and latency of the api_products response at several catalog sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+
+    def handle(self, *args, **options):
+        variants = [
+            ('list + dumps', lambda qs: build_list(qs)),
+            ('stream', lambda qs: stream_products_json(qs)),
+            ('stream id,name,price', lambda qs: stream_products_json(qs, parse_fields('id,name,price'))),
+        ]
+        with scratch_database():
+            seeded = 0
+            self.stdout.write(
+                f"{'products':>9}  {'variant':<22}{'first byte ms':>14}{'total ms':>10}{'peak MB':>9}{'body MB':>9}"
+            )
+            for size in sorted(options['sizes']):
+                seed_products(size - seeded, seed=seeded)
+                seeded = size
+                for label, variant in variants:
+                    queryset = Product.objects.filter(is_active=True)
+                    first_byte, total, body = run(variant(queryset))
+                    # Second pass under tracemalloc, which skews timings
+                    tracemalloc.start()
+                    run(variant(Product.objects.filter(is_active=True)))
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    self.stdout.write(
+                        f'{size:>9}  {label:<22}{first_byte:>14.0f}{total:>10.0f}'
+                        f'{peak / 2**20:>9.1f}{body / 2**20:>9.1f}'
+                    )
@@ -0,0 +1,81 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from botanical.benchmarks import scratch_database
+from botanical.checkout import OutOfStock, place_order
+from botanical.models import Order, OrderItem, Product
+
+
+SHIPPING = {'shipping_address': '1 Fern Way', 'shipping_city': 'Leafton', 'shipping_state': 'GR',
+            'shipping_zip': '12345'}
+
+
+class Command(BaseCommand):
+    help = 'Stress checkout with threads buying one hot product; check stock never goes negative'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=1000)
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--max-quantity', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'threads':>7}{'orders':>8}{'orders/s':>10}{'sold':>7}{'stock':>7}{'refused':>9}{'errors':>8}")
+        with scratch_database(on_disk=True):
+            users = [User.objects.create_user(username=f'buyer{i}') for i in range(max(options['threads']))]
+            # A second, plentiful product in every order, so each one locks two rows
+            filler = Product.objects.create(name='Pot', price=Decimal('8.00'), description='Pot',
+                                            category='Accessories', stock_quantity=10 ** 9)
+            for threads in options['threads']:
+                OrderItem.objects.all().delete()
+                Order.objects.all().delete()
+                hot = Product.objects.create(name='Hot fern', price=Decimal('12.50'), description='Fern',
+                                             category='Plants', stock_quantity=options['stock'])
+                self.run(threads, users, hot, filler, options)
+
+    def run(self, threads, users, hot, filler, options):
+        refused, errors = [0], []
+        lock = threading.Lock()
+
+        def buy(user, seed):
+            rng = random.Random(seed)
+            try:
+                while True:
+                    quantity = rng.randint(1, options['max_quantity'])
+                    try:
+                        place_order(user, {hot.pk: quantity, filler.pk: 1}, SHIPPING)
+                    except OutOfStock:
+                        with lock:
+                            refused[0] += 1
+                        if quantity == 1:
+                            return  # sold out
+                    except OperationalError as e:
+                        with lock:
+                            errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(users[i], i)) for i in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        hot.refresh_from_db()
+        sold = OrderItem.objects.filter(product=hot).aggregate(total=Sum('quantity'))['total'] or 0
+        orders = Order.objects.count()
+        self.stdout.write(
+            f'{threads:>7}{orders:>8}{orders / elapsed:>10.1f}{sold:>7}{hot.stock_quantity:>7}'
+            f'{refused[0]:>9}{len(errors):>8}'
+        )
+        if hot.stock_quantity < 0 or sold + hot.stock_quantity != options['stock']:
+            raise CommandError(f'Stock mismatch: sold {sold}, left {hot.stock_quantity} of {options["stock"]}')
+        if OrderItem.objects.count() != 2 * orders:
+            raise CommandError('Orders with missing items')
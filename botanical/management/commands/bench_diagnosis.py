@@ -0,0 +1,56 @@
+import io
+import secrets
+import statistics
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from PIL import Image
+from botanical.benchmarks import scratch_database
+from botanical.diagnosis import run_worker
+from botanical.models import DiagnosisJob
+
+
+class Command(BaseCommand):
+    help = 'Measure diagnosis job throughput and queue wait against the stub model backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--latency', type=float, default=0.2, help='Stub model latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.05)
+
+    def handle(self, *args, **options):
+        stub = {
+            'DIAGNOSIS_BACKEND': 'botanical.diagnosis_backends.StubBackend',
+            'DIAGNOSIS_STUB_LATENCY': options['latency'],
+            'DIAGNOSIS_STUB_JITTER': options['jitter'],
+        }
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media, **stub), \
+                scratch_database(on_disk=True):
+            buffer = io.BytesIO()
+            Image.new('RGB', (64, 64), (40, 120, 60)).save(buffer, 'PNG')
+            image = default_storage.save('diagnoses/bench.png', ContentFile(buffer.getvalue()))
+
+            self.stdout.write(f"{'workers':>7}{'jobs/s':>9}{'wait p50 s':>12}{'wait p95 s':>12}{'total s':>9}")
+            for concurrency in options['concurrency']:
+                DiagnosisJob.objects.all().delete()
+                # Distinct content hashes, so no job is answered from the result cache
+                DiagnosisJob.objects.bulk_create([
+                    DiagnosisJob(image=image, content_hash=secrets.token_hex(32))
+                    for _ in range(options['jobs'])
+                ])
+                start = time.perf_counter()
+                run_worker(concurrency=concurrency, burst=True)
+                total = time.perf_counter() - start
+                waits = sorted(
+                    (job.started_at - job.created_at).total_seconds()
+                    for job in DiagnosisJob.objects.filter(status='Done')
+                )
+                self.stdout.write(
+                    f'{concurrency:>7}{len(waits) / total:>9.1f}{statistics.median(waits):>12.2f}'
+                    f'{waits[int(len(waits) * 0.95) - 1]:>12.2f}{total:>9.1f}'
+                )
@@ -0,0 +1,75 @@
+import csv
+import io
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from botanical.benchmarks import peak_rss_mb, reset_peak_rss, scratch_database, seed_orders, seed_products
+from botanical.exports import EXPORTS, export_order_items_as_csv, export_stream
+from botanical.models import Order, OrderItem
+
+
+def naive_items_csv():
+    """The obvious admin action: model instances in, one string out"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORTS['order_items'].columns)
+    for item in OrderItem.objects.select_related('order', 'product').order_by('order__created_at', 'pk'):
+        writer.writerow([item.order.order_number, item.order.created_at, item.order.status, item.order.shipping_state,
+                         item.product_id, item.product.name, item.product.category, item.quantity, item.price,
+                         item.subtotal])
+    return buffer.getvalue().encode()
+
+
+class Command(BaseCommand):
+    help = 'Seed a year of orders, then time streaming exports of orders and items and report their peak RSS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500_000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--naive', action='store_true',
+                            help='Also build the items CSV in memory from model instances (needs GBs of RAM)')
+
+    def handle(self, *args, **options):
+        with scratch_database(on_disk=True), tempfile.TemporaryDirectory() as directory:
+            seed_products(2_000)
+            user = User.objects.create_user(username='buyer')
+            start = time.perf_counter()
+            items = seed_orders(options['orders'], options['days'], user)
+            self.stdout.write(f"seeded {options['orders']} orders, {items} items in "
+                              f'{time.perf_counter() - start:.1f} s')
+            path = os.path.join(directory, 'export')
+
+            reset_peak_rss()
+            self.stdout.write(f'RSS before exporting: {peak_rss_mb():.0f} MB')
+            self.stdout.write(f"{'export':<28}{'rows':>10}{'MB':>8}{'s':>7}{'rows/s':>10}{'peak RSS MB':>13}")
+            for name, rows in (('orders', options['orders']), ('order_items', items)):
+                export = EXPORTS[name]
+                for format in ('csv', 'jsonl'):
+                    for compress in (False, True):
+                        label = f"{name} {format}{' gzip' if compress else ''}"
+                        self.run(label, rows, path,
+                                 lambda: export_stream(export, export.queryset(), format, compress))
+
+            factory = RequestFactory()
+            request = factory.post('/admin/botanical/order/', HTTP_ACCEPT_ENCODING='gzip')
+            request.user = user
+            self.run('admin action, items gzip', items, path,
+                     lambda: export_order_items_as_csv(None, request, Order.objects.all()).streaming_content)
+            if options['naive']:
+                self.run('naive items csv', items, path, lambda: [naive_items_csv()])
+
+    def run(self, label, rows, path, chunks):
+        reset_peak_rss()
+        start = time.perf_counter()
+        written = 0
+        with open(path, 'wb') as output:
+            for chunk in chunks():
+                output.write(chunk)
+                written += len(chunk)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{label:<28}{rows:>10}{written / 1024 / 1024:>8.1f}{elapsed:>7.1f}'
+                          f'{rows / elapsed:>10.0f}{peak_rss_mb():>13.0f}')
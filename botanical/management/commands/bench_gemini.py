@@ -0,0 +1,56 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from botanical.diagnosis_backends import GeminiBackend
+from botanical.gemini_standin import StandInServer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark GeminiBackend against the local Gemini stand-in at several concurrency caps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--clients', type=int, default=32, help='Threads calling the backend')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--latency', type=float, default=0.1, help='Stand-in seconds per answer')
+        parser.add_argument('--error-rate', type=float, default=0.05)
+
+    def handle(self, *args, **options):
+        server = StandInServer(latency=options['latency'], jitter=options['latency'] / 5,
+                               error_rate=options['error_rate']).start()
+        self.stdout.write(
+            f"{'cap':>4}{'req/s':>8}{'p50 ms':>8}{'p95 ms':>8}{'retries':>9}{'failed':>8}  circuit"
+        )
+        try:
+            for cap in options['concurrency']:
+                with override_settings(GEMINI_API_ENDPOINT=server.endpoint, GEMINI_API_KEY='stand-in',
+                                       GEMINI_MAX_CONCURRENCY=cap, GEMINI_BACKOFF_BASE=0.05,
+                                       GEMINI_TIMEOUT=60):
+                    backend = GeminiBackend()
+                    backend.diagnose(io.BytesIO(b'warm-up'))  # SDK import and first connection
+
+                    def call(i):
+                        try:
+                            backend.diagnose(io.BytesIO(b'image'))
+                        except Exception:
+                            pass
+
+                    backend.metrics.counts.clear()
+                    backend.metrics.latencies.clear()
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+                        list(pool.map(call, range(options['requests'])))
+                    elapsed = time.perf_counter() - start
+                    stats = backend.stats()
+                    counts, latency = stats['counts'], stats.get('latencyMs', {})
+                    self.stdout.write(
+                        f"{cap:>4}{options['requests'] / elapsed:>8.1f}{latency.get('p50', 0):>8.0f}"
+                        f"{latency.get('p95', 0):>8.0f}{counts.get('retries', 0):>9}"
+                        f"{counts.get('failures', 0) + counts.get('rejected', 0):>8}  {stats['circuit']}"
+                    )
+        finally:
+            server.shutdown()
+            server.server_close()
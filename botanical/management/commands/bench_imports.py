@@ -0,0 +1,85 @@
+import csv
+import os
+import random
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from botanical.benchmarks import TAGS, VOCABULARY, WEIGHTS, scratch_database
+from botanical.imports import IMPORT_FIELDS, ProductImporter, feed_rows
+from botanical.models import Product
+
+
+def write_feed(path, count, changed=0.0, seed=0):
+    """A supplier feed of `count` SKUs; `changed` of them with a new price (the same ones for a given seed)"""
+    rng = random.Random(seed)
+    changes = random.Random(seed + 1)
+    categories = [value for value, label in Product.CATEGORY_CHOICES]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(IMPORT_FIELDS))
+        for i in range(count):
+            price = Decimal(rng.randint(100, 10000)) / 100
+            if changes.random() < changed:
+                price += 1
+            writer.writerow([
+                f'SKU{i:07d}', ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=2)).title() + f' {i}',
+                ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=2)), price, '',
+                ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=30)), rng.choice(categories),
+                ','.join(rng.sample(TAGS, rng.randint(0, 4))), rng.randint(0, 200), 1, int(rng.random() < 0.05),
+            ])
+
+
+def row_by_row(path, limit):
+    """What populate_db does: get_or_create() per row, every Product signal included"""
+    with open(path, newline='') as f:
+        for line_number, row in feed_rows(f, 'csv'):
+            if line_number > limit + 1:
+                break
+            values = {field: parse(row[field]) for field, parse in IMPORT_FIELDS.items()}
+            Product.objects.get_or_create(sku=values.pop('sku'), defaults=values)
+
+
+class Command(BaseCommand):
+    help = 'Time import_products on a generated supplier feed: first load, unchanged and partly changed re-imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--row-by-row', type=int, default=5_000,
+                            help='Rows to load one get_or_create() at a time, for comparison')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with tempfile.TemporaryDirectory() as directory:
+            feed, changed_feed = os.path.join(directory, 'feed.csv'), os.path.join(directory, 'changed.csv')
+            write_feed(feed, rows)
+            write_feed(changed_feed, rows, changed=0.1)
+
+            self.stdout.write(f"{'run':<34}{'rows':>9}{'s':>8}{'rows/s':>10}  result")
+            with scratch_database(on_disk=True):
+                start = time.perf_counter()
+                row_by_row(feed, options['row_by_row'])
+                self.report('get_or_create per row', options['row_by_row'], time.perf_counter() - start, '')
+
+            with scratch_database(on_disk=True):
+                for label, path, key in [('first load by sku', feed, 'sku'),
+                                         ('unchanged by sku', feed, 'sku'),
+                                         ('10% changed by sku', changed_feed, 'sku'),
+                                         ('unchanged by name', changed_feed, 'name'),
+                                         ('10% changed by name', feed, 'name')]:
+                    start = time.perf_counter()
+                    with open(path, newline='') as f:
+                        counts = ProductImporter(key).run(feed_rows(f, 'csv'))
+                    result = ', '.join(f'{counts[name]} {name}' for name in ('created', 'updated', 'unchanged'))
+                    self.report(label, rows, time.perf_counter() - start, result)
+
+                # The command itself, for the end-to-end figure including its output
+                out = StringIO()
+                call_command('import_products', feed, stdout=out)
+                self.stdout.write(out.getvalue().strip())
+
+    def report(self, label, rows, elapsed, result):
+        self.stdout.write(f'{label:<34}{rows:>9}{elapsed:>8.1f}{rows / elapsed:>10.0f}  {result}')
@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from botanical.benchmarks import scratch_database, seed_products
+from botanical.models import Order, OrderItem, Product
+
+
+def per_row(user, baskets, discount_percentage):
+    """One Order.save() and one OrderItem.save() per row, totals summed afterwards"""
+    with transaction.atomic():
+        for basket in baskets:
+            total = sum(product.price * quantity for product, quantity in basket)
+            discount = Order.membership_discount(total, discount_percentage)
+            order = Order.objects.create(user=user, total=total, discount=discount, final_total=total - discount)
+            for product, quantity in basket:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+
+
+def bulk(user, baskets, discount_percentage):
+    items = []
+    for basket in baskets:
+        order = Order(user=user)
+        items.extend(OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                     for product, quantity in basket)
+    OrderItem.objects.bulk_create_items(items, discount_percentage=discount_percentage)
+
+
+class Command(BaseCommand):
+    help = 'Compare saving orders and their items row by row with OrderItem.objects.bulk_create_items()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, nargs='+', default=[1, 100, 5000])
+        parser.add_argument('--items', type=int, default=5, help='Most items per order')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'orders':>7}{'items':>7}{'path':>9}{'ms':>10}{'queries':>9}{'items/s':>10}")
+        with scratch_database(on_disk=True):
+            seed_products(500)
+            products = list(Product.objects.all())
+            user = User.objects.create_user(username='buyer')
+            rng = random.Random(0)
+            for count in options['orders']:
+                baskets = [
+                    [(product, rng.randint(1, 4)) for product in rng.sample(products, rng.randint(1, options['items']))]
+                    for _ in range(count)
+                ]
+                for name, func in (('per-row', per_row), ('bulk', bulk)):
+                    OrderItem.objects.all().delete()
+                    Order.objects.all().delete()
+                    queries = []
+                    with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                        start = time.perf_counter()
+                        func(user, baskets, 10)
+                        elapsed = time.perf_counter() - start
+                    items = sum(len(basket) for basket in baskets)
+                    self.stdout.write(f'{count:>7}{items:>7}{name:>9}{elapsed * 1000:>10.1f}'
+                                      f'{len(queries):>9}{items / elapsed:>10.0f}')
+                    self.check_totals(count, items)
+
+    def check_totals(self, orders, items):
+        if Order.objects.count() != orders or OrderItem.objects.count() != items:
+            raise CommandError('Rows missing')
+        # Compared in Python: SQLite does decimal arithmetic in floating point
+        totals = {}
+        for order_id, price, quantity, subtotal in OrderItem.objects.values_list(
+                'order_id', 'price', 'quantity', 'subtotal'):
+            if subtotal != price * quantity:
+                raise CommandError('Wrong item subtotals')
+            totals[order_id] = totals.get(order_id, 0) + subtotal
+        for order in Order.objects.only('total', 'discount', 'final_total'):
+            if order.total != totals[order.pk] or order.final_total != order.total - order.discount:
+                raise CommandError('Order totals do not match their items')
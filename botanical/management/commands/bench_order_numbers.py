@@ -0,0 +1,78 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from botanical.benchmarks import scratch_database
+from botanical.models import Order
+from botanical.order_numbers import RandomGenerator, SnowflakeGenerator, UlidGenerator
+
+
+GENERATORS = {'random': RandomGenerator, 'snowflake': SnowflakeGenerator, 'ulid': UlidGenerator}
+
+
+def order_number_index_stats():
+    """(size in MB, share of page bytes in use) for the order_number index; SQLite only"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA index_list({Order._meta.db_table})')
+        for row in cursor.fetchall():
+            name = row[1]
+            cursor.execute(f'PRAGMA index_info("{name}")')
+            if [info[2] for info in cursor.fetchall()] == ['order_number']:
+                cursor.execute('SELECT SUM(pgsize), SUM(unused) FROM dbstat WHERE name = %s', [name])
+                size, unused = cursor.fetchone()
+                return size / 1024 ** 2, 1 - unused / size
+    raise CommandError('No order_number index found')
+
+
+class Command(BaseCommand):
+    help = 'Insert millions of orders with each order number scheme; report throughput and index size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=3_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--report-every', type=int, default=500_000)
+        parser.add_argument('--schemes', nargs='+', choices=GENERATORS, default=list(GENERATORS))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Index sizes are read from SQLite\'s dbstat table')
+        self.stdout.write(f"{'scheme':>10}{'orders':>10}{'rows/s':>10}{'index MB':>10}{'fill':>7}")
+        for scheme in options['schemes']:
+            random.seed(0)
+            with scratch_database(on_disk=True):
+                self.run(scheme, GENERATORS[scheme](), options)
+
+    def run(self, scheme, generate, options):
+        user = User.objects.create_user(username='buyer')
+        now = timezone.now()
+        values = {
+            'user_id': user.pk, 'status': 'Processing', 'total': '10.00', 'discount': '0.00',
+            'final_total': '10.00', 'shipping_address': '1 Fern Way', 'shipping_city': 'Leafton',
+            'shipping_state': 'GR', 'shipping_zip': '12345', 'tracking_number': None, 'notes': None,
+            'created_at': now, 'updated_at': now,
+        }
+        columns = ['order_number', *values]
+        sql = (f'INSERT INTO {Order._meta.db_table} ({", ".join(columns)}) '
+               f'VALUES ({", ".join(["%s"] * len(columns))})')
+        # Plain executemany, so the ORM's per-row cost does not hide the index's
+        row = [connection.ops.adapt_datetimefield_value(v) if v is now else v for v in values.values()]
+
+        # rows/s is for the inserts since the previous line: it falls as the index outgrows the page cache
+        inserted, window_rows, window_seconds = 0, 0, 0.0
+        while inserted < options['orders']:
+            size = min(options['batch_size'], options['orders'] - inserted)
+            start = time.perf_counter()
+            rows = [[generate(), *row] for _ in range(size)]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+            window_seconds += time.perf_counter() - start
+            window_rows += size
+            inserted += size
+            if window_rows >= options['report_every'] or inserted == options['orders']:
+                index_mb, fill = order_number_index_stats()
+                self.stdout.write(f'{scheme:>10}{inserted:>10}{window_rows / window_seconds:>10.0f}'
+                                  f'{index_mb:>10.1f}{fill:>7.0%}')
+                window_rows, window_seconds = 0, 0.0
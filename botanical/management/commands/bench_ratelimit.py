@@ -0,0 +1,71 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from botanical.ratelimit import RateLimitMiddleware
+
+
+# Overhead the middleware may add to an admitted request with an in-process
+# cache; refused requests skip the view, so they are reported but not held to it
+BUDGET_US = 50
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of RateLimitMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--cache', default='default', help='Cache alias holding the buckets')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        n = options['requests']
+        limits = {
+            'botanical:api_products': {'rate': '1000000/s', 'burst': 10 ** 9},
+            'botanical:api_product_tags': {'rate': '1/h', 'burst': 1},
+        }
+        scenarios = [
+            ('unlimited page', '/', None),
+            ('new client (full bucket)', '/api/products/', lambda i: f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'),
+            ('same client (allowed)', '/api/products/', None),
+            ('refused', '/api/products/tags/', None),
+            ('concurrency slot', '/api/diagnose-plant/', lambda i: f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'),
+        ]
+        settings = {
+            'RATE_LIMIT_ENABLED': True, 'RATE_LIMIT_CACHE': options['cache'], 'RATE_LIMITS': limits,
+            'RATE_LIMIT_DEFAULT': None, 'CONCURRENCY_LIMITS': {'botanical:api_diagnose_plant': 8},
+        }
+        self.stdout.write(f"{'scenario':<28}{'us/request':>11}  (budget {BUDGET_US} us)")
+        over = []
+        with override_settings(**settings):
+            caches[options['cache']].clear()
+            for label, path, address in scenarios:
+                match = resolve(path)
+                requests = []
+                for i in range(n):
+                    request = factory.get(path, REMOTE_ADDR=address(i) if address else '127.0.0.1')
+                    request.user = AnonymousUser()
+                    request.resolver_match = match
+                    requests.append(request)
+
+                def call(request):
+                    return middleware.process_view(request, match.func, (), {}) or middleware(request)
+
+                bare = time.perf_counter()
+                for request in requests:
+                    HttpResponse()
+                bare = time.perf_counter() - bare
+                start = time.perf_counter()
+                for request in requests:
+                    call(request)
+                per_request = ((time.perf_counter() - start) - bare) / n * 1e6
+                self.stdout.write(f'{label:<28}{per_request:>11.1f}')
+                if per_request > BUDGET_US and label != 'refused':
+                    over.append(label)
+        if over:
+            raise CommandError(f'Over the {BUDGET_US} us budget: {", ".join(over)}')
@@ -0,0 +1,77 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay
+from botanical.benchmarks import STATES, measure, scratch_database, seed_orders, seed_products
+from botanical.models import Order, OrderItem, Product
+from botanical.sales import UTC, dashboard, rebuild
+from botanical.signals import roll_up_new_items
+from botanical.models import order_items_created
+
+
+def naive_dashboard(days, now):
+    """What the dashboard would cost aggregating the order tables on every load"""
+    first = now - datetime.timedelta(days=2 * days)
+    items = OrderItem.objects.filter(order__created_at__gte=first).exclude(order__status='Cancelled')
+    list(items.annotate(day=TruncDay('order__created_at')).values('day', 'product__category').annotate(
+        revenue=Sum('subtotal'), units=Sum('quantity')).order_by())
+    list(Order.objects.filter(created_at__gte=first).exclude(status='Cancelled').annotate(
+        day=TruncDay('created_at')).values('day', 'shipping_state').annotate(orders=Count('id')).order_by())
+
+
+class Command(BaseCommand):
+    help = 'Seed a year of orders, then time the rollup rebuild, the dashboard and the per-checkout cost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=250_000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--checkouts', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with scratch_database(on_disk=True):
+            self.seed(options)
+            now = datetime.datetime.now(UTC)
+
+            start = time.perf_counter()
+            written = rebuild((now - datetime.timedelta(days=options['days'])).date(), now.date())
+            self.stdout.write(f'rebuild of {options["days"]} days: {time.perf_counter() - start:.1f} s, '
+                              f'{written} rollup rows')
+
+            self.stdout.write(f"{'dashboard':<24}{'median ms':>10}{'max ms':>10}")
+            for days in (7, 30, 90):
+                for dimension in ('category', 'state'):
+                    median, worst = measure(lambda: dashboard(days, dimension, now), repeat=7)
+                    self.stdout.write(f'{f"rollups {days}d/{dimension}":<24}{median:>10.1f}{worst:>10.1f}')
+                median, worst = measure(lambda: naive_dashboard(days, now), repeat=3)
+                self.stdout.write(f'{f"order tables {days}d":<24}{median:>10.1f}{worst:>10.1f}')
+
+            self.stdout.write(f"{'checkout':<24}{'ms/order':>10}")
+            products = list(Product.objects.all()[:200])
+            user = User.objects.get(username='buyer')
+            for label, connected in (('without rollups', False), ('with rollups', True)):
+                if not connected:
+                    order_items_created.disconnect(roll_up_new_items)
+                try:
+                    rng = random.Random(1)
+                    start = time.perf_counter()
+                    for _ in range(options['checkouts']):
+                        order = Order(user=user, shipping_state=rng.choice(STATES))
+                        OrderItem.objects.bulk_create_items([
+                            OrderItem(order=order, product=product, quantity=rng.randint(1, 3), price=product.price)
+                            for product in rng.sample(products, rng.randint(1, 4))
+                        ], discount_percentage=10)
+                    elapsed = time.perf_counter() - start
+                finally:
+                    order_items_created.connect(roll_up_new_items)
+                self.stdout.write(f'{label:<24}{elapsed / options["checkouts"] * 1000:>10.2f}')
+
+    def seed(self, options):
+        seed_products(500)
+        user = User.objects.create_user(username='buyer')
+        start = time.perf_counter()
+        items = seed_orders(options['orders'], options['days'], user)
+        self.stdout.write(f'seeded {options["orders"]} orders, {items} items in {time.perf_counter() - start:.1f} s')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from botanical.benchmarks import measure, scratch_database, seed_products
+from botanical.models import Product
+from botanical.search import IcontainsSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Compare the full-text search backend with the icontains scan on a scratch catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('queries', nargs='*', default=['monstera', 'orchid', 'basil tomato', 'zutaden', 'nothingmatches'])
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write(f"Seeding {options['products']} products...")
+            seed_products(options['products'])
+            backend = get_search_backend()
+            backend.rebuild()
+
+            backends = [('icontains', IcontainsSearchBackend()), (type(backend).__name__, backend)]
+            self.stdout.write(f"{'query':<18}{'backend':<22}{'matches':>9}{'median ms':>12}{'max ms':>10}")
+            for query in options['queries']:
+                for label, candidate in backends:
+                    def first_page():
+                        # What home() does: one page of 12 plus the paginator count
+                        results = candidate.search(Product.objects.filter(is_active=True), query)
+                        list(results[:12])
+                        return results.count()
+                    matches = first_page()
+                    median, worst = measure(first_page, options['repeat'])
+                    self.stdout.write(f'{query:<18}{label:<22}{matches:>9}{median:>12.1f}{worst:>10.1f}')
@@ -0,0 +1,163 @@
+import io
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.client import ClientHandler
+from PIL import Image
+from botanical.benchmarks import peak_rss_mb, reset_peak_rss, scratch_database
+from botanical.diagnosis import run_worker
+from botanical.gemini_standin import StandInServer
+from botanical.models import DiagnosisJob, DiagnosisResult, UserProfile
+
+
+# Settings as they were before uploads were limited and normalised
+UNLIMITED = {
+    'UPLOAD_NORMALIZE_IMAGES': False,
+    'FILE_UPLOAD_HANDLERS': [
+        'django.core.files.uploadhandler.MemoryFileUploadHandler',
+        'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+    ],
+}
+BOUNDARY = 'BenchUploadBoundary'
+
+
+def phone_photo(width, height, quality):
+    """A noisy JPEG with EXIF, about as large on disk as a phone camera's"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 60)
+    image = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneCo'
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, exif=exif)
+    return buffer.getvalue()
+
+
+def write_body(directory, index, field, data):
+    """Write a multipart/form-data body to a file, so requests stream it like a real client"""
+    path = os.path.join(directory, f'body-{index}')
+    with open(path, 'wb') as f:
+        f.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="name"\r\n\r\nBench\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="photo.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode()
+        )
+        f.write(data)
+        # Distinct bytes per request, so no upload is answered from the diagnosis cache
+        f.write(index.to_bytes(4, 'big'))
+        f.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+    return path
+
+
+class Command(BaseCommand):
+    help = 'Measure request latency, peak RSS and stored size for large image uploads, with and without limits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=8064)
+        parser.add_argument('--height', type=int, default=6048)
+        parser.add_argument('--quality', type=int, default=95)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent clients for the diagnosis run')
+
+    def handle(self, *args, **options):
+        if not reset_peak_rss():
+            raise CommandError('Peak RSS can only be measured on Linux')
+        data = phone_photo(options['width'], options['height'], options['quality'])
+        self.stdout.write(f"{options['width']}x{options['height']} JPEG, {len(data) / 2**20:.1f} MB\n")
+        self.stdout.write(
+            f"{'settings':<9}{'endpoint':<10}{'clients':>8}{'status':>7}{'p50 ms':>9}{'max ms':>9}"
+            f"{'peak RSS +MB':>14}{'stored MB':>11}"
+        )
+        self.handler = ClientHandler(enforce_csrf_checks=False)
+        server = StandInServer(latency=0, jitter=0, error_rate=0).start()
+        gemini = {
+            'DIAGNOSIS_BACKEND': 'botanical.diagnosis_backends.GeminiBackend',
+            'GEMINI_API_ENDPOINT': server.endpoint,
+            'GEMINI_API_KEY': 'stand-in',
+        }
+        with tempfile.TemporaryDirectory() as media, tempfile.TemporaryDirectory() as bodies, \
+                scratch_database(on_disk=True), override_settings(MEDIA_ROOT=media, IMAGE_DERIVATIVES_ASYNC=False,
+                                                                  RATE_LIMIT_ENABLED=False, **gemini):
+            user = User.objects.create_user(username='bench', password='bench')
+            client = Client()
+            client.force_login(user)
+            self.cookie = client.cookies.output(header='', sep=';').strip()
+            repeat, clients = options['repeat'], options['clients']
+            runs = [
+                ('before', UNLIMITED, 'diagnose', 1, repeat),
+                ('before', UNLIMITED, 'diagnose', clients, repeat * clients),
+                ('before', UNLIMITED, 'account', 1, repeat),
+                ('after', {}, 'diagnose', 1, repeat),
+                ('after', {}, 'diagnose', clients, repeat * clients),
+                ('after', {}, 'account', 1, repeat),
+                # An upload over the byte limit is dropped while it streams in
+                ('limit', {'UPLOAD_MAX_BYTES': len(data) // 2}, 'diagnose', 1, repeat),
+            ]
+            for label, overrides, endpoint, clients, requests in runs:
+                field = 'profile_picture' if endpoint == 'account' else 'image'
+                paths = [write_body(bodies, i, field, data) for i in range(requests)]
+                with override_settings(**overrides):
+                    self.run(label, endpoint, clients, paths, user)
+                    if endpoint == 'diagnose' and clients == 1 and label != 'limit':
+                        self.run_model(label)
+                for path in paths:
+                    os.remove(path)
+        server.shutdown()
+        server.server_close()
+
+    def post(self, endpoint, path):
+        with open(path, 'rb') as body:
+            environ = {
+                'REQUEST_METHOD': 'POST',
+                'PATH_INFO': '/account/' if endpoint == 'account' else '/api/diagnose-plant/',
+                'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+                'CONTENT_LENGTH': str(os.path.getsize(path)),
+                'HTTP_COOKIE': self.cookie,
+                'SERVER_NAME': 'testserver',
+                'SERVER_PORT': '80',
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': body,
+            }
+            start = time.perf_counter()
+            response = self.handler(environ)
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+    def run(self, label, endpoint, clients, paths, user):
+        DiagnosisJob.objects.all().delete()
+        DiagnosisResult.objects.all().delete()
+        reset_peak_rss()
+        baseline = peak_rss_mb()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(lambda path: self.post(endpoint, path), paths))
+        peak = peak_rss_mb() - baseline
+        if endpoint == 'account':
+            stored = UserProfile.objects.get(user=user).profile_picture.size
+        else:
+            stored = statistics.mean([job.image.size for job in DiagnosisJob.objects.all()] or [0])
+        timings = sorted(elapsed for elapsed, status in results)
+        statuses = '/'.join(sorted({str(status) for elapsed, status in results}))
+        self.stdout.write(
+            f'{label:<9}{endpoint:<10}{clients:>8}{statuses:>7}{statistics.median(timings):>9.0f}'
+            f'{timings[-1]:>9.0f}{max(peak, 0):>14.0f}{stored / 2**20:>11.2f}'
+        )
+
+    def run_model(self, label):
+        """Send the jobs just queued to GeminiBackend, talking to the in-process stand-in"""
+        jobs = DiagnosisJob.objects.filter(status='Queued')
+        count, stored = jobs.count(), jobs.first().image.size
+        reset_peak_rss()
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        run_worker(concurrency=1, burst=True)
+        elapsed = (time.perf_counter() - start) * 1000 / count
+        peak = peak_rss_mb() - baseline
+        self.stdout.write(
+            f"{label:<9}{'model':<10}{1:>8}{'-':>7}{elapsed:>9.0f}{'-':>9}{max(peak, 0):>14.0f}{stored / 2**20:>11.2f}"
+        )
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from botanical.images import IMAGE_FIELDS, process_image
+
+
+class Command(BaseCommand):
+    help = 'Generate WebP/JPEG renditions for uploaded images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also re-check images that already have renditions')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        def work(job):
+            try:
+                return process_image(*job)
+            finally:
+                connection.close()
+
+        for label, field_name in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            if not options['all']:
+                queryset = queryset.filter(**{f'{field_name}_hash': ''})
+            jobs = [(model, pk, field_name) for pk in queryset.values_list('pk', flat=True)]
+            if options['workers'] > 1:
+                with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                    written = sum(pool.map(work, jobs))
+            else:
+                written = sum(process_image(*job) for job in jobs)
+            self.stdout.write(f'{label}: {len(jobs)} images, {written} renditions written')
+        self.stdout.write(self.style.SUCCESS('Image renditions are up to date.'))
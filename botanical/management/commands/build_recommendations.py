@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from botanical.recommendations import TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the co-occurrence product recommendations (incrementally unless --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rescore every product, not just changed ones')
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours stored per product')
+
+    def handle(self, *args, **options):
+        run = build_recommendations(full=options['full'], k=options['top_k'])
+        kind = 'Full' if run.full else 'Incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind} run rescored {run.products_updated} products in '
+            f'{(run.finished_at - run.started_at).total_seconds():.1f}s.'
+        ))
@@ -0,0 +1,47 @@
+import datetime
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from botanical.exports import EXPORTS, FORMATS, export_stream
+from botanical.sales import day_start
+
+
+class Command(BaseCommand):
+    help = 'Stream a table to CSV or JSON Lines (optionally gzipped), in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output as it is written')
+        parser.add_argument('--output', default='-', help='File to write; stdout by default')
+        parser.add_argument('--start', type=datetime.date.fromisoformat,
+                            help='First day (YYYY-MM-DD, UTC) of rows to export')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Last day, included')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched and encoded at a time')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError('--start is after --end')
+        export = EXPORTS[options['name']]
+        queryset = export.queryset(start and day_start(start),
+                                   end and day_start(end + datetime.timedelta(days=1)))
+        chunks = export_stream(export, queryset, options['format'], options['gzip'], options['chunk_size'])
+
+        began, written = time.perf_counter(), 0
+        to_stdout = options['output'] == '-'
+        output = sys.stdout.buffer if to_stdout else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if to_stdout:
+                output.flush()
+            else:
+                output.close()
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {options['name']} to {options['output']} "
+                f'({written / 1024 / 1024:.1f} MB in {time.perf_counter() - began:.1f} s).'))
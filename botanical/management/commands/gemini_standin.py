@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from botanical.gemini_standin import StandInServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Gemini generateContent API (set GEMINI_API_ENDPOINT to its URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=1.0, help='Seconds per answer')
+        parser.add_argument('--jitter', type=float, default=0.2)
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail')
+        parser.add_argument('--error-status', type=int, default=503)
+
+    def handle(self, *args, **options):
+        server = StandInServer(
+            ('127.0.0.1', options['port']), latency=options['latency'], jitter=options['jitter'],
+            error_rate=options['error_rate'], error_status=options['error_status'],
+        )
+        self.stdout.write(f'Gemini stand-in listening on {server.endpoint} (Ctrl+C to stop)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
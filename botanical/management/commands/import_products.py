@@ -0,0 +1,48 @@
+import gzip
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from botanical.imports import ProductImporter, feed_rows
+
+
+class Command(BaseCommand):
+    help = 'Upsert products from a CSV or JSON Lines feed (optionally gzipped), in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file, or - for stdin; a .gz suffix is decompressed')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Feed format; guessed from the file extension by default')
+        parser.add_argument('--key', choices=['sku', 'name'], default='sku',
+                            help='Match products on their SKU, or on name plus scientific name')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or next(
+            (extension for extension in ('csv', 'jsonl') if path.removesuffix('.gz').endswith(f'.{extension}')), None)
+        if format is None:
+            raise CommandError('Cannot tell the feed format from the file name; pass --format')
+
+        importer = ProductImporter(options['key'], options['batch_size'])
+        start = time.perf_counter()
+        if path == '-':
+            counts = importer.run(feed_rows(sys.stdin, format))
+        else:
+            try:
+                raw = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+            except OSError as e:
+                raise CommandError(e)
+            with raw, io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as file:
+                counts = importer.run(feed_rows(file, format))
+        elapsed = time.perf_counter() - start
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        if counts['invalid'] > len(importer.errors):
+            self.stderr.write(f"... and {counts['invalid'] - len(importer.errors)} more invalid rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['read']} rows in {elapsed:.1f} s ({counts['read'] / max(elapsed, 1e-9):.0f} rows/s): "
+            f"{counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+            f"{counts['invalid']} invalid."))
@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from botanical.models import Order
+from botanical.sales import UTC, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hourly and daily sales rollups of a range of days (UTC) from the orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat,
+                            help='First day (YYYY-MM-DD); defaults to the day of the first order')
+        parser.add_argument('--end', type=datetime.date.fromisoformat,
+                            help='Last day, included; defaults to the day of the latest order')
+
+    def handle(self, *args, **options):
+        span = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if span['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write('No orders to roll up.')
+            return
+        start = options['start'] or span['first'].astimezone(UTC).date()
+        end = options['end'] or span['last'].astimezone(UTC).date()
+        if start > end:
+            raise CommandError('--start is after --end')
+        written = rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups for {start} to {end} ({written} rows).'))
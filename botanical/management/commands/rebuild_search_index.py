@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from botanical.search import TEXT_INDEXES, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the catalog full-text search index, and the admin text indexes, from their tables'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            backend.rebuild()
+            for index in TEXT_INDEXES.values():
+                index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index ({type(backend).__name__}) '
+                                             f'and {len(TEXT_INDEXES)} admin text indexes.'))
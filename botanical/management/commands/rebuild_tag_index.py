@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from botanical.models import ProductTag
+from botanical.tags import rebuild_tag_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ProductTag index from the Product.tags JSON field'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_tag_index()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt tag index ({ProductTag.objects.count()} rows).'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from botanical.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored per-user order counters from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = list(UserProfile.ORDER_COUNTER_FIELDS)
+        counted = ~Q(user__orders__status='Cancelled')
+
+        stats = UserProfile.objects.annotate(
+            count=Count('user__orders', filter=counted),
+            spend=Sum('user__orders__final_total', filter=counted),
+            last=Max('user__orders__created_at'),
+        ).filter(last__isnull=False).values('pk', 'count', 'spend', 'last').order_by()
+
+        with transaction.atomic():
+            UserProfile.objects.update(order_count=0, lifetime_spend=0, last_order_at=None)
+
+            batch = []
+            for row in stats.iterator(chunk_size=batch_size):
+                batch.append(UserProfile(
+                    pk=row['pk'], order_count=row['count'], lifetime_spend=row['spend'] or 0, last_order_at=row['last']
+                ))
+                if len(batch) >= batch_size:
+                    UserProfile.objects.bulk_update(batch, fields)
+                    batch = []
+            if batch:
+                UserProfile.objects.bulk_update(batch, fields)
+
+        customers = UserProfile.objects.filter(order_count__gt=0).count()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed order counters ({customers} customers with orders).'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from botanical.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored product rating aggregates from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        star_fields = [f'rating_{star}_count' for star in range(1, 6)]
+        fields = ['rating_sum', 'rating_count'] + star_fields
+
+        stats = Review.objects.values('product_id').annotate(
+            total=Sum('rating'),
+            count=Count('id'),
+            **{field: Count('id', filter=Q(rating=star)) for star, field in enumerate(star_fields, 1)}
+        ).order_by()
+
+        with transaction.atomic():
+            Product.objects.update(**{field: 0 for field in fields})
+
+            batch = []
+            for row in stats.iterator(chunk_size=batch_size):
+                product = Product(pk=row['product_id'], rating_sum=row['total'], rating_count=row['count'])
+                for field in star_fields:
+                    setattr(product, field, row[field])
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(batch, fields)
+                    batch = []
+            if batch:
+                Product.objects.bulk_update(batch, fields)
+
+        rated = Product.objects.filter(rating_count__gt=0).count()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed rating aggregates ({rated} rated products).'))
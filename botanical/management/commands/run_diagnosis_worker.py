@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from botanical.diagnosis import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Process queued Plant Doctor diagnosis jobs with a bounded pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=getattr(settings, 'DIAGNOSIS_WORKER_CONCURRENCY', 4),
+                            help='Jobs diagnosed at the same time')
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            burst=options['burst'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} diagnosis jobs.'))
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'botanical_product_fts'
+PG_INDEX = 'product_search_vector_idx'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+            f"name, scientific_name, description, tags, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, scientific_name, description, tags) '
+            f"SELECT id, name, COALESCE(scientific_name, ''), description, tags FROM botanical_product"
+        )
+    elif connection.vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from botanical.search import PostgresSearchBackend
+        Product = apps.get_model('botanical', 'Product')
+        schema_editor.add_index(Product, GinIndex(PostgresSearchBackend().vector(), name=PG_INDEX))
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0003_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='botanical.product')),
+                ('document', models.TextField(db_column='botanical_product_fts')),
+                ('name', models.TextField()),
+                ('scientific_name', models.TextField()),
+                ('description', models.TextField()),
+                ('tags', models.TextField()),
+            ],
+            options={
+                'db_table': 'botanical_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
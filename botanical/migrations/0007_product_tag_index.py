@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_tag_index(apps, schema_editor):
+    Product = apps.get_model('botanical', 'Product')
+    ProductTag = apps.get_model('botanical', 'ProductTag')
+    rows = []
+    for pk, tags in Product.objects.values_list('pk', 'tags'):
+        if isinstance(tags, list):
+            normalized = {str(tag).strip().lower()[:50] for tag in tags} - {''}
+            rows.extend(ProductTag(product_id=pk, tag=tag) for tag in normalized)
+    ProductTag.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0006_product_freshness_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=50)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_index', to='botanical.product')),
+            ],
+            options={
+                'verbose_name': 'Product Tag',
+                'verbose_name_plural': 'Product Tags',
+                'unique_together': {('tag', 'product')},
+            },
+        ),
+        migrations.RunPython(backfill_tag_index, migrations.RunPython.noop),
+    ]
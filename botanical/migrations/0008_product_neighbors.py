@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0007_product_tag_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+                ('full', models.BooleanField(default=True)),
+                ('products_updated', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Recommender Run',
+                'verbose_name_plural': 'Recommender Runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='botanical.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='botanical.product')),
+            ],
+            options={
+                'verbose_name': 'Product Neighbor',
+                'verbose_name_plural': 'Product Neighbors',
+                'ordering': ['product', 'rank'],
+                'unique_together': {('product', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0009_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('perceptual_hash', models.CharField(blank=True, max_length=16)),
+                ('phash_band_0', models.PositiveIntegerField(db_index=True, null=True)),
+                ('phash_band_1', models.PositiveIntegerField(db_index=True, null=True)),
+                ('phash_band_2', models.PositiveIntegerField(db_index=True, null=True)),
+                ('phash_band_3', models.PositiveIntegerField(db_index=True, null=True)),
+                ('diagnosis', models.TextField()),
+                ('recommendations', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Diagnosis Result',
+                'verbose_name_plural': 'Diagnosis Results',
+                'ordering': ['-last_used_at'],
+            },
+        ),
+    ]
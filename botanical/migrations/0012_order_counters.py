@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def backfill_order_counters(apps, schema_editor):
+    Order = apps.get_model('botanical', 'Order')
+    UserProfile = apps.get_model('botanical', 'UserProfile')
+    counted = ~Q(status='Cancelled')
+    stats = Order.objects.values('user_id').annotate(
+        count=Count('id', filter=counted),
+        spend=Sum('final_total', filter=counted),
+        last=Max('created_at'),
+    )
+    for row in stats:
+        UserProfile.objects.filter(user_id=row['user_id']).update(
+            order_count=row['count'], lifetime_spend=row['spend'] or 0, last_order_at=row['last']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0011_diagnosis_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_idx'),
+        ),
+        migrations.RunPython(backfill_order_counters, migrations.RunPython.noop),
+    ]
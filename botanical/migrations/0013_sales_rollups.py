@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:47
+
+from django.conf import settings
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def backfill_sales_rollups(apps, schema_editor):
+    OrderItem = apps.get_model('botanical', 'OrderItem')
+    SalesRollup = apps.get_model('botanical', 'SalesRollup')
+    items = OrderItem.objects.exclude(order__status='Cancelled')
+    dimensions = {'total': None, 'category': 'product__category', 'state': 'order__shipping_state'}
+    periods = {'hour': TruncHour, 'day': TruncDay}
+    for dimension, field in dimensions.items():
+        for period, trunc in periods.items():
+            stats = items.annotate(start=trunc('order__created_at', tzinfo=datetime.timezone.utc)).values(
+                'start', *filter(None, [field])
+            ).annotate(revenue=Sum('subtotal'), units=Sum('quantity'), orders=Count('order_id', distinct=True))
+            SalesRollup.objects.bulk_create([
+                SalesRollup(period=period, dimension=dimension, start=row['start'], value=row[field] if field else 'all',
+                            revenue=row['revenue'], units=row['units'], orders=row['orders'])
+                for row in stats.order_by()
+            ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0012_order_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('dimension', models.CharField(choices=[('total', 'All sales'), ('category', 'Category'), ('state', 'Shipping state')], max_length=10)),
+                ('start', models.DateTimeField()),
+                ('value', models.CharField(max_length=100)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.BigIntegerField(default=0)),
+                ('orders', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Sales Rollup',
+                'verbose_name_plural': 'Sales Rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'dimension', 'start', 'value'), name='sales_rollup_bucket_uniq'),
+        ),
+        migrations.RunPython(backfill_sales_rollups, migrations.RunPython.noop),
+    ]
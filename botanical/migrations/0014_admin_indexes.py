@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+# table -> (free-text columns, Postgres index name); see botanical.search.TextIndex
+TEXT_INDEXES = {
+    'botanical_review': (('comment',), 'review_comment_search_idx'),
+    'botanical_plantdiagnosis': (('diagnosis', 'recommendations'), 'diagnosis_text_search_idx'),
+}
+
+
+def create_text_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    for table, (columns, pg_index) in TEXT_INDEXES.items():
+        if connection.vendor == 'sqlite':
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE {table}_fts USING fts5('
+                f"{', '.join(columns)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            schema_editor.execute(
+                f'INSERT INTO {table}_fts (rowid, {", ".join(columns)}) '
+                f'SELECT id, {", ".join(columns)} FROM {table}'
+            )
+        elif connection.vendor == 'postgresql':
+            from django.contrib.postgres.indexes import GinIndex
+            from django.contrib.postgres.search import SearchVector
+            model = next(m for m in apps.get_app_config('botanical').get_models() if m._meta.db_table == table)
+            schema_editor.add_index(model, GinIndex(SearchVector(*columns, config='english'), name=pg_index))
+
+
+def drop_text_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    for table, (columns, pg_index) in TEXT_INDEXES.items():
+        if connection.vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        elif connection.vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {pg_index}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('botanical', '0013_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shipping_state', '-created_at'], name='order_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tracking_number'], name='order_tracking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantdiagnosis',
+            index=models.Index(fields=['created_at'], name='diagnosis_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'created_at'], name='review_rating_idx'),
+        ),
+        migrations.RunPython(create_text_indexes, drop_text_indexes),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.dispatch import Signal
 from django.utils import timezone
-import random
-import string
+import uuid
+from decimal import ROUND_HALF_UP, Decimal
+
+from .order_numbers import new_order_number
 
 
 class MembershipPlan(models.Model):
@@ -85,14 +88,23 @@ class UserProfile(models.Model):
 
     membership_tier = models.CharField(max_length=10, choices=MEMBERSHIP_CHOICES, default='None')
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # Set by the derivative pipeline (botanical/images.py) once renditions exist
+    profile_picture_hash = models.CharField(max_length=64, blank=True, editable=False)
+    profile_picture_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
     state = models.CharField(max_length=100, blank=True, null=True)
     zip_code = models.CharField(max_length=10, blank=True, null=True)
+    # Kept in step with the user's orders (signals.py); cancelled orders are left out of count and spend
+    order_count = models.PositiveIntegerField(default=0, editable=False)
+    lifetime_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    last_order_at = models.DateTimeField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    ORDER_COUNTER_FIELDS = ('order_count', 'lifetime_spend', 'last_order_at')
+
     class Meta:
         verbose_name = 'User Profile'
         verbose_name_plural = 'User Profiles'
@@ -111,6 +123,23 @@ class UserProfile(models.Model):
         }
         return discounts.get(self.membership_tier, 0)
 
+    def save(self, *args, **kwargs):
+        # The order counters only change through UPDATEs; don't write back a stale copy
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.ORDER_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def order_delta(spend, count=1):
+        """Field updates that add `count` orders worth `spend` (negative to remove them)"""
+        return {
+            'order_count': models.F('order_count') + count,
+            'lifetime_spend': models.F('lifetime_spend') + spend,
+        }
+
 
 class Product(models.Model):
     """Product model for plants, seeds, fertilizers, and accessories"""
@@ -121,24 +150,49 @@ class Product(models.Model):
         ('Accessories', 'Accessories'),
     ]
     
+    # Supplier stock-keeping unit, the key `import_products` upserts on; null for products made by hand
+    sku = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name = models.CharField(max_length=200)
     scientific_name = models.CharField(max_length=200, blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     image_url = models.URLField(blank=True, null=True, help_text="Use either uploaded image or URL")
+    # Set by the derivative pipeline (botanical/images.py) once renditions exist
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
     description = models.TextField()
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     tags = models.JSONField(default=list, blank=True, help_text="e.g., ['indoor', 'tropical', 'beginner-friendly']")
     stock_quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     is_active = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
+
+    # Denormalized review aggregates, maintained by the Review signals
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
-        ordering = ['-featured', '-created_at']
+        ordering = ['-featured', '-created_at', 'id']
+        indexes = [
+            # Keyset pagination over the catalog ordering, overall and per category
+            models.Index(fields=['-featured', '-created_at', 'id'], name='product_catalog_idx'),
+            models.Index(fields=['category', '-featured', '-created_at', 'id'], name='product_category_idx'),
+            # Covering indexes for the Max(updated_at)/Count validators of conditional GETs
+            models.Index(fields=['is_active', 'updated_at'], name='product_freshness_idx'),
+            models.Index(fields=['category', 'is_active', 'updated_at'], name='product_cat_freshness_idx'),
+            # The natural key `import_products --key name` matches feed rows on
+            models.Index(fields=['name', 'scientific_name'], name='product_natural_key_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -150,18 +204,38 @@ class Product(models.Model):
             return self.image.url
         return self.image_url or '/static/images/placeholder.jpg'
 
+    @property
+    def image_srcsets(self):
+        """{format: srcset} of the uploaded image's renditions, empty until they exist"""
+        from .images import srcsets
+        return srcsets(self.image_hash, self.image_width) if self.image else {}
+
     @property
     def average_rating(self):
-        """Calculate average rating from reviews"""
-        reviews = self.reviews.all()
-        if reviews:
-            return sum(r.rating for r in reviews) / len(reviews)
+        """Average rating from the stored review aggregates"""
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
     @property
     def review_count(self):
         """Get total number of reviews"""
-        return self.reviews.count()
+        return self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """Review counts for 1 to 5 stars, in that order"""
+        return [getattr(self, f'rating_{star}_count') for star in range(1, 6)]
+
+    @staticmethod
+    def rating_delta(rating, sign=1):
+        """Field updates that add (or with sign=-1, remove) one rating"""
+        return {
+            'updated_at': timezone.now(),
+            'rating_sum': models.F('rating_sum') + sign * rating,
+            'rating_count': models.F('rating_count') + sign,
+            f'rating_{rating}_count': models.F(f'rating_{rating}_count') + sign,
+        }
 
 
 class Review(models.Model):
@@ -181,10 +255,20 @@ class Review(models.Model):
         verbose_name_plural = 'Reviews'
         ordering = ['-created_at']
         unique_together = ['product', 'user']  # One review per user per product
+        indexes = [
+            # Admin date drill-down and rating filter (botanical/changelists.py)
+            models.Index(fields=['created_at'], name='review_created_idx'),
+            models.Index(fields=['rating', 'created_at'], name='review_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating}★)"
 
+    def save(self, *args, **kwargs):
+        # Keep the row and the product rating aggregates (post_save) in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Wishlist(models.Model):
     """User wishlist for products"""
@@ -237,15 +321,128 @@ class Order(models.Model):
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_history_idx'),
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_idx'),
+            # Sales rollup rebuilds and the admin date drill-down read orders by date
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # Admin changelist filters and search (botanical/changelists.py, OrderAdmin)
+            models.Index(fields=['status', '-created_at'], name='order_status_idx'),
+            models.Index(fields=['shipping_state', '-created_at'], name='order_state_idx'),
+            models.Index(fields=['tracking_number'], name='order_tracking_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.order_number} - {self.user.username}"
 
+    # Generated numbers that may already be taken (RandomGenerator) are retried this often
+    ORDER_NUMBER_ATTEMPTS = 3
+
     def save(self, *args, **kwargs):
-        if not self.order_number:
-            # Generate unique order number
-            self.order_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-        super().save(*args, **kwargs)
+        # Keep the row and the user's order counters (post_save) in one transaction
+        if self.order_number:
+            with transaction.atomic(using=kwargs.get('using')):
+                return super().save(*args, **kwargs)
+        for attempt in range(self.ORDER_NUMBER_ATTEMPTS):
+            self.order_number = self.new_order_number()
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                taken = Order.objects.filter(order_number=self.order_number).exists()
+                self.order_number = ''
+                if not taken or attempt == self.ORDER_NUMBER_ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def new_order_number():
+        """A number from settings.ORDER_NUMBER_GENERATOR (see botanical/order_numbers.py)"""
+        return new_order_number()
+
+    @staticmethod
+    def membership_discount(total, discount_percentage):
+        """Discount amount for a membership percentage, rounded to the cent"""
+        return (total * discount_percentage / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+# Sent by OrderItem.objects.bulk_create_items() in place of post_save, with the
+# inserted `items` and the `new_orders` inserted for them
+order_items_created = Signal()
+
+
+class OrderItemManager(models.Manager):
+    def bulk_create_items(self, items, discount_percentage=None, batch_size=1000):
+        """
+        Insert order items in batches, keeping subtotals and order totals right.
+
+        OrderItem.save() is skipped by bulk_create, so subtotals are computed
+        here, and each order's total and final_total are summed in the same
+        pass over the items. Orders that are not saved yet are inserted first
+        (also in batches); saved ones get their totals updated, counting the
+        items they already have. With
+        `discount_percentage` every order's discount is that share of its
+        total, otherwise each order keeps the discount amount it has. No
+        post_save signals are sent; the users' order counters are updated
+        directly, and order_items_created is sent once for all the items.
+        """
+        items = list(items)
+        orders, totals = {}, {}
+        for item in items:
+            item.subtotal = item.price * item.quantity
+            key = id(item.order)
+            orders[key] = item.order
+            totals[key] = totals.get(key, Decimal('0.00')) + item.subtotal
+
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            # Saved orders may already have items: their totals cover those too
+            existing = dict(
+                self.using(self.db).filter(order__in=[order.pk for order in orders.values() if order.pk is not None])
+                .values('order_id').annotate(total=models.Sum('subtotal')).values_list('order_id', 'total')
+            )
+            new_orders, saved_orders = [], []
+            for key, order in orders.items():
+                total = totals[key] + existing.get(order.pk, Decimal('0.00'))
+                order.total = total
+                if discount_percentage is not None:
+                    order.discount = Order.membership_discount(total, discount_percentage)
+                order.final_total = total - order.discount
+                if order.pk is None:
+                    order.order_number = order.order_number or Order.new_order_number()
+                    new_orders.append(order)
+                else:
+                    order.updated_at = now
+                    saved_orders.append(order)
+
+            orders = Order.objects.using(self.db)
+            stored = dict(orders.filter(pk__in=[order.pk for order in saved_orders]).values_list('pk', 'final_total'))
+            orders.bulk_create(new_orders, batch_size=batch_size)
+            orders.bulk_update(saved_orders, ['total', 'discount', 'final_total', 'updated_at'], batch_size=batch_size)
+            self._update_order_counters(new_orders, saved_orders, stored)
+            # bulk_create reads order_id from orders inserted since assignment
+            created = self.bulk_create(items, batch_size=batch_size)
+            order_items_created.send(sender=OrderItem, items=created, new_orders=new_orders, using=self.db)
+        return created
+
+    def _update_order_counters(self, new_orders, saved_orders, stored):
+        """What the Order signals would have done, as one UPDATE per user"""
+        counters = {}
+        for order in new_orders:
+            count, spend, last_order_at = counters.get(order.user_id, (0, Decimal('0.00'), order.created_at))
+            if order.status != 'Cancelled':
+                count, spend = count + 1, spend + order.final_total
+            counters[order.user_id] = (count, spend, max(last_order_at, order.created_at))
+        for order in saved_orders:
+            if order.status != 'Cancelled':
+                count, spend, last_order_at = counters.get(order.user_id, (0, Decimal('0.00'), None))
+                counters[order.user_id] = (count, spend + order.final_total - stored[order.pk], last_order_at)
+        for order in new_orders + saved_orders:
+            order._stored_counter = (order.user_id, order.status, order.final_total)  # see signals.py
+        for user_id, (count, spend, last_order_at) in counters.items():
+            updates = UserProfile.order_delta(spend, count)
+            if last_order_at:
+                updates['last_order_at'] = last_order_at
+            UserProfile.objects.using(self.db).filter(user_id=user_id).update(**updates)
 
 
 class OrderItem(models.Model):
@@ -256,6 +453,8 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
 
+    objects = OrderItemManager()
+
     class Meta:
         verbose_name = 'Order Item'
         verbose_name_plural = 'Order Items'
@@ -272,6 +471,9 @@ class PlantDiagnosis(models.Model):
     """AI Plant Doctor diagnoses"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='diagnoses', blank=True, null=True)
     image = models.ImageField(upload_to='diagnoses/')
+    # Set by the derivative pipeline (botanical/images.py) once renditions exist
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
     diagnosis = models.TextField()
     recommendations = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -280,6 +482,9 @@ class PlantDiagnosis(models.Model):
         verbose_name = 'Plant Diagnosis'
         verbose_name_plural = 'Plant Diagnoses'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='diagnosis_created_idx'),
+        ]
 
     def __str__(self):
         user_str = self.user.username if self.user else 'Anonymous'
@@ -300,3 +505,180 @@ class Newsletter(models.Model):
 
     def __str__(self):
         return self.email
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Read-only view of the SQLite FTS5 catalog index (botanical/search.py).
+
+    The virtual table is created by migration 0004; rowid is the product id and
+    the hidden `botanical_product_fts` column is what MATCH and bm25() take.
+    """
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid',
+        on_delete=models.DO_NOTHING, related_name='search_document',
+    )
+    document = models.TextField(db_column='botanical_product_fts')
+    name = models.TextField()
+    scientific_name = models.TextField()
+    description = models.TextField()
+    tags = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'botanical_product_fts'
+
+
+class ProductTag(models.Model):
+    """Normalized copy of Product.tags, one row per tag, kept in sync by signals"""
+    product = models.ForeignKey(Product, related_name='tag_index', on_delete=models.CASCADE)
+    tag = models.CharField(max_length=50)
+
+    class Meta:
+        verbose_name = 'Product Tag'
+        verbose_name_plural = 'Product Tags'
+        unique_together = ['tag', 'product']  # also the tag -> products index
+
+    def __str__(self):
+        return f"{self.product_id}: {self.tag}"
+
+
+class ProductNeighbor(models.Model):
+    """Precomputed "customers also liked" neighbours, written by build_recommendations"""
+    product = models.ForeignKey(Product, related_name='neighbors', on_delete=models.CASCADE)
+    neighbor = models.ForeignKey(Product, related_name='neighbor_of', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name = 'Product Neighbor'
+        verbose_name_plural = 'Product Neighbors'
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'rank']  # also the product -> neighbours index
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+class RecommenderRun(models.Model):
+    """One build_recommendations run; the last one bounds the next incremental refresh"""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(auto_now_add=True)
+    full = models.BooleanField(default=True)
+    products_updated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Recommender Run'
+        verbose_name_plural = 'Recommender Runs'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{'Full' if self.full else 'Incremental'} run at {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class DiagnosisResult(models.Model):
+    """
+    Cached Plant Doctor answer for one image, looked up by content hash or,
+    for near-duplicates, by perceptual hash (botanical/diagnosis.py).
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    perceptual_hash = models.CharField(max_length=16, blank=True)
+    # 16-bit quarters of the perceptual hash; any hash within 3 bits shares one
+    phash_band_0 = models.PositiveIntegerField(null=True, db_index=True)
+    phash_band_1 = models.PositiveIntegerField(null=True, db_index=True)
+    phash_band_2 = models.PositiveIntegerField(null=True, db_index=True)
+    phash_band_3 = models.PositiveIntegerField(null=True, db_index=True)
+    diagnosis = models.TextField()
+    recommendations = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'Diagnosis Result'
+        verbose_name_plural = 'Diagnosis Results'
+        ordering = ['-last_used_at']
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.hits} hits)"
+
+
+class DiagnosisJob(models.Model):
+    """A queued Plant Doctor request, processed by run_diagnosis_worker"""
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='diagnosis_jobs', blank=True, null=True)
+    image = models.ImageField(upload_to='diagnoses/')
+    content_hash = models.CharField(max_length=64)
+    perceptual_hash = models.CharField(max_length=16, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    diagnosis = models.OneToOneField(
+        PlantDiagnosis, on_delete=models.SET_NULL, related_name='job', blank=True, null=True
+    )
+    cached = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Diagnosis Job'
+        verbose_name_plural = 'Diagnosis Jobs'
+        ordering = ['created_at']
+        indexes = [
+            # Workers claim the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='diagnosis_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('Done', 'Failed')
+
+
+class SalesRollup(models.Model):
+    """
+    Sales of one hour or day (UTC) for one product category or shipping
+    state, or all of them ('total'), kept up to date as orders come in (botanical/sales.py). Revenue
+    is the sum of item subtotals, before membership discounts; cancelled
+    orders are left out.
+    """
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    DIMENSION_CHOICES = [
+        ('total', 'All sales'),
+        ('category', 'Category'),
+        ('state', 'Shipping state'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    start = models.DateTimeField()
+    value = models.CharField(max_length=100)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.BigIntegerField(default=0)
+    # Orders with at least one item in this category (or shipped to this state, or at all)
+    orders = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Sales Rollup'
+        verbose_name_plural = 'Sales Rollups'
+        constraints = [
+            # Also the index the dashboard's range reads use
+            models.UniqueConstraint(fields=['period', 'dimension', 'start', 'value'], name='sales_rollup_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.value}, {self.period} of {self.start:%Y-%m-%d %H:%M}"
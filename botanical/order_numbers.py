@@ -0,0 +1,158 @@
+"""
+Pluggable order number generators.
+
+settings.ORDER_NUMBER_GENERATOR names the generator class; one instance is
+created per process. Generated numbers are fixed-width Crockford base32
+(digits and upper-case letters without I, L, O and U), so they are easy to
+read out and sort in the order they were made, which keeps inserts at the
+right-hand edge of the unique index instead of scattered across it.
+
+SnowflakeGenerator packs a millisecond timestamp, a worker id and a
+per-millisecond sequence into 63 bits: 13 characters. Numbers are unique
+across processes as long as their worker ids differ; set
+ORDER_NUMBER_WORKER_ID (0-1023) per process, otherwise each process picks
+a random one. UlidGenerator needs no coordination at all: a millisecond
+timestamp and 80 random bits, 26 characters. RandomGenerator is the old
+scheme (10 random characters), kept for comparison.
+"""
+import datetime
+import os
+import random
+import secrets
+import string
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+# Snowflake timestamps count from here; 41 bits of milliseconds last 69 years
+SNOWFLAKE_EPOCH_MS = int(datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+
+def encode_base32(value, width):
+    """`value` in Crockford base32, left-padded with zeros to `width` characters"""
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(CROCKFORD[digit])
+    if value:
+        raise ValueError(f'Does not fit in {width} characters')
+    return ''.join(reversed(chars))
+
+
+def decode_base32(text):
+    value = 0
+    for char in text.upper():
+        value = value * 32 + CROCKFORD.index(char)
+    return value
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+class RandomGenerator:
+    """10 random characters; unique only thanks to the database constraint"""
+
+    def __call__(self):
+        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+class SnowflakeGenerator:
+    """Timestamp, worker id and sequence in 13 characters"""
+
+    width = 13
+
+    def __init__(self, worker_id=None, clock=_now_ms):
+        if worker_id is None:
+            worker_id = getattr(settings, 'ORDER_NUMBER_WORKER_ID', None)
+        if worker_id is not None and not 0 <= worker_id < 2 ** WORKER_BITS:
+            raise ValueError(f'ORDER_NUMBER_WORKER_ID must be between 0 and {2 ** WORKER_BITS - 1}')
+        self.configured_worker_id = worker_id
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _reset_after_fork(self):
+        # A forked worker must not carry on its parent's random worker id
+        self._pid = os.getpid()
+        self.worker_id = self.configured_worker_id
+        if self.worker_id is None:
+            self.worker_id = secrets.randbelow(2 ** WORKER_BITS)
+
+    def __call__(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_after_fork()
+            # Never step back: a clock set backwards reuses the last millisecond
+            now = max(self.clock(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) % 2 ** SEQUENCE_BITS
+                if self._sequence == 0:
+                    # 4096 numbers this millisecond already; borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            value = ((now - SNOWFLAKE_EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)
+                     | self.worker_id << SEQUENCE_BITS | self._sequence)
+        return encode_base32(value, self.width)
+
+
+class UlidGenerator:
+    """
+    A ULID: 48-bit millisecond timestamp and 80 random bits in 26
+    characters. Within a millisecond the random part is incremented, so one
+    process's numbers stay in order.
+    """
+
+    width = 26
+
+    def __init__(self, clock=_now_ms):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._random = 0
+
+    def __call__(self):
+        with self._lock:
+            now = max(self.clock(), self._last_ms)
+            if now == self._last_ms and self._random < 2 ** 80 - 1:
+                self._random += 1
+            else:
+                self._random = secrets.randbits(80)
+            self._last_ms = now
+            value = now << 80 | self._random
+        return encode_base32(value, self.width)
+
+
+_generator = None
+
+
+def get_order_number_generator():
+    """Return the configured generator (one instance per process)"""
+    global _generator
+    if _generator is None:
+        path = getattr(settings, 'ORDER_NUMBER_GENERATOR', 'botanical.order_numbers.SnowflakeGenerator')
+        _generator = import_string(path)()
+    return _generator
+
+
+def new_order_number():
+    return get_order_number_generator()()
+
+
+@receiver(setting_changed)
+def reset_order_number_generator(setting, **kwargs):
+    global _generator
+    if setting.startswith('ORDER_NUMBER_'):
+        _generator = None
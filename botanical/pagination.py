@@ -0,0 +1,232 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with `WHERE (ordering columns) > (last row seen)` instead of
+OFFSET, so every page costs the same indexed range scan and no COUNT(*) is
+run. Cursors are opaque, URL-safe tokens holding the ordering values of the
+row a page starts after (or, going backwards, before). Already sorted lists
+of dicts (the catalog snapshot) can be paged with the same cursors.
+"""
+import base64
+import binascii
+import bisect
+import datetime
+import functools
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder truncates datetimes to milliseconds; keysets need them exact"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': reverse}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """(values, backwards) of a cursor built from `size` key columns"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, backwards = payload['v'], bool(payload['r'])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    # Cursors come from the query string: anything but one scalar per key column is forged
+    if not isinstance(values, list) or len(values) != size or not all(
+            value is None or isinstance(value, (str, int, float)) for value in values):
+        raise InvalidCursor(token)
+    return values, backwards
+
+
+@functools.total_ordering
+class _Descending:
+    """Sort key wrapper that inverts the order of its value"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+
+class CursorPage:
+    """One page of results plus the cursors of its neighbours"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate an ordered queryset (or a values() queryset) by keyset.
+
+    The ordering defaults to the queryset's own ordering, falling back to the
+    model's Meta.ordering, and always ends with the primary key so it is total.
+    A list of dicts already sorted that way can be passed instead, together
+    with its `model` so cursor values are parsed the same way.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None, model=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.model = model or queryset.model
+        if not ordering and isinstance(queryset, list):
+            ordering = self.model._meta.ordering
+        ordering = list(ordering or queryset.query.order_by or self.model._meta.ordering)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering.append('id')
+        self.ordering = [{'pk': 'id', '-pk': '-id'}.get(field, field) for field in ordering]
+
+    def _fields(self):
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    @property
+    def key_fields(self):
+        """Names of the columns the cursors are built from"""
+        return [name for name, descending in self._fields()]
+
+    def _value(self, obj, name):
+        return obj[name] if isinstance(obj, dict) else getattr(obj, name)
+
+    def _to_python(self, name, value):
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value  # annotation such as search_rank
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            raise InvalidCursor(value)
+
+    def _keyset_filter(self, values, backwards):
+        fields = self._fields()
+        values = [self._to_python(name, value) for (name, desc), value in zip(fields, values)]
+        condition = Q()
+        for i, (name, descending) in enumerate(fields):
+            after = descending == backwards  # ascending forwards, or descending backwards
+            clause = Q(**{f'{name}__gt' if after else f'{name}__lt': values[i]})
+            for prior_name, prior_value in zip([n for n, d in fields[:i]], values[:i]):
+                clause &= Q(**{prior_name: prior_value})
+            condition |= clause
+        return condition
+
+    def _cursor(self, obj, reverse=False):
+        return encode_cursor([self._value(obj, name) for name, desc in self._fields()], reverse)
+
+    def _sort_key(self, values):
+        return tuple(
+            _Descending(value) if descending else value
+            for value, (name, descending) in zip(values, self._fields())
+        )
+
+    def _fetch_from_list(self, values, backwards):
+        """Up to per_page + 1 rows of a sorted list, walking away from the cursor"""
+        rows = self.queryset
+        limit = self.per_page + 1
+        if values is None:
+            return rows[:limit]
+        key = self._sort_key([self._to_python(name, value) for name, value in zip(self.key_fields, values)])
+        row_key = lambda row: self._sort_key([row[name] for name in self.key_fields])
+        if backwards:
+            end = bisect.bisect_left(rows, key, key=row_key)
+            return rows[max(end - limit, 0):end][::-1]
+        start = bisect.bisect_right(rows, key, key=row_key)
+        return rows[start:start + limit]
+
+    def _fetch(self, values, backwards):
+        if isinstance(self.queryset, list):
+            return self._fetch_from_list(values, backwards)
+        ordering = self.ordering
+        if backwards:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._keyset_filter(values, backwards))
+        return list(queryset[:self.per_page + 1])
+
+    def get_page(self, cursor=None):
+        """Return the page after (or, for a backwards cursor, before) `cursor`"""
+        values, backwards = decode_cursor(cursor, len(self.ordering)) if cursor else (None, False)
+        rows = self._fetch(values, backwards)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows)
+        if backwards:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        return CursorPage(
+            rows,
+            next_cursor=self._cursor(rows[-1]) if has_next else None,
+            previous_cursor=self._cursor(rows[0], reverse=True) if has_previous else None,
+        )
+
+    def get_page_or_first(self, cursor=None):
+        """Like get_page, but a malformed cursor falls back to the first page"""
+        try:
+            return self.get_page(cursor)
+        except InvalidCursor:
+            return self.get_page()
+
+
+def page_querystrings(request, page):
+    """
+    Return (previous, next) query strings for `page`, keeping the other GET
+    parameters. Works for CursorPage and for a legacy Paginator page.
+    """
+    def build(key, value):
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        params.pop('page', None)
+        params[key] = value
+        return '?' + params.urlencode()
+
+    if isinstance(page, CursorPage):
+        previous = build('cursor', page.previous_cursor) if page.has_previous() else None
+        following = build('cursor', page.next_cursor) if page.has_next() else None
+    else:
+        previous = build('page', page.previous_page_number()) if page.has_previous() else None
+        following = build('page', page.next_page_number()) if page.has_next() else None
+    return previous, following
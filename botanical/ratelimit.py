@@ -0,0 +1,164 @@
+"""
+Rate limiting and admission control for the API.
+
+RateLimitMiddleware gives each client a token bucket per route: signed-in
+users are keyed by user id, everyone else by IP address. Routes are named
+by URL name in settings.RATE_LIMITS; other /api/ routes get
+settings.RATE_LIMIT_DEFAULT. A bucket refills at `rate` and holds `burst`
+requests. Requests beyond it get 429 with Retry-After.
+
+Buckets live in the Django cache, so with a shared backend (Redis,
+memcached) the limits hold across worker processes. Each bucket is one
+integer, the time at which it will be full again (the GCRA form of a token
+bucket). A request costs one atomic increment, plus one write when the
+bucket was full. Processes racing on a full bucket can each let one extra
+request through.
+
+settings.CONCURRENCY_LIMITS caps how many requests to an expensive route
+run at once across all processes. The cap uses that many slot keys taken
+with cache.add(). A request that finds no free slot gets 503 with
+Retry-After instead of queueing. Slots expire after
+CONCURRENCY_SLOT_TIMEOUT seconds, so a crashed worker cannot leak them; each
+holds a token of the request that took it, so a request that outlived its
+slot does not free another request's.
+"""
+import functools
+import math
+import random
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+RATE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'60/m' -> (60, 60.0): requests per period in seconds"""
+    count, _, unit = rate.partition('/')
+    try:
+        return int(count), float(RATE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ValueError(f'Invalid rate {rate!r}; expected e.g. "60/m"')
+
+
+def _cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def take_token(key, rate, burst=None, store=None):
+    """
+    Take a token from the bucket `key`; return 0 if one was free, else the
+    seconds until one will be.
+    """
+    count, period = parse_rate(rate)
+    interval = max(int(period * 1000 / count), 1)  # milliseconds per token
+    capacity = interval * (burst or count)
+    store = store or _cache()
+    now = int(time.time() * 1000)
+    timeout = max(capacity // 1000 * 2, 3600)
+    try:
+        full_at = store.incr(key, interval)
+    except ValueError:  # a new client
+        store.set(key, now + interval, timeout)
+        return 0
+    if full_at - interval <= now:
+        # The bucket was full; restart its clock from now
+        store.set(key, now + interval, timeout)
+        return 0
+    if full_at - now > capacity:
+        # Refused requests use no tokens
+        store.decr(key, interval)
+        return (full_at - now - capacity) / 1000
+    return 0
+
+
+def acquire_slot(name, limit, store=None):
+    """Take one of `limit` concurrency slots for `name`; return (key, token), or None if all are taken"""
+    store = store or _cache()
+    timeout = getattr(settings, 'CONCURRENCY_SLOT_TIMEOUT', 60)
+    token = secrets.token_hex(8)
+    start = random.randrange(limit)
+    for i in range(limit):
+        key = f'ratelimit:slot:{name}:{(start + i) % limit}'
+        if store.add(key, token, timeout):
+            return key, token
+    return None
+
+
+def release_slot(slot):
+    """Free a slot from acquire_slot(), unless it expired and another request has it now"""
+    key, token = slot
+    store = _cache()
+    # The cache API has no compare-and-delete; the gap between the two calls is
+    # far shorter than the slot timeout that would have to run out inside it
+    if store.get(key) == token:
+        store.delete(key)
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        # e.g. HTTP_X_FORWARDED_FOR behind proxies: each appends the address it was
+        # reached from, so the client's is the one added by the outermost trusted
+        # proxy. Anything to the left of it was sent by the client and proves nothing.
+        addresses = [address.strip() for address in request.META[header].split(',')]
+        trusted = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 1)
+        return 'ip:' + addresses[max(len(addresses) - trusted, 0)]
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
+
+
+def route_limit(request):
+    """(route name, its RATE_LIMITS entry or the default for /api/ paths, else None)"""
+    route = request.resolver_match.view_name
+    limits = getattr(settings, 'RATE_LIMITS', {})
+    if route in limits:
+        return route, limits[route]
+    if request.path_info.startswith('/api/'):
+        return route, getattr(settings, 'RATE_LIMIT_DEFAULT', None)
+    return route, None
+
+
+def _refuse(status, error, retry_after):
+    response = JsonResponse({'error': error}, status=status)
+    response['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+class RateLimitMiddleware:
+    """Token buckets per client and route, and concurrency caps per route (after AuthenticationMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        slot = getattr(request, '_concurrency_slot', None)
+        if slot is not None:
+            release_slot(slot)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        route, limit = route_limit(request)
+        concurrency = getattr(settings, 'CONCURRENCY_LIMITS', {}).get(route)
+        if not limit and not concurrency:
+            return None
+        store = _cache()
+        if limit:
+            key = f'ratelimit:{route}:{client_key(request)}'
+            wait = take_token(key, limit['rate'], limit.get('burst'), store)
+            if wait:
+                return _refuse(429, 'Too many requests', wait)
+        if concurrency:
+            request._concurrency_slot = acquire_slot(route, concurrency, store)
+            if request._concurrency_slot is None:
+                return _refuse(503, 'Server busy', getattr(settings, 'CONCURRENCY_RETRY_AFTER', 2))
+        return None
@@ -0,0 +1,148 @@
+"""
+Item-to-item recommendations from behavioural co-occurrence.
+
+Wishlist entries, purchases and positive reviews form a sparse user x product
+matrix; the cosine similarity of its columns scores how often two products
+are liked by the same people. The top neighbours of every product are stored
+in ProductNeighbor, so product_detail reads them with one indexed query.
+
+Incremental runs only rescore products whose interactions changed since the
+last run, together with the products that share a user with them (their
+scores against a changed product moved too). Deleted interactions leave no
+timestamp behind, so a periodic full run is still needed to forget them.
+"""
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import OrderItem, Product, ProductNeighbor, RecommenderRun, Review, Wishlist
+
+
+# Interaction weights; several interactions of one user with a product add up
+PURCHASE_WEIGHT = 3.0
+WISHLIST_WEIGHT = 2.0
+REVIEW_WEIGHT = 1.0
+POSITIVE_RATING = 4
+TOP_K = 8
+# Products scored per sparse matrix product, bounding the memory of one block of scores
+BLOCK_SIZE = 1000
+
+
+def _interaction_sources():
+    """(queryset, user field, weight) per kind of interaction"""
+    return [
+        (OrderItem.objects.exclude(order__status='Cancelled'), 'order__user_id', PURCHASE_WEIGHT),
+        (Wishlist.objects.all(), 'user_id', WISHLIST_WEIGHT),
+        (Review.objects.filter(rating__gte=POSITIVE_RATING), 'user_id', REVIEW_WEIGHT),
+    ]
+
+
+def interaction_matrix():
+    """(CSR user x product weight matrix, product id of each column)"""
+    users, products, weights = [], [], []
+    for queryset, user_field, weight in _interaction_sources():
+        pairs = np.array(list(queryset.values_list(user_field, 'product_id')), dtype=np.int64).reshape(-1, 2)
+        users.append(pairs[:, 0])
+        products.append(pairs[:, 1])
+        weights.append(np.full(len(pairs), weight))
+    user_ids, rows = np.unique(np.concatenate(users), return_inverse=True)
+    product_ids, columns = np.unique(np.concatenate(products), return_inverse=True)
+    # Duplicate (user, product) entries are summed by the constructor
+    matrix = sparse.csr_matrix(
+        (np.concatenate(weights), (rows, columns)), shape=(len(user_ids), len(product_ids))
+    )
+    return matrix, product_ids
+
+
+def changed_products(since):
+    """Ids of products with an interaction added or updated at or after `since`"""
+    changed = set(OrderItem.objects.filter(order__updated_at__gte=since).values_list('product_id', flat=True))
+    changed.update(Wishlist.objects.filter(added_at__gte=since).values_list('product_id', flat=True))
+    changed.update(Review.objects.filter(updated_at__gte=since).values_list('product_id', flat=True))
+    return changed
+
+
+def affected_columns(matrix, columns):
+    """`columns` plus every column sharing a user with one of them"""
+    if not len(columns):
+        return columns
+    users = np.unique(matrix[:, columns].nonzero()[0])
+    return np.union1d(columns, np.unique(matrix[users].nonzero()[1]))
+
+
+def top_neighbors(matrix, columns, candidates, k=TOP_K):
+    """
+    Yield (column, neighbour columns, scores) for each of `columns`, best first.
+
+    Scores are cosine similarities between product columns, computed as a
+    sparse product one block of rows at a time; `candidates` is a boolean
+    mask of the columns that may be recommended.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    normalized = (matrix @ sparse.diags(1 / np.where(norms > 0, norms, 1))).tocsc()
+    keep = sparse.diags(candidates.astype(float))
+    for start in range(0, len(columns), BLOCK_SIZE):
+        block = columns[start:start + BLOCK_SIZE]
+        scores = (normalized[:, block].T @ normalized @ keep).tocsr()
+        scores.eliminate_zeros()
+        for i, column in enumerate(block):
+            cols = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+            vals = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+            mask = cols != column
+            cols, vals = cols[mask], vals[mask]
+            if len(vals) > k:
+                best = np.argpartition(-vals, k)[:k]
+                cols, vals = cols[best], vals[best]
+            order = np.lexsort((cols, -vals))
+            yield column, cols[order], vals[order]
+
+
+def build_recommendations(full=False, k=TOP_K, batch_size=2000):
+    """
+    Recompute ProductNeighbor rows and record the run.
+
+    Without `full`, only products touched since the previous run (and their
+    co-occurring products) are rescored; the first run is always full.
+    """
+    started_at = timezone.now()
+    last_run = RecommenderRun.objects.first()
+    full = full or last_run is None
+    matrix, product_ids = interaction_matrix()
+    active = set(Product.objects.filter(is_active=True).values_list('pk', flat=True))
+    candidates = np.isin(product_ids, list(active))
+
+    if full:
+        columns = np.arange(len(product_ids))
+        stale = None
+    else:
+        changed = changed_products(last_run.started_at)
+        columns = affected_columns(matrix, np.flatnonzero(np.isin(product_ids, list(changed))))
+        # Changed products without any interaction left lose their neighbours
+        stale = changed | {int(pk) for pk in product_ids[columns]}
+
+    with transaction.atomic():
+        if stale is None:
+            ProductNeighbor.objects.all().delete()
+        else:
+            stale = list(stale)
+            for start in range(0, len(stale), batch_size):
+                ProductNeighbor.objects.filter(product_id__in=stale[start:start + batch_size]).delete()
+        batch = []
+        for column, neighbors, scores in top_neighbors(matrix, columns, candidates, k):
+            batch.extend(
+                ProductNeighbor(product_id=int(product_ids[column]), neighbor_id=int(product_ids[neighbor]),
+                                rank=rank, score=float(score))
+                for rank, (neighbor, score) in enumerate(zip(neighbors, scores))
+            )
+            if len(batch) >= batch_size:
+                ProductNeighbor.objects.bulk_create(batch)
+                batch = []
+        ProductNeighbor.objects.bulk_create(batch)
+        run = RecommenderRun.objects.create(started_at=started_at, full=full, products_updated=len(columns))
+
+    if len(columns):
+        # Product pages are cached against the catalog version
+        transaction.on_commit(bump_catalog_version)
+    return run
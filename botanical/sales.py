@@ -0,0 +1,293 @@
+"""
+Sales rollups and the sales dashboard.
+
+SalesRollup rows hold revenue, units and order counts per hour and per day
+(UTC), by product category and by shipping state. They change in the same
+transaction as the orders they count (see signals.py): new items add
+themselves, edited and deleted items move their share, and cancelling an
+order (or taking a cancellation back) removes (or restores) all of its
+items. Each change is one upsert per rollup row it touches. rebuild()
+recomputes any range of days from the order tables, for backfills and
+repairs (manage.py rebuild_sales_rollups).
+
+The dashboard only reads rollup rows, so its cost grows with the number of
+days and categories or states shown, not with the number of orders; the
+moving average and the period-over-period changes are computed with NumPy.
+"""
+import datetime
+from decimal import Decimal
+
+import numpy as np
+from django.db import connections, router, transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Cast, TruncHour
+from django.utils import timezone
+
+from .models import Order, OrderItem, Product, SalesRollup
+
+
+UTC = datetime.timezone.utc
+# Dimension -> the item field it groups by; 'total' has a single value, TOTAL
+DIMENSIONS = {'total': None, 'category': 'product__category', 'state': 'order__shipping_state'}
+TOTAL = 'all'
+# An item row: (order id, order created_at, shipping state, category, subtotal, quantity)
+ITEM_ROW_FIELDS = ('order_id', 'order__created_at', 'order__shipping_state', 'product__category',
+                   'subtotal', 'quantity')
+MOVING_AVERAGE_DAYS = 7
+DASHBOARD_HOURS = 48
+
+
+def _buckets(created_at):
+    hour = created_at.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+    return (('hour', hour), ('day', hour.replace(hour=0)))
+
+
+def rollup_deltas(rows, others=frozenset(), sign=1):
+    """
+    {(period, dimension, start, value): [revenue, units, orders]} for item
+    rows being added (sign=1) or removed (sign=-1).
+
+    `others` holds the (order id, category) pairs of the other items their
+    orders keep; an order counts towards a category or state while it has
+    at least one item there.
+    """
+    orders_with_others = {order_id for order_id, _ in others}
+    deltas = {}
+    counted = set()
+    for order_id, created_at, state, category, subtotal, quantity in rows:
+        only_item = order_id not in orders_with_others
+        for dimension, value, alone in (('total', TOTAL, only_item),
+                                        ('category', category, (order_id, category) not in others),
+                                        ('state', state, only_item)):
+            for period, start in _buckets(created_at):
+                key = (period, dimension, start, value)
+                delta = deltas.setdefault(key, [Decimal('0.00'), 0, 0])
+                delta[0] += sign * subtotal
+                delta[1] += sign * quantity
+                if alone and (key, order_id) not in counted:
+                    counted.add((key, order_id))
+                    delta[2] += sign
+    return deltas
+
+
+def apply_deltas(deltas, using=None):
+    """Add `deltas` to the rollup rows, creating the missing ones"""
+    if not deltas:
+        return
+    using = using or router.db_for_write(SalesRollup)
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for (period, dimension, start, value), (revenue, units, orders) in deltas.items():
+            bucket = SalesRollup.objects.using(using).filter(period=period, dimension=dimension, start=start, value=value)
+            if not bucket.update(revenue=F('revenue') + revenue, units=F('units') + units, orders=F('orders') + orders):
+                bucket.create(period=period, dimension=dimension, start=start, value=value,
+                              revenue=revenue, units=units, orders=orders)
+        return
+
+    # INSERT ... ON CONFLICT DO UPDATE adds to an existing row in the same statement
+    qn = connection.ops.quote_name
+    table = qn(SalesRollup._meta.db_table)
+    keys = ', '.join(qn(name) for name in ('period', 'dimension', 'start', 'value'))
+    sums = ', '.join(f'{qn(name)} = {table}.{qn(name)} + excluded.{qn(name)}' for name in ('revenue', 'units', 'orders'))
+    sql = (f'INSERT INTO {table} ({keys}, {qn("revenue")}, {qn("units")}, {qn("orders")}) '
+           f'VALUES (%s, %s, %s, %s, %s, %s, %s) ON CONFLICT ({keys}) DO UPDATE SET {sums}')
+    params = [
+        (period, dimension, connection.ops.adapt_datetimefield_value(start), value,
+         connection.ops.adapt_decimalfield_value(revenue, 14, 2), units, orders)
+        for (period, dimension, start, value), (revenue, units, orders) in sorted(deltas.items())
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _other_items(order_ids, exclude_pks, using=None):
+    """(order id, category) of the items of `order_ids` other than `exclude_pks`"""
+    if not order_ids:
+        return frozenset()
+    items = OrderItem.objects.using(using).filter(order_id__in=order_ids).exclude(pk__in=exclude_pks)
+    return frozenset(items.values_list('order_id', 'product__category'))
+
+
+# ============= EVENTS =============
+
+def record_new_items(items, new_orders=(), using=None):
+    """Add items just inserted by bulk_create_items() (with their orders in memory)"""
+    items = [item for item in items if item.order.status != 'Cancelled']
+    if not items:
+        return
+    # Checkout passes loaded products; look up the categories of any others
+    categories = {item.product_id: item.product.category for item in items
+                  if OrderItem.product.is_cached(item) and 'category' in item.product.__dict__}
+    missing = {item.product_id for item in items} - categories.keys()
+    if missing:
+        categories.update(Product.objects.using(using).filter(pk__in=missing).values_list('pk', 'category'))
+    rows = [(item.order_id, item.order.created_at, item.order.shipping_state, categories[item.product_id],
+             item.subtotal, item.quantity) for item in items]
+    # Orders inserted in the same call have no other items
+    new_order_ids = {order.pk for order in new_orders}
+    existing = {item.order_id for item in items} - new_order_ids
+    others = _other_items(existing, [item.pk for item in items], using)
+    apply_deltas(rollup_deltas(rows, others), using)
+
+
+def record_item_change(item, before, after, using=None):
+    """
+    Move one item's share: `before` and `after` are its (product id,
+    quantity, subtotal), None for a new or a deleted item.
+    """
+    order = Order.objects.using(using).filter(pk=item.order_id).values_list(
+        'created_at', 'shipping_state', 'status').first()
+    if order is None or order[2] == 'Cancelled':
+        return
+    created_at, state, _ = order
+    changes = [(values, sign) for values, sign in ((before, -1), (after, 1)) if values]
+    categories = dict(Product.objects.using(using).filter(
+        pk__in={values[0] for values, _ in changes}).values_list('pk', 'category'))
+    others = _other_items([item.order_id], [item.pk], using)
+    deltas = {}
+    for (product_id, quantity, subtotal), sign in changes:
+        row = (item.order_id, created_at, state, categories[product_id], subtotal, quantity)
+        for key, delta in rollup_deltas([row], others, sign).items():
+            deltas[key] = [a + b for a, b in zip(deltas.get(key, (0, 0, 0)), delta)]
+    apply_deltas({key: delta for key, delta in deltas.items() if any(delta)}, using)
+
+
+def record_order_items(order_id, sign, using=None):
+    """Add (sign=1) or remove (sign=-1) all items of an order, when it is un-cancelled or cancelled"""
+    rows = OrderItem.objects.using(using).filter(order_id=order_id).values_list(*ITEM_ROW_FIELDS)
+    apply_deltas(rollup_deltas(list(rows), sign=sign), using)
+
+
+# ============= REBUILD =============
+
+def day_start(day):
+    return datetime.datetime.combine(day, datetime.time.min, UTC)
+
+
+def rebuild(first_day, last_day, using=None):
+    """Recompute the rollups of the days `first_day` to `last_day` (UTC dates, inclusive); returns rows written"""
+    written = 0
+    day = first_day
+    while day <= last_day:
+        start, end = day_start(day), day_start(day + datetime.timedelta(days=1))
+        items = OrderItem.objects.using(using).filter(
+            order__created_at__gte=start, order__created_at__lt=end
+        ).exclude(order__status='Cancelled').annotate(hour=TruncHour('order__created_at', tzinfo=UTC))
+        rollups = []
+        for dimension, field in DIMENSIONS.items():
+            daily = {}
+            stats = items.values('hour', *filter(None, [field])).annotate(
+                revenue=Sum('subtotal'), units=Sum('quantity'), orders=Count('order_id', distinct=True)
+            ).order_by()
+            for row in stats:
+                value = row[field] if field else TOTAL
+                rollups.append(SalesRollup(period='hour', dimension=dimension, start=row['hour'], value=value,
+                                           revenue=row['revenue'], units=row['units'], orders=row['orders']))
+                # Every order falls in one hour, so hourly order counts add up to daily ones
+                totals = daily.setdefault(value, [Decimal('0.00'), 0, 0])
+                totals[0] += row['revenue']
+                totals[1] += row['units']
+                totals[2] += row['orders']
+            rollups += [SalesRollup(period='day', dimension=dimension, start=start, value=value,
+                                    revenue=revenue, units=units, orders=orders)
+                        for value, (revenue, units, orders) in daily.items()]
+        with transaction.atomic(using=using):
+            SalesRollup.objects.using(using).filter(start__gte=start, start__lt=end).delete()
+            SalesRollup.objects.using(using).bulk_create(rollups, batch_size=1000)
+        written += len(rollups)
+        day += datetime.timedelta(days=1)
+    return written
+
+
+# ============= DASHBOARD =============
+
+def _daily_matrix(dimension, first, days):
+    """(values, array of shape (3, len(values), days)): revenue, units and orders per value and day"""
+    rows = list(SalesRollup.objects.filter(
+        period='day', dimension=dimension, start__gte=first, start__lt=first + datetime.timedelta(days=days)
+    ).values_list('value', 'start', Cast('revenue', FloatField()), 'units', 'orders'))
+    values = sorted({row[0] for row in rows})
+    matrix = np.zeros((3, len(values), days))
+    if rows:
+        index = {value: i for i, value in enumerate(values)}
+        columns = np.array([(row[1] - first).days for row in rows])
+        lines = np.array([index[row[0]] for row in rows])
+        data = np.array([row[2:] for row in rows], dtype=float).T
+        for metric in range(3):
+            np.add.at(matrix[metric], (lines, columns), data[metric])
+    return values, matrix
+
+
+def _change(current, previous):
+    """Percentage change; None where there was nothing before"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+    return [None if np.isnan(c) else round(float(c), 1) for c in np.atleast_1d(change)]
+
+
+def dashboard(days=30, dimension='category', now=None):
+    """
+    Totals, daily series and a breakdown by `dimension` ('category' or
+    'state') for the last `days` days (today included), each compared with
+    the `days` before them.
+    """
+    now = now or timezone.now()
+    today = day_start(now.astimezone(UTC).date())
+    first = today - datetime.timedelta(days=2 * days - 1)
+
+    _, totals = _daily_matrix('total', first, 2 * days)
+    values, matrix = _daily_matrix(dimension, first, 2 * days)
+
+    daily = totals.sum(axis=1)  # (metric, day)
+    current, previous = daily[:, days:].sum(axis=1), daily[:, :days].sum(axis=1)
+    revenue = daily[0]
+    # Trailing average over the days so far, up to MOVING_AVERAGE_DAYS of them
+    cumulative = np.concatenate([[0.0], np.cumsum(revenue)])
+    window = np.minimum(np.arange(1, 2 * days + 1), MOVING_AVERAGE_DAYS)
+    moving = (cumulative[1:] - cumulative[np.arange(2 * days) + 1 - window]) / window
+    peak = max(revenue[days:].max(initial=0), 1)
+
+    breakdown_current, breakdown_previous = matrix[:, :, days:].sum(axis=2), matrix[:, :, :days].sum(axis=2)
+    order = np.argsort(-breakdown_current[0], kind='stable')
+    changes = _change(breakdown_current[0], breakdown_previous[0])
+    total_revenue = max(current[0], 1e-9)
+
+    hours = np.zeros(DASHBOARD_HOURS)
+    first_hour = now.astimezone(UTC).replace(minute=0, second=0, microsecond=0) - datetime.timedelta(
+        hours=DASHBOARD_HOURS - 1)
+    # Bounded above too: orders dated ahead of this clock (skew, backfills) fall outside the chart
+    hourly = SalesRollup.objects.filter(
+        period='hour', dimension='total', start__gte=first_hour,
+        start__lt=first_hour + datetime.timedelta(hours=DASHBOARD_HOURS),
+    ).values_list('start', Cast('revenue', FloatField()))
+    for start, amount in hourly:
+        hours[int((start - first_hour).total_seconds() // 3600)] += amount
+
+    return {
+        'days': days,
+        'dimension': dimension,
+        'totals': [
+            {'label': label, 'current': float(current[metric]), 'previous': float(previous[metric]),
+             'change': _change(current[metric], previous[metric])[0]}
+            for metric, label in enumerate(('Revenue', 'Units', 'Orders'))
+        ],
+        'daily': [
+            {'date': (first + datetime.timedelta(days=day)).date(), 'revenue': float(revenue[day]),
+             'orders': int(daily[2, day]), 'average': float(moving[day]),
+             'bar': round(float(revenue[day]) / peak * 100, 1)}
+            for day in range(2 * days - 1, days - 1, -1)
+        ],
+        'breakdown': [
+            {'value': values[i], 'revenue': float(breakdown_current[0, i]),
+             'previous': float(breakdown_previous[0, i]), 'change': changes[i],
+             'units': int(breakdown_current[1, i]), 'orders': int(breakdown_current[2, i]),
+             'share': round(float(breakdown_current[0, i]) / total_revenue * 100, 1)}
+            for i in order if breakdown_current[0, i] or breakdown_previous[0, i]
+        ],
+        'hours': [
+            {'start': first_hour + datetime.timedelta(hours=hour), 'revenue': float(hours[hour]),
+             'bar': round(float(hours[hour]) / max(hours.max(), 1) * 100, 1)}
+            for hour in range(DASHBOARD_HOURS)
+        ],
+        'hours_revenue': float(hours.sum()),
+    }
@@ -0,0 +1,271 @@
+"""
+Catalog full-text search.
+
+The backend is picked by settings.SEARCH_BACKEND (a dotted path) or, when that
+is unset, from the database vendor: SQLite FTS5 by default, Postgres tsvector
+in production. Backends are kept in sync by the Product signals in signals.py.
+
+The free-text columns the admin searches (review comments, diagnoses) have
+their own, simpler TextIndex at the bottom of this module.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Func, Lookup, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import PlantDiagnosis, Product, ProductSearchDocument, Review
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Split a user query into lowercase words, dropping FTS syntax characters"""
+    return WORD_RE.findall((query or '').lower())
+
+
+class SearchBackend:
+    """Interface every catalog search backend implements"""
+
+    def search(self, queryset, query):
+        """
+        Filter a Product queryset to the matches for `query`, annotated with
+        `search_rank` and ordered best match first.
+        """
+        raise NotImplementedError
+
+    def index_products(self, products):
+        """Add or refresh the given Product instances in the index"""
+
+    def remove_products(self, product_ids):
+        """Drop the given product ids from the index"""
+
+    def rebuild(self):
+        """Re-create the whole index from the product table"""
+
+
+class IcontainsSearchBackend(SearchBackend):
+    """Unindexed icontains scan, kept as a fallback and as a benchmark baseline"""
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) |
+                Q(description__icontains=term) |
+                Q(scientific_name__icontains=term)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+@TextField.register_lookup
+class FullTextMatch(Lookup):
+    """`column MATCH query` for SQLite FTS5 tables"""
+    lookup_name = 'fts_match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index stored in the botanical_product_fts virtual table"""
+    table = ProductSearchDocument._meta.db_table
+    # bm25 column weights: name, scientific_name, description, tags
+    weights = (10.0, 5.0, 1.0, 3.0)
+
+    def match_expression(self, query):
+        # Quote every word so user input can't inject FTS syntax; `*` keeps
+        # the prefix matching people got used to with icontains
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        rank = Func(
+            F('search_document__document'), *[Value(w) for w in self.weights],
+            function='bm25', output_field=FloatField(),
+        )
+        # bm25 scores are negative, lower is better
+        return queryset.filter(search_document__document__fts_match=match) \
+            .annotate(search_rank=rank).order_by('search_rank', 'id')
+
+    @staticmethod
+    def document(product):
+        return (
+            product.pk, product.name, product.scientific_name or '',
+            product.description, ' '.join(str(tag) for tag in product.tags or []),
+        )
+
+    def index_products(self, products):
+        rows = [self.document(product) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, scientific_name, description, tags) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            # Tags are stored as a JSON list; the tokenizer splits on the punctuation
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, scientific_name, description, tags) '
+                f"SELECT id, name, COALESCE(scientific_name, ''), description, tags "
+                f'FROM {Product._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Postgres tsvector search over a GIN expression index (see migration 0004).
+
+    The index is maintained by Postgres itself, so there is nothing to sync.
+    """
+    config = 'english'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (
+            SearchVector('name', weight='A', config=self.config) +
+            SearchVector('scientific_name', weight='A', config=self.config) +
+            SearchVector('description', weight='C', config=self.config)
+        )
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        search_query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms), search_type='raw', config=self.config
+        )
+        vector = self.vector()
+        # Negated so that, as with bm25, ascending order is best first
+        return queryset.annotate(search_vector=vector) \
+            .filter(search_vector=search_query) \
+            .annotate(search_rank=-SearchRank(vector, search_query)) \
+            .order_by('search_rank', 'id')
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend (one instance per process)"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = IcontainsSearchBackend()
+    return _backend
+
+
+def search_products(queryset, query):
+    """Filter and rank a Product queryset with the active search backend"""
+    return get_search_backend().search(queryset, query)
+
+
+# ============= ADMIN TEXT INDEXES =============
+
+class TextIndex:
+    """
+    Word-prefix index over some free-text columns of one model, for admin search.
+
+    On SQLite the columns are copied into an FTS5 table named after the model's
+    table (rowid = pk), kept in sync by signals.py; on Postgres a GIN expression
+    index over vector() does the work (both created by migration 0014). Other
+    databases fall back to icontains.
+    """
+    config = 'english'
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+        self.table = f'{model._meta.db_table}_fts'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector(*self.columns, config=self.config)
+
+    def matches(self, query):
+        """Q for the rows whose indexed columns contain every word of `query` (as a prefix)"""
+        terms = search_terms(query)
+        if not terms:
+            return Q(pk__in=[])
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{term}"*' for term in terms)
+            return Q(pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]))
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import SearchQuery
+            search_query = SearchQuery(
+                ' & '.join(f'{term}:*' for term in terms), search_type='raw', config=self.config
+            )
+            return Q(pk__in=self.model.objects.annotate(text_vector=self.vector())
+                     .filter(text_vector=search_query).values('pk'))
+        match = Q()
+        for term in terms:
+            any_column = Q()
+            for column in self.columns:
+                any_column |= Q(**{f'{column}__icontains': term})
+            match &= any_column
+        return match
+
+    def index(self, instances):
+        if connection.vendor != 'sqlite':
+            return
+        rows = [(instance.pk, *(getattr(instance, column) or '' for column in self.columns))
+                for instance in instances]
+        columns = ', '.join(self.columns)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, {columns}) VALUES (%s{", %s" * len(self.columns)})', rows
+            )
+
+    def remove(self, pks):
+        if connection.vendor != 'sqlite':
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in pks])
+
+    def rebuild(self):
+        if connection.vendor != 'sqlite':
+            return
+        columns = ', '.join(self.columns)
+        values = ', '.join(f"COALESCE({column}, '')" for column in self.columns)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, {columns}) '
+                f'SELECT id, {values} FROM {self.model._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+TEXT_INDEXES = {
+    Review: TextIndex(Review, ('comment',)),
+    PlantDiagnosis: TextIndex(PlantDiagnosis, ('diagnosis', 'recommendations')),
+}
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save
+import threading
+
+from django.db.models.signals import post_save, post_delete, post_init, pre_delete, pre_save
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.dispatch import receiver
-from .models import UserProfile
+from .models import Order, OrderItem, UserProfile, Product, Review, Wishlist, PlantDiagnosis, order_items_created
+from . import sales
+from .catalog import bump_catalog_version
+from .images import IMAGE_FIELDS, schedule_image
+from .search import TEXT_INDEXES, get_search_backend
+from .tags import sync_product_tags
+from .wishlists import update_cached_wishlist
 
 
 @receiver(post_save, sender=User)
@@ -16,3 +25,295 @@ def save_user_profile(sender, instance, **kwargs):
     """Save UserProfile when User is saved"""
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+
+# ============= PRODUCT RATING AGGREGATES =============
+
+def _apply_rating(product_id, rating, sign):
+    Product.objects.filter(pk=product_id).update(**Product.rating_delta(rating, sign))
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """Remember the stored (product, rating) so edits and deletes can be undone"""
+    if instance.pk is not None:
+        instance._stored_rating = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+    else:
+        instance._stored_rating = None
+
+
+@receiver(pre_save, sender=Review)
+def load_review_rating(sender, instance, raw, **kwargs):
+    """Fetch the stored rating when the instance was loaded with deferred fields"""
+    stored = instance._stored_rating
+    if raw or instance._state.adding or (stored and None not in stored):
+        return
+    instance._stored_rating = (
+        Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw, **kwargs):
+    """Add the new rating to the product aggregates, replacing the old one on edits"""
+    if raw:
+        return
+    stored = None if created else instance._stored_rating
+    current = (instance.product_id, instance.rating)
+    if stored != current:
+        if stored:
+            _apply_rating(*stored, sign=-1)
+        _apply_rating(*current, sign=1)
+    instance._stored_rating = current
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    """Remove a deleted review from the product aggregates"""
+    stored = instance._stored_rating or (instance.product_id, instance.rating)
+    _apply_rating(*stored, sign=-1)
+
+
+# ============= USER ORDER COUNTERS =============
+
+def _apply_order(stored, sign):
+    """Add (sign=1) or remove (sign=-1) an order stored as (user, status, final total)"""
+    user_id, status, final_total = stored
+    if status != 'Cancelled':
+        UserProfile.objects.filter(user_id=user_id).update(**UserProfile.order_delta(sign * final_total, sign))
+
+
+@receiver(post_init, sender=Order)
+def remember_order_counter(sender, instance, **kwargs):
+    """Remember what the stored order adds to its user's counters"""
+    if instance.pk is not None:
+        instance._stored_counter = tuple(instance.__dict__.get(f) for f in ('user_id', 'status', 'final_total'))
+    else:
+        instance._stored_counter = None
+
+
+@receiver(pre_save, sender=Order)
+def load_order_counter(sender, instance, raw, **kwargs):
+    """Fetch the stored values when the instance was loaded with deferred fields"""
+    stored = instance._stored_counter
+    if raw or instance._state.adding or (stored and None not in stored):
+        return
+    instance._stored_counter = (
+        Order.objects.filter(pk=instance.pk).values_list('user_id', 'status', 'final_total').first()
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_order_counters(sender, instance, created, raw, **kwargs):
+    """Count a new order, and move its total in or out when it is cancelled or edited"""
+    if raw:
+        return
+    current = (instance.user_id, instance.status, instance.final_total)
+    if created:
+        updates = {'last_order_at': instance.created_at}
+        if instance.status != 'Cancelled':
+            updates.update(UserProfile.order_delta(instance.final_total))
+        UserProfile.objects.filter(user_id=instance.user_id).update(**updates)
+    elif instance._stored_counter != current:
+        if instance._stored_counter:
+            _apply_order(instance._stored_counter, sign=-1)
+        _apply_order(current, sign=1)
+    instance._stored_counter = current
+
+
+@receiver(post_delete, sender=Order)
+def update_order_counters_on_delete(sender, instance, **kwargs):
+    _apply_order(instance._stored_counter or (instance.user_id, instance.status, instance.final_total), sign=-1)
+
+
+# ============= SALES ROLLUPS =============
+
+_deleting = threading.local()
+
+
+def _orders_being_deleted():
+    if not hasattr(_deleting, 'order_ids'):
+        _deleting.order_ids = set()
+    return _deleting.order_ids
+
+
+def _item_sale(instance):
+    return tuple(instance.__dict__.get(f) for f in ('product_id', 'quantity', 'subtotal'))
+
+
+@receiver(order_items_created)
+def roll_up_new_items(sender, items, new_orders, using, **kwargs):
+    sales.record_new_items(items, new_orders, using)
+
+
+@receiver(post_init, sender=OrderItem)
+def remember_item_sale(sender, instance, **kwargs):
+    instance._stored_sale = _item_sale(instance) if instance.pk is not None else None
+
+
+@receiver(pre_save, sender=OrderItem)
+def load_item_sale(sender, instance, raw, **kwargs):
+    """Fetch the stored values when the instance was loaded with deferred fields"""
+    stored = instance._stored_sale
+    if raw or instance._state.adding or (stored and None not in stored):
+        return
+    instance._stored_sale = (
+        OrderItem.objects.filter(pk=instance.pk).values_list('product_id', 'quantity', 'subtotal').first()
+    )
+
+
+@receiver(post_save, sender=OrderItem)
+def roll_up_item(sender, instance, created, raw, using, **kwargs):
+    """Add a new item to the rollups, or move an edited one's share"""
+    if raw:
+        return
+    stored = None if created else instance._stored_sale
+    current = _item_sale(instance)
+    if stored != current:
+        sales.record_item_change(instance, stored, current, using)
+    instance._stored_sale = current
+
+
+@receiver(post_delete, sender=OrderItem)
+def roll_up_item_deletion(sender, instance, using, **kwargs):
+    if instance.order_id not in _orders_being_deleted():
+        sales.record_item_change(instance, instance._stored_sale or _item_sale(instance), None, using)
+
+
+@receiver(pre_save, sender=Order)
+def roll_up_cancellation(sender, instance, raw, using, **kwargs):
+    """Take a cancelled order's items out of the rollups, or put them back when it is reinstated"""
+    stored = instance._stored_counter  # loaded by load_order_counter
+    if raw or instance._state.adding or not stored:
+        return
+    cancelled = instance.status == 'Cancelled'
+    if cancelled != (stored[1] == 'Cancelled'):
+        sales.record_order_items(instance.pk, -1 if cancelled else 1, using)
+
+
+@receiver(pre_delete, sender=Order)
+def roll_up_order_deletion(sender, instance, using, **kwargs):
+    """
+    Remove a deleted order's items in one go. They are deleted before their
+    post_delete signals run, so one at a time they would each look like the
+    order's last item.
+    """
+    status = Order.objects.using(using).filter(pk=instance.pk).values_list('status', flat=True).first()
+    if status and status != 'Cancelled':
+        sales.record_order_items(instance.pk, -1, using)
+    _orders_being_deleted().add(instance.pk)
+
+
+@receiver(post_delete, sender=Order)
+def forget_order_deletion(sender, instance, **kwargs):
+    _orders_being_deleted().discard(instance.pk)
+
+
+# ============= SEARCH INDEX =============
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Refresh the product in the full-text search index"""
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop a deleted product from the full-text search index"""
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=PlantDiagnosis)
+def index_admin_text(sender, instance, raw, **kwargs):
+    """Refresh the row in its admin search index"""
+    if not raw:
+        TEXT_INDEXES[sender].index([instance])
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=PlantDiagnosis)
+def unindex_admin_text(sender, instance, **kwargs):
+    """Drop a deleted row from its admin search index"""
+    TEXT_INDEXES[sender].remove([instance.pk])
+
+
+# ============= TAG INDEX =============
+
+@receiver(post_save, sender=Product)
+def index_product_tags(sender, instance, update_fields=None, **kwargs):
+    """Keep the ProductTag rows in line with Product.tags"""
+    if update_fields is None or 'tags' in update_fields:
+        sync_product_tags(instance)
+
+
+# ============= IMAGE DERIVATIVES =============
+
+def _image_name(instance, field_name):
+    value = instance.__dict__.get(field_name)
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=UserProfile)
+@receiver(post_init, sender=PlantDiagnosis)
+def remember_image_name(sender, instance, **kwargs):
+    instance._stored_image = _image_name(instance, IMAGE_FIELDS[sender._meta.label]) if instance.pk else ''
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=UserProfile)
+@receiver(pre_save, sender=PlantDiagnosis)
+def reset_image_renditions(sender, instance, raw, update_fields=None, **kwargs):
+    """A new upload starts without renditions until the pipeline has run"""
+    field_name = IMAGE_FIELDS[sender._meta.label]
+    instance._image_changed = (
+        not raw
+        and (update_fields is None or field_name in update_fields)
+        and _image_name(instance, field_name) != instance._stored_image
+    )
+    if instance._image_changed:
+        setattr(instance, f'{field_name}_hash', '')
+        setattr(instance, f'{field_name}_width', None)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=PlantDiagnosis)
+def queue_image_renditions(sender, instance, **kwargs):
+    field_name = IMAGE_FIELDS[sender._meta.label]
+    instance._stored_image = _image_name(instance, field_name)
+    if getattr(instance, '_image_changed', False) and instance._stored_image:
+        schedule_image(sender, instance.pk, field_name)
+
+
+# ============= WISHLIST CACHE =============
+
+@receiver(post_save, sender=Wishlist)
+def cache_wishlist_add(sender, instance, created, **kwargs):
+    if created:
+        user_id, product_id = instance.user_id, instance.product_id
+        transaction.on_commit(lambda: update_cached_wishlist(user_id, added=[product_id]))
+
+
+@receiver(post_delete, sender=Wishlist)
+def cache_wishlist_remove(sender, instance, **kwargs):
+    """Also runs for the rows a Product or User deletion cascades to"""
+    user_id, product_id = instance.user_id, instance.product_id
+    transaction.on_commit(lambda: update_cached_wishlist(user_id, removed=[product_id]))
+
+
+# ============= CATALOG VERSION =============
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def catalog_changed(sender, **kwargs):
+    """
+    Bump the catalog version so ETags and cached catalog data go stale.
+
+    Only once the change is committed: a version bumped earlier could be read
+    together with the old rows, and those cached under it until the next change.
+    """
+    transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,86 @@
+"""
+Inverted index over Product.tags.
+
+The JSON list on Product stays the source of truth; ProductTag holds one
+normalized row per (tag, product) so tag filters and tag counts are answered
+from the (tag, product) index instead of scanning JSON.
+"""
+from django.db.models import Count
+
+from .models import Product, ProductTag
+
+
+MAX_TAG_LENGTH = ProductTag._meta.get_field('tag').max_length
+
+
+def normalize_tag(tag):
+    return str(tag).strip().lower()[:MAX_TAG_LENGTH]
+
+
+def normalize_tags(tags):
+    """Distinct normalized tags of a JSON tags value, in their original order"""
+    if not isinstance(tags, (list, tuple)):
+        return []
+    return list(dict.fromkeys(filter(None, (normalize_tag(tag) for tag in tags))))
+
+
+def sync_product_tags(product):
+    """Bring the ProductTag rows of one product in line with its JSON tags"""
+    wanted = set(normalize_tags(product.tags))
+    existing = set(ProductTag.objects.filter(product=product).values_list('tag', flat=True))
+    if existing - wanted:
+        ProductTag.objects.filter(product=product, tag__in=existing - wanted).delete()
+    if wanted - existing:
+        ProductTag.objects.bulk_create(
+            [ProductTag(product=product, tag=tag) for tag in wanted - existing],
+            ignore_conflicts=True,
+        )
+
+
+def rebuild_tag_index(batch_size=2000):
+    """Re-create every ProductTag row from the JSON tags"""
+    ProductTag.objects.all().delete()
+    batch = []
+    for pk, tags in Product.objects.values_list('pk', 'tags').iterator(chunk_size=batch_size):
+        batch.extend(ProductTag(product_id=pk, tag=tag) for tag in normalize_tags(tags))
+        if len(batch) >= batch_size:
+            ProductTag.objects.bulk_create(batch)
+            batch = []
+    ProductTag.objects.bulk_create(batch)
+
+
+def reindex_product_tags(product_ids, batch_size=2000):
+    """Re-create the ProductTag rows of some products, `batch_size` products at a time"""
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        ProductTag.objects.filter(product_id__in=chunk).delete()
+        ProductTag.objects.bulk_create([
+            ProductTag(product_id=pk, tag=tag)
+            for pk, tags in Product.objects.filter(pk__in=chunk).values_list('pk', 'tags')
+            for tag in normalize_tags(tags)
+        ])
+
+
+def filter_by_tags(queryset, tags, match='any'):
+    """
+    Restrict a Product queryset to products carrying any (or all) of `tags`.
+
+    Both forms are a single `id IN (subquery)` over the tag index.
+    """
+    tags = normalize_tags(tags)
+    if not tags:
+        return queryset
+    rows = ProductTag.objects.filter(tag__in=tags)
+    if match == 'all' and len(tags) > 1:
+        rows = rows.values('product_id').annotate(matched=Count('tag')).filter(matched=len(tags))
+    return queryset.filter(pk__in=rows.values('product_id'))
+
+
+def tag_counts(queryset, limit=None):
+    """[(tag, count)] over the products of a queryset, most used first"""
+    counts = ProductTag.objects.filter(product__in=queryset.order_by().values('pk')) \
+        .values_list('tag').annotate(count=Count('product_id')).order_by('-count', 'tag')
+    if limit:
+        counts = counts[:limit]
+    return list(counts)
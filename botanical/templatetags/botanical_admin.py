@@ -0,0 +1,15 @@
+from django import template
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+
+from botanical.changelists import date_hierarchy
+
+
+register = template.Library()
+
+
+@register.tag(name='indexed_date_hierarchy')
+def indexed_date_hierarchy_tag(parser, token):
+    """{% indexed_date_hierarchy cl %}: Django's date_hierarchy, read with index seeks"""
+    return InclusionAdminNode(
+        parser, token, func=date_hierarchy, template_name='date_hierarchy.html', takes_context=False,
+    )
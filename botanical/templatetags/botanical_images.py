@@ -0,0 +1,17 @@
+from django import template
+
+from botanical.images import picture_html
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(src, sources=None, alt='', css_class='', sizes='100vw'):
+    """
+    Responsive image: {% picture url srcsets alt "css classes" "sizes" %}
+
+    `srcsets` is the {format: srcset} dict of a product's `imageSrcset` API
+    field or `Product.image_srcsets`; without it a plain <img> is emitted.
+    """
+    return picture_html(src, sources, alt, css_class, sizes)
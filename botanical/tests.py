@@ -1,7 +1,46 @@
-from django.test import TestCase, Client
+from django.contrib import admin
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from decimal import Decimal
-from .models import Product, UserProfile, Order, Review, Wishlist
+from io import BytesIO, StringIO
+import csv
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+from PIL import Image
+from .models import DiagnosisJob, DiagnosisResult, Newsletter, PlantDiagnosis, Product, ProductNeighbor, UserProfile, Order, OrderItem, Review, SalesRollup, Wishlist
+from .diagnosis import claim_job, enqueue_diagnosis, run_job, run_model
+from .diagnosis_backends import CircuitBreaker, DiagnosisUnavailable, GeminiBackend, StubBackend
+from .gemini_standin import StandInServer
+from django.core.files.storage import default_storage
+from .images import derivative_name, derivative_widths, process_image
+from .exports import export_as_csv, export_order_items_as_csv
+from .imports import ProductImporter
+from .checks import check_shared_cache
+from .catalog import PRODUCT_API_FIELDS, bump_catalog_version, catalog_snapshot, get_catalog_version
+from .pagination import CursorPaginator, InvalidCursor, encode_cursor
+from .ratelimit import acquire_slot, release_slot
+from .search import search_products
+from .tags import filter_by_tags
+from . import changelists
+from .order_numbers import SnowflakeGenerator, UlidGenerator, decode_base32
+from .sales import rebuild as rebuild_sales_rollups
+
+
+def streamed_json(response):
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return response.json()
 
 
 class ProductModelTest(TestCase):
@@ -74,3 +113,1345 @@ class ViewsTest(TestCase):
     def test_protected_page_requires_login(self):
         response = self.client.get('/account/')
         self.assertEqual(response.status_code, 302)  # Redirects to login
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class RatingAggregateTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Rated Plant', price=Decimal('10.00'), description='A plant', category='Plants'
+        )
+        self.alice = User.objects.create_user(username='alice', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+
+    def test_create_edit_delete_review(self):
+        review = Review.objects.create(product=self.product, user=self.alice, rating=4, comment='Nice')
+        Review.objects.create(product=self.product, user=self.bob, rating=2, comment='Meh')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 2)
+        self.assertEqual(self.product.average_rating, 3)
+        self.assertEqual(self.product.rating_histogram, [0, 1, 0, 1, 0])
+
+        review.rating = 5
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 7)
+        self.assertEqual(self.product.rating_histogram, [0, 1, 0, 0, 1])
+
+        review.delete()
+        self.bob.delete()  # cascades to the second review
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 0)
+        self.assertEqual(self.product.average_rating, 0)
+        self.assertEqual(self.product.rating_histogram, [0, 0, 0, 0, 0])
+
+    def test_recompute_ratings_command(self):
+        Review.objects.create(product=self.product, user=self.alice, rating=3, comment='Ok')
+        Product.objects.update(rating_sum=99, rating_count=9)
+        call_command('recompute_ratings', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (3, 1))
+        self.assertEqual(self.product.rating_histogram, [0, 0, 1, 0, 0])
+
+    def test_api_products_query_count_is_constant(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                product = Product.objects.create(
+                    name=f'Plant {i}', price=Decimal('5.00'), description='A plant', category='Plants'
+                )
+                Review.objects.create(product=product, user=self.alice, rating=5, comment='Great')
+        # One aggregate for the ETag, one for the rows
+        with self.assertNumQueries(2):
+            data = streamed_json(self.client.get('/api/products/'))
+        self.assertEqual(len(data), 6)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class SearchTest(TestCase):
+    def setUp(self):
+        self.monstera = Product.objects.create(
+            name='Monstera Deliciosa', scientific_name='Monstera deliciosa', price=Decimal('45.00'),
+            description='Statement plant with split leaves.', category='Plants'
+        )
+        self.pothos = Product.objects.create(
+            name='Pothos', price=Decimal('22.00'),
+            description='Trailing plant, a cousin of the monstera.', category='Plants'
+        )
+
+    def test_results_ranked_by_relevance(self):
+        results = search_products(Product.objects.all(), 'monstera')
+        self.assertEqual(list(results), [self.monstera, self.pothos])
+        self.assertEqual(list(search_products(Product.objects.all(), 'trail')), [self.pothos])
+        self.assertFalse(search_products(Product.objects.all(), '"*)('))
+
+    def test_index_follows_save_and_delete(self):
+        self.pothos.name = 'Golden Ivy'
+        self.pothos.description = 'Trailing plant.'
+        self.pothos.save()
+        self.assertEqual(list(search_products(Product.objects.all(), 'ivy')), [self.pothos])
+        self.assertEqual(list(search_products(Product.objects.all(), 'monstera')), [self.monstera])
+        self.monstera.delete()
+        self.assertFalse(search_products(Product.objects.all(), 'monstera').exists())
+
+    def test_home_and_api_use_search(self):
+        response = self.client.get('/', {'search': 'split leaves'})
+        self.assertEqual([p['id'] for p in response.context['products']], [self.monstera.id])
+        response = self.client.get('/api/products/', {'search': 'cousin'})
+        self.assertEqual([p['id'] for p in streamed_json(response)], [self.pothos.id])
+        data = self.client.get('/api/products/', {'search': 'monstera', 'limit': 1, 'fields': 'id'}).json()
+        self.assertEqual(data['results'], [{'id': self.monstera.id}])
+        data = self.client.get('/api/products/', {'search': 'monstera', 'cursor': data['next']}).json()
+        self.assertEqual([p['id'] for p in data['results']], [self.pothos.id])
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):  # the catalog version bumps
+            for i in range(7):
+                Product.objects.create(
+                    name=f'Plant {i}', price=Decimal('5.00'), description='A plant',
+                    category='Plants', featured=i % 3 == 0
+                )
+        self.expected = list(Product.objects.filter(is_active=True))
+
+    def test_walks_forwards_and_backwards(self):
+        paginator = CursorPaginator(Product.objects.filter(is_active=True), 3)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), self.expected)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(paginator.get_page(third.previous_cursor)), list(second))
+        self.assertEqual(list(paginator.get_page(second.previous_cursor)), list(first))
+
+    def test_forged_cursors_fall_back_to_the_first_page(self):
+        paginator = CursorPaginator(Product.objects.filter(is_active=True), 3)
+        forged = [encode_cursor(1), encode_cursor([1]), encode_cursor([{'id': 1}, None, 1]),
+                  encode_cursor([True, ['2026-01-01'], 1])]
+        for cursor in forged:
+            with self.assertRaises(InvalidCursor):
+                paginator.get_page(cursor)
+            self.assertEqual(list(paginator.get_page_or_first(cursor)), self.expected[:3])
+            self.assertEqual(self.client.get('/', {'cursor': cursor}).status_code, 200)
+            self.assertEqual(self.client.get('/api/products/', {'cursor': cursor, 'limit': 3}).status_code, 200)
+
+    def test_first_page_runs_no_count_query(self):
+        with self.assertNumQueries(1):
+            CursorPaginator(Product.objects.filter(is_active=True), 3).get_page()
+
+    def test_home_cursor_and_legacy_page_links(self):
+        response = self.client.get('/', {'category': 'Plants'})
+        self.assertEqual([p['id'] for p in response.context['products']], [p.id for p in self.expected])
+        self.assertIsNone(response.context['next_query'])
+        response = self.client.get('/', {'page': 1})
+        self.assertEqual(response.context['products'].number, 1)
+        response = self.client.get('/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_products_paginated_mode(self):
+        data = self.client.get('/api/products/', {'limit': 4}).json()
+        self.assertEqual([p['id'] for p in data['results']], [p.id for p in self.expected[:4]])
+        data = self.client.get('/api/products/', {'cursor': data['next'], 'limit': 4}).json()
+        self.assertEqual([p['id'] for p in data['results']], [p.id for p in self.expected[4:]])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+
+@override_settings(CATALOG_SNAPSHOT_MAX_PRODUCTS=0)
+class ProductApiStreamingTest(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Product.objects.create(
+                name=f'Plant {i}', price=Decimal('5.50'), description='A plant',
+                category='Plants', tags=['indoor'], image_url=f'https://example.com/{i}.jpg'
+            )
+
+    def test_streams_full_list(self):
+        response = self.client.get('/api/products/')
+        self.assertTrue(response.streaming)
+        data = streamed_json(response)
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]['price'], 5.5)
+        self.assertEqual(data[0]['image'], 'https://example.com/4.jpg')
+        self.assertEqual(set(data[0]), set(PRODUCT_API_FIELDS))
+
+    def test_fields_projection_skips_unneeded_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = streamed_json(self.client.get('/api/products/', {'fields': 'id,name'}))
+        self.assertEqual(set(data[0]), {'id', 'name'})
+        self.assertNotIn('description', queries[0]['sql'])
+        self.assertNotIn('tags', queries[0]['sql'])
+
+    def test_fields_in_paginated_mode_and_unknown_fields(self):
+        data = self.client.get('/api/products/', {'fields': 'name', 'limit': 2}).json()
+        self.assertEqual(data['results'], [{'name': 'Plant 4'}, {'name': 'Plant 3'}])
+        response = self.client.get('/api/products/', {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Fern', price=Decimal('12.00'), description='A fern', category='Plants'
+        )
+
+    def test_api_products_revalidation(self):
+        response = self.client.get('/api/products/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        other = self.client.get('/api/products/', {'category': 'Seeds'})
+        self.assertNotEqual(other['ETag'], etag)
+
+        user = User.objects.create_user(username='rater', password='testpass123')
+        Review.objects.create(product=self.product, user=user, rating=4, comment='Good')
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_bulk_action_invalidates(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'testpass123'))
+        self.client.post('/admin/botanical/product/', {
+            'action': 'mark_as_featured', '_selected_action': [self.product.pk],
+        })
+        self.assertNotEqual(self.client.get('/api/products/')['ETag'], etag)
+
+    def test_pages_revalidate_for_anonymous_users_only(self):
+        url = f'/product/{self.product.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etag = self.client.get('/')['ETag']
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        User.objects.create_user(username='shopper', password='testpass123')
+        self.client.login(username='shopper', password='testpass123')
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        self.fern = Product.objects.create(
+            name='Fern', price=Decimal('12.00'), description='A fern', category='Plants', featured=True
+        )
+        self.seeds = Product.objects.create(
+            name='Basil Seeds', price=Decimal('3.00'), description='Basil', category='Seeds'
+        )
+        bump_catalog_version()
+
+    def test_hits_until_catalog_changes(self):
+        misses = catalog_snapshot.misses
+        self.assertEqual([p['id'] for p in catalog_snapshot.products('Plants')], [self.fern.id])
+        hits = catalog_snapshot.hits
+        with self.assertNumQueries(0):
+            catalog_snapshot.products('Seeds')
+        self.assertEqual((catalog_snapshot.hits, catalog_snapshot.misses), (hits + 1, misses + 1))
+
+        self.seeds.category = 'Plants'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seeds.save()
+        self.assertEqual(len(catalog_snapshot.products('Plants')), 2)
+        self.assertEqual(catalog_snapshot.misses, misses + 2)
+
+    def test_version_moves_only_once_the_change_commits(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fern.price = Decimal('13.00')
+            self.fern.save()
+            self.assertEqual(get_catalog_version(), version)
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_pages_served_from_snapshot(self):
+        self.client.get('/', {'category': 'Plants'})  # warm up snapshot and facet cache
+        with self.assertNumQueries(1):  # only the ETag aggregate
+            response = self.client.get('/', {'category': 'Plants'})
+        self.assertEqual([p['id'] for p in response.context['products']], [self.fern.id])
+        self.assertEqual([p['id'] for p in response.context['featured_products']], [self.fern.id])
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/products/', {'category': 'Seeds'}).json()
+        self.assertEqual([p['name'] for p in data], ['Basil Seeds'])
+
+    def test_snapshot_pages_match_database_pages(self):
+        rows = catalog_snapshot.products('All')
+        from_list = CursorPaginator(rows, 1, model=Product)
+        from_db = CursorPaginator(Product.objects.filter(is_active=True), 1)
+        first = from_list.get_page()
+        self.assertEqual(first.next_cursor, from_db.get_page().next_cursor)
+        second = from_list.get_page(first.next_cursor)
+        self.assertEqual([p['id'] for p in second], [self.seeds.id])
+        self.assertEqual([p['id'] for p in from_list.get_page(second.previous_cursor)], [self.fern.id])
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get('/api/catalog/stats/').status_code, 302)
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'testpass123'))
+        stats = self.client.get('/api/catalog/stats/').json()
+        self.assertIn('hits', stats)
+        self.assertIn('misses', stats)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class TagIndexTest(TestCase):
+    def setUp(self):
+        self.fern = Product.objects.create(
+            name='Fern', price=Decimal('12.00'), description='A fern', category='Plants',
+            tags=['Indoor', 'low-light', 'indoor']
+        )
+        self.cactus = Product.objects.create(
+            name='Cactus', price=Decimal('8.00'), description='A cactus', category='Plants',
+            tags=['indoor', 'sunny']
+        )
+
+    def test_index_follows_json_tags(self):
+        self.assertEqual(sorted(self.fern.tag_index.values_list('tag', flat=True)), ['indoor', 'low-light'])
+        self.fern.tags = ['outdoor']
+        self.fern.save()
+        self.assertEqual(list(self.fern.tag_index.values_list('tag', flat=True)), ['outdoor'])
+
+    def test_any_and_all_filters(self):
+        products = Product.objects.all()
+        self.assertEqual(set(filter_by_tags(products, ['low-light', 'sunny'])), {self.fern, self.cactus})
+        self.assertEqual(list(filter_by_tags(products, ['INDOOR', 'sunny'], 'all')), [self.cactus])
+        with CaptureQueriesContext(connection) as queries:
+            list(filter_by_tags(products, ['indoor', 'sunny'], 'all'))
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JSON', queries[0]['sql'].upper())
+
+    def test_views_filter_by_tag(self):
+        response = self.client.get('/', {'tag': 'sunny'})
+        self.assertEqual([p['id'] for p in response.context['products']], [self.cactus.id])
+        data = streamed_json(self.client.get('/api/products/', {'tag': 'indoor,low-light', 'tag_match': 'all'}))
+        self.assertEqual([p['id'] for p in data], [self.fern.id])
+
+    def test_tag_facet_counts(self):
+        data = self.client.get('/api/products/tags/').json()
+        self.assertEqual(data['tags'][0], {'tag': 'indoor', 'count': 2})
+        self.assertEqual(len(data['tags']), 3)
+        data = self.client.get('/api/products/tags/', {'search': 'cactus'}).json()
+        self.assertEqual({t['tag'] for t in data['tags']}, {'indoor', 'sunny'})
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Fern', price=Decimal('12.00'), description='A fern', category='Plants', tags=['indoor']
+            )
+            Product.objects.create(
+                name='Cactus', price=Decimal('8.00'), description='A cactus', category='Plants',
+                tags=['indoor', 'sunny']
+            )
+            Product.objects.create(
+                name='Basil Seeds', price=Decimal('3.00'), description='Basil', category='Seeds', tags=['herb']
+            )
+
+    def test_counts_for_current_filters(self):
+        with self.assertNumQueries(3):  # ETag aggregate, facet aggregate, tag counts
+            data = self.client.get('/api/products/facets/', {'category': 'Plants'}).json()
+        categories = {facet['value']: facet['count'] for facet in data['categories']}
+        # Category counts ignore the category filter itself
+        self.assertEqual((data['total'], categories['Plants'], categories['Seeds']), (3, 2, 1))
+        self.assertEqual([bucket['count'] for bucket in data['price']], [1, 1, 0, 0, 0])
+        self.assertEqual(data['tags'], [{'tag': 'indoor', 'count': 2}, {'tag': 'sunny', 'count': 1}])
+
+        data = self.client.get('/api/products/facets/', {'tag': 'sunny'}).json()
+        self.assertEqual(data['total'], 1)
+
+    def test_cached_until_catalog_changes(self):
+        self.client.get('/api/products/facets/')
+        with self.assertNumQueries(1):  # the ETag aggregate only
+            self.client.get('/api/products/facets/', {'cursor': 'ignored'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Moss', price=Decimal('5.00'), description='Moss', category='Plants')
+        data = self.client.get('/api/products/facets/').json()
+        self.assertEqual(data['total'], 4)
+        response = self.client.get('/')
+        self.assertEqual(response.context['facets']['total'], 4)
+
+
+class RecommendationTest(TestCase):
+    def setUp(self):
+        self.fern, self.moss, self.cactus, self.seeds = [
+            Product.objects.create(name=name, price=Decimal('5.00'), description=name, category=category)
+            for name, category in [('Fern', 'Plants'), ('Moss', 'Plants'), ('Cactus', 'Plants'),
+                                   ('Basil Seeds', 'Seeds')]
+        ]
+        self.ann = User.objects.create_user(username='ann', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+        for user in (self.ann, self.bob):
+            Wishlist.objects.create(user=user, product=self.fern)
+            Wishlist.objects.create(user=user, product=self.seeds)
+        Review.objects.create(product=self.moss, user=self.ann, rating=5, comment='Lovely')
+
+    def neighbors(self, product):
+        return list(ProductNeighbor.objects.filter(product=product).values_list('neighbor_id', flat=True))
+
+    def test_neighbours_from_co_occurrence(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.neighbors(self.fern), [self.seeds.id, self.moss.id])
+        self.assertEqual(self.neighbors(self.cactus), [])
+
+        response = self.client.get(f'/product/{self.fern.id}/')
+        # Neighbours first, then topped up from the category
+        self.assertEqual([p['id'] for p in response.context['related_products']],
+                         [self.seeds.id, self.moss.id, self.cactus.id])
+
+    def test_incremental_run_rescores_changed_products(self):
+        call_command('build_recommendations', stdout=StringIO())
+        Wishlist.objects.create(user=self.bob, product=self.cactus)
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('Incremental run rescored 3 products', out.getvalue())
+        self.assertIn(self.cactus.id, self.neighbors(self.fern))
+        self.assertEqual(self.neighbors(self.moss), [self.fern.id, self.seeds.id])
+
+
+class WishlistCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()  # user ids are reused between tests
+        self.fern = Product.objects.create(name='Fern', price=Decimal('12.00'), description='A fern')
+        self.moss = Product.objects.create(name='Moss', price=Decimal('5.00'), description='Moss')
+        self.user = User.objects.create_user(username='ann', password='testpass123')
+        self.client.force_login(self.user)
+
+    def wishlist_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, [q for q in queries if 'botanical_wishlist' in q['sql']]
+
+    def test_warm_pages_run_no_wishlist_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Wishlist.objects.create(user=self.user, product=self.fern)
+        self.client.get('/')  # warm up
+        response, queries = self.wishlist_queries('/')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['wishlist_ids'], {self.fern.id})
+        response, queries = self.wishlist_queries(f'/product/{self.fern.id}/')
+        self.assertEqual(queries, [])
+        self.assertTrue(response.context['is_in_wishlist'])
+
+    def test_toggle_and_cascade_update_cached_set(self):
+        self.client.get('/')  # warm up
+        toggle = lambda product: self.client.post(
+            '/api/wishlist/toggle/', json.dumps({'product_id': product.id}), content_type='application/json'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle(self.fern)
+            toggle(self.moss)
+        response, queries = self.wishlist_queries('/')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['wishlist_ids'], {self.fern.id, self.moss.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle(self.fern)
+            self.moss.delete()
+        response, queries = self.wishlist_queries('/')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['wishlist_ids'], set())
+
+
+@override_settings(IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def upload(self, name='fern.png', size=(800, 600)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (40, 120, 60)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_renditions_generated_after_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Fern', price=Decimal('5.00'), description='Fern',
+                                             image=self.upload())
+        product.refresh_from_db()
+        self.assertEqual((len(product.image_hash), product.image_width), (64, 800))
+        self.assertEqual(list(product.image_srcsets), ['webp', 'jpeg'])
+        self.assertIn('/640.webp 640w', product.image_srcsets['webp'])
+        self.assertNotIn('1024w', product.image_srcsets['jpeg'])
+
+        response = self.client.get('/')
+        self.assertContains(response, '<source type="image/webp"')
+
+    def test_jpeg_drafted_to_the_largest_width_gets_every_rendition(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2048, 2048), (40, 120, 60)).save(buffer, 'JPEG')
+        upload = SimpleUploadedFile('big.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Fern', price=Decimal('5.00'), description='Fern', image=upload)
+        product.refresh_from_db()
+        self.assertIn('1024w', product.image_srcsets['jpeg'])
+        for width in derivative_widths(product.image_width):
+            for fmt in ('jpeg', 'webp'):
+                self.assertTrue(default_storage.exists(derivative_name(product.image_hash, width, fmt)))
+
+    def test_reupload_reuses_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Product.objects.create(name='Fern', price=Decimal('5.00'), description='Fern',
+                                           image=self.upload())
+            second = Product.objects.create(name='Fern copy', price=Decimal('5.00'), description='Fern',
+                                            image=self.upload('copy.png'))
+        self.assertEqual(process_image(Product, second.pk, 'image'), 0)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image_hash, second.image_hash)
+
+        second.image = self.upload('other.png', size=(300, 300))
+        second.save()
+        second.refresh_from_db()
+        self.assertEqual(second.image_hash, '')  # until the new upload is processed
+        out = StringIO()
+        call_command('build_image_derivatives', '--workers', '1', stdout=out)
+        self.assertIn('botanical.Product: 1 images, 2 renditions written', out.getvalue())
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class DiagnosisCacheTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        model = mock.patch('botanical.diagnosis.run_model', wraps=run_model)
+        self.run_model = model.start()
+        self.addCleanup(model.stop)
+
+    def photo(self, fmt='PNG', size=(400, 300), seed=1):
+        image = Image.linear_gradient('L').resize(size).convert('RGB')
+        image.paste((seed * 60 % 255, 90, 30), (size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2))
+        buffer = BytesIO()
+        image.save(buffer, fmt, quality=70) if fmt == 'JPEG' else image.save(buffer, fmt)
+        return SimpleUploadedFile(f'leaf.{fmt.lower()}', buffer.getvalue())
+
+    def diagnose(self, upload):
+        data = self.client.post('/api/diagnose-plant/', {'image': upload}).json()
+        if data['status'] == 'Queued':
+            call_command('run_diagnosis_worker', '--burst', '--concurrency', '1', stdout=StringIO())
+            data = self.client.get(data['statusUrl']).json()
+        return data
+
+    def test_same_photo_diagnosed_once(self):
+        self.assertFalse(self.diagnose(self.photo())['cached'])
+        self.assertTrue(self.diagnose(self.photo())['cached'])
+        self.assertEqual(self.run_model.call_count, 1)
+        first, second = PlantDiagnosis.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(DiagnosisResult.objects.get().hits, 1)
+
+    def test_near_duplicate_uses_cache(self):
+        self.diagnose(self.photo())
+        self.assertTrue(self.diagnose(self.photo('JPEG', size=(800, 600)))['cached'])
+        self.assertFalse(self.diagnose(self.photo(seed=3))['cached'])
+        self.assertEqual(self.run_model.call_count, 2)
+
+    @override_settings(DIAGNOSIS_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_evicted(self):
+        for seed in (1, 2, 3):
+            self.diagnose(self.photo(seed=seed, size=(400 + seed, 300)))
+        self.assertEqual(DiagnosisResult.objects.count(), 2)
+
+    def test_rejects_non_images(self):
+        response = self.client.post('/api/diagnose-plant/', {'image': SimpleUploadedFile('a.png', b'nope')})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class DiagnosisJobTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def upload(self, color=(40, 120, 60)):
+        image = Image.linear_gradient('L').convert('RGB')
+        image.paste(color, (64, 64, 192, 128))
+        buffer = BytesIO()
+        image.save(buffer, 'PNG')
+        return SimpleUploadedFile('leaf.png', buffer.getvalue())
+
+    def test_upload_is_queued_then_processed(self):
+        response = self.client.post('/api/diagnose-plant/', {'image': self.upload()})
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data['status'], data['position']), ('Queued', 1))
+
+        out = StringIO()
+        call_command('run_diagnosis_worker', '--burst', '--concurrency', '1', stdout=out)
+        self.assertIn('Processed 1 diagnosis jobs', out.getvalue())
+        data = self.client.get(data['statusUrl'], {'wait': 1}).json()
+        self.assertEqual(data['status'], 'Done')
+        self.assertFalse(data['cached'])
+        self.assertEqual(DiagnosisJob.objects.get().diagnosis.recommendations, data['recommendations'])
+
+    def test_long_poll_wait_is_capped(self):
+        job = enqueue_diagnosis(self.upload())
+        with mock.patch('botanical.views.wait_for_job', return_value=job) as wait_for_job:
+            self.client.get(f'/api/diagnose-plant/jobs/{job.pk}/', {'wait': 60})
+        wait_for_job.assert_called_once_with(job.pk, 3)
+
+    def test_failures_are_retried_then_reported(self):
+        job = enqueue_diagnosis(self.upload())
+        with mock.patch('botanical.diagnosis.run_model', side_effect=RuntimeError('model down')):
+            for attempt in range(3):
+                run_job(claim_job('test'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Failed', 3))
+        self.assertIsNone(claim_job('test'))
+        self.assertIn('error', self.client.get(f'/api/diagnose-plant/jobs/{job.id}/').json())
+
+    def test_jobs_are_private_to_their_user(self):
+        owner = User.objects.create_user(username='ann', password='testpass123')
+        job = enqueue_diagnosis(self.upload(), user=owner)
+        self.assertEqual(self.client.get(f'/api/diagnose-plant/jobs/{job.id}/').status_code, 404)
+        self.client.force_login(owner)
+        self.assertEqual(self.client.get(f'/api/diagnose-plant/jobs/{job.id}/').status_code, 200)
+
+    def test_stub_backend_latency(self):
+        backend = StubBackend(latency=0.05, jitter=0)
+        start = time.perf_counter()
+        self.assertIn('diagnosis', backend.diagnose(None))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+
+    @override_settings(DIAGNOSIS_MAX_QUEUED_JOBS=1)
+    def test_full_queue_refuses_uploads(self):
+        enqueue_diagnosis(self.upload())
+        response = self.client.post('/api/diagnose-plant/', {'image': self.upload((200, 0, 0))})
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '30'))
+        self.assertEqual(DiagnosisJob.objects.count(), 1)
+
+
+class GeminiBackendTest(TestCase):
+    def setUp(self):
+        self.server = StandInServer(latency=0)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.server.start()
+        gemini = self.settings(GEMINI_API_ENDPOINT=self.server.endpoint, GEMINI_API_KEY='stand-in',
+                               GEMINI_BACKOFF_BASE=0.01, GEMINI_MAX_RETRIES=2, GEMINI_CIRCUIT_THRESHOLD=2)
+        gemini.enable()
+        self.addCleanup(gemini.disable)
+
+    def test_retries_transient_errors(self):
+        backend = GeminiBackend()
+        self.assertFalse(backend.stats()['sdkLoaded'])  # nothing imported until the first call
+        self.server.fail_first = 2
+        answer = backend.diagnose(BytesIO(b'image'))
+        self.assertIn('healthy', answer['diagnosis'])
+        stats = backend.stats()
+        self.assertEqual((self.server.requests, stats['counts']['retries']), (3, 2))
+        self.assertTrue(stats['sdkLoaded'])
+
+    def test_circuit_opens_after_repeated_failures(self):
+        backend = GeminiBackend()
+        self.server.error_rate = 1.0
+        for attempt in range(2):
+            with self.assertRaises(Exception):
+                backend.diagnose(BytesIO(b'image'))
+        self.assertEqual(backend.stats()['circuit'], 'open')
+        requests = self.server.requests
+        with self.assertRaises(DiagnosisUnavailable):
+            backend.diagnose(BytesIO(b'image'))
+        self.assertEqual(self.server.requests, requests)
+
+    def test_circuit_half_opens_after_reset_timeout(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 11
+        self.assertTrue(breaker.allow())  # one trial call
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_only_the_trial_call_releases_the_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=lambda: now[0])
+        early = breaker.allow()  # let through while the circuit was still closed
+        breaker.record_failure()
+        breaker.record_failure()
+        now[0] = 11
+        trial = breaker.allow()
+        breaker.release(early)
+        self.assertFalse(breaker.allow())  # still one probe at a time
+        breaker.release(trial)
+        self.assertTrue(breaker.allow())
+
+    def test_slot_timeout_during_trial_releases_it(self):
+        now = [0.0]
+        backend = GeminiBackend()
+        backend.breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        backend.breaker.record_failure()
+        now[0] = 11
+        backend.timeout = 0.01
+        backend.slots.acquire = lambda timeout: False  # every slot taken
+        with self.assertRaises(DiagnosisUnavailable):
+            backend.diagnose(BytesIO(b'image'))  # the half-open trial, out of slots
+        self.assertEqual(backend.breaker.state, 'half-open')
+        del backend.slots.acquire
+        self.assertIn('healthy', backend.diagnose(BytesIO(b'image'))['diagnosis'])
+        self.assertEqual(backend.breaker.state, 'closed')
+
+
+class UploadLimitTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name, UPLOAD_IMAGE_MAX_DIMENSION=512)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def photo(self, size=(1200, 400), orientation=None):
+        image = Image.linear_gradient('L').resize(size).convert('RGB')
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneCo'  # camera make
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('leaf.jpeg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_large_photo_downscaled_upright_without_exif(self):
+        response = self.client.post('/api/diagnose-plant/', {'image': self.photo(orientation=6)})
+        self.assertEqual(response.status_code, 202)
+        with DiagnosisJob.objects.get().image.open('rb') as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (171, 512))  # rotated a quarter turn, long edge capped
+            self.assertFalse(image.getexif())
+
+    def test_small_photo_only_loses_exif(self):
+        self.client.post('/api/diagnose-plant/', {'image': self.photo(size=(300, 200))})
+        with DiagnosisJob.objects.get().image.open('rb') as stored, Image.open(stored) as image:
+            self.assertEqual((image.size, dict(image.getexif())), ((300, 200), {}))
+
+    def test_byte_and_pixel_limits(self):
+        with self.settings(UPLOAD_MAX_BYTES=1000):
+            response = self.client.post('/api/diagnose-plant/', {'image': self.photo()})
+        self.assertEqual((response.status_code, response.json()['error']), (413, 'Image too large'))
+        with self.settings(UPLOAD_MAX_IMAGE_PIXELS=1000):
+            response = self.client.post('/api/diagnose-plant/', {'image': self.photo()})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(DiagnosisJob.objects.exists())
+
+    def test_profile_picture_downscaled(self):
+        user = User.objects.create_user(username='ann', password='testpass123')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/account/', {'name': 'Ann', 'profile_picture': self.photo()})
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.profile_picture.width, profile.profile_picture.height), (512, 171))
+        self.assertEqual(User.objects.get(pk=user.pk).first_name, 'Ann')
+
+
+@override_settings(RATE_LIMIT_ENABLED=True)
+class RateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(RATE_LIMITS={'botanical:api_products': {'rate': '60/m', 'burst': 3}})
+    def test_bucket_refuses_after_burst_then_refills(self):
+        now = [1000.0]
+        with mock.patch('botanical.ratelimit.time.time', lambda: now[0]):
+            statuses = [self.client.get('/api/products/').status_code for _ in range(4)]
+            self.assertEqual(statuses, [200, 200, 200, 429])
+            response = self.client.get('/api/products/')
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(self.client.get('/api/products/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+            now[0] += 1
+            self.assertEqual(self.client.get('/api/products/').status_code, 200)
+            # Other routes have their own buckets
+            self.assertEqual(self.client.get('/api/products/tags/').status_code, 200)
+
+    @override_settings(RATE_LIMITS={'botanical:api_products': {'rate': '1/h'}})
+    def test_users_are_limited_separately_from_their_address(self):
+        self.assertEqual(self.client.get('/api/products/').status_code, 200)
+        self.assertEqual(self.client.get('/api/products/').status_code, 429)
+        self.client.force_login(User.objects.create_user(username='ann', password='testpass123'))
+        self.assertEqual(self.client.get('/api/products/').status_code, 200)
+        self.assertEqual(self.client.get('/').status_code, 200)  # pages are not limited
+
+    @override_settings(RATE_LIMITS={'botanical:api_products': {'rate': '1/h'}},
+                       RATE_LIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR', RATE_LIMIT_TRUSTED_PROXIES=1)
+    def test_forwarded_for_entries_sent_by_the_client_are_ignored(self):
+        get = lambda forwarded_for: self.client.get('/api/products/', HTTP_X_FORWARDED_FOR=forwarded_for)
+        self.assertEqual(get('203.0.113.7').status_code, 200)
+        self.assertEqual(get('198.51.100.1, 203.0.113.7').status_code, 429)
+        self.assertEqual(get('198.51.100.2, 203.0.113.7').status_code, 429)
+        self.assertEqual(get('203.0.113.7, 203.0.113.8').status_code, 200)
+
+    @override_settings(CONCURRENCY_LIMITS={'botanical:api_diagnose_plant': 2})
+    def test_concurrency_cap_sheds_load(self):
+        cache.set('ratelimit:slot:botanical:api_diagnose_plant:0', 1)
+        cache.set('ratelimit:slot:botanical:api_diagnose_plant:1', 1)
+        response = self.client.post('/api/diagnose-plant/')
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '2'))
+        cache.delete('ratelimit:slot:botanical:api_diagnose_plant:1')
+        self.assertEqual(self.client.post('/api/diagnose-plant/').status_code, 400)  # no image
+        self.assertIsNone(cache.get('ratelimit:slot:botanical:api_diagnose_plant:1'))  # released
+
+    def test_expired_slot_is_not_freed_for_its_new_holder(self):
+        slot = acquire_slot('route', 1)
+        cache.delete(slot[0])  # expired while its request ran long
+        taken = acquire_slot('route', 1)
+        release_slot(slot)
+        self.assertIsNone(acquire_slot('route', 1))
+        release_slot(taken)
+        self.assertIsNotNone(acquire_slot('route', 1))
+
+
+class SharedCacheCheckTest(TestCase):
+    def test_deploy_check_warns_about_per_process_cache(self):
+        self.assertEqual([w.id for w in check_shared_cache(None)], ['botanical.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ann', password='testpass123')
+        self.client.force_login(self.user)
+        UserProfile.objects.filter(user=self.user).update(
+            membership_tier='Silver', address='1 Fern Way', city='Leafton', state='GR', zip_code='12345'
+        )
+        self.fern = Product.objects.create(name='Fern', price=Decimal('12.50'), description='Fern',
+                                           category='Plants', stock_quantity=3)
+        self.pot = Product.objects.create(name='Pot', price=Decimal('8.00'), description='Pot',
+                                          category='Accessories', stock_quantity=10)
+
+    def add(self, product, quantity=1):
+        return self.client.post('/api/cart/add/', json.dumps({'product_id': product.pk, 'quantity': quantity}),
+                                content_type='application/json')
+
+    def test_checkout_creates_order_and_takes_stock(self):
+        self.add(self.fern, 2)
+        self.assertEqual(self.add(self.pot).json()['cart']['count'], 3)
+        response = self.client.post('/api/checkout/')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['total'], data['discount'], data['finalTotal']), (33.0, 3.3, 29.7))
+
+        order = Order.objects.get(order_number=data['order'])
+        self.assertEqual(order.shipping_city, 'Leafton')
+        self.assertEqual(sorted(order.items.values_list('product__name', 'quantity', 'subtotal')),
+                         [('Fern', 2, Decimal('25.00')), ('Pot', 1, Decimal('8.00'))])
+        self.fern.refresh_from_db()
+        self.assertEqual(self.fern.stock_quantity, 1)
+        self.assertEqual(self.client.get('/api/cart/').json()['count'], 0)
+
+    def test_short_stock_rolls_back_the_whole_order(self):
+        self.add(self.pot, 2)
+        self.add(self.fern, 4)
+        response = self.client.post('/api/checkout/')
+        self.assertEqual((response.status_code, response.json()['products']), (409, [self.fern.pk]))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.pot.pk).stock_quantity, 10)
+        self.assertEqual(self.client.get('/api/cart/').json()['count'], 6)  # the cart is kept
+
+    def test_empty_cart_and_quantity_validation(self):
+        self.assertEqual(self.client.post('/api/checkout/').status_code, 400)
+        self.assertEqual(self.add(self.fern, 0).status_code, 400)
+        self.add(self.fern, 2)
+        self.client.post('/api/cart/add/', json.dumps({'product_id': self.fern.pk, 'quantity': 0, 'set': True}),
+                         content_type='application/json')
+        self.assertEqual(self.client.get('/api/cart/').json()['lines'], [])
+
+
+class BulkOrderItemTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='testpass123')
+        self.fern = Product.objects.create(name='Fern', price=Decimal('12.50'), description='Fern',
+                                           category='Plants', stock_quantity=3)
+        self.pot = Product.objects.create(name='Pot', price=Decimal('8.00'), description='Pot',
+                                          category='Accessories', stock_quantity=10)
+
+    def test_subtotals_and_order_totals(self):
+        saved = Order.objects.create(user=self.user, total=0, discount=Decimal('1.00'), final_total=0)
+        new = Order(user=self.user)
+        items = OrderItem.objects.bulk_create_items([
+            OrderItem(order=saved, product=self.fern, quantity=2, price=self.fern.price),
+            OrderItem(order=new, product=self.fern, quantity=1, price=self.fern.price),
+            OrderItem(order=new, product=self.pot, quantity=3, price=self.pot.price),
+        ])
+        self.assertEqual([item.subtotal for item in items], [Decimal('25.00'), Decimal('12.50'), Decimal('24.00')])
+        self.assertTrue(new.pk and new.order_number)
+
+        saved.refresh_from_db()
+        self.assertEqual((saved.total, saved.discount, saved.final_total),
+                         (Decimal('25.00'), Decimal('1.00'), Decimal('24.00')))
+        new.refresh_from_db()
+        self.assertEqual((new.total, new.final_total), (Decimal('36.50'), Decimal('36.50')))
+        self.assertEqual(new.items.count(), 2)
+
+    def test_second_batch_adds_to_a_saved_order(self):
+        order = Order(user=self.user)
+        OrderItem.objects.bulk_create_items([OrderItem(order=order, product=self.pot, quantity=2, price=Decimal('10.00'))])
+        OrderItem.objects.bulk_create_items([OrderItem(order=order, product=self.fern, quantity=1, price=Decimal('10.00'))])
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.final_total), (Decimal('30.00'), Decimal('30.00')))
+        self.user.profile.refresh_from_db()
+        self.assertEqual((self.user.profile.order_count, self.user.profile.lifetime_spend), (1, Decimal('30.00')))
+
+    def test_membership_discount(self):
+        order = Order(user=self.user)
+        OrderItem.objects.bulk_create_items(
+            [OrderItem(order=order, product=self.fern, quantity=1, price=Decimal('9.99'))], discount_percentage=15
+        )
+        order.refresh_from_db()
+        self.assertEqual((order.discount, order.final_total), (Decimal('1.50'), Decimal('8.49')))
+
+
+class OrderNumberTest(TestCase):
+    def test_numbers_are_unique_and_time_ordered(self):
+        clock = iter([1_800_000_000_000] * 5000 + [1_800_000_000_001] * 10).__next__
+        generate = SnowflakeGenerator(worker_id=7, clock=clock)
+        numbers = [generate() for _ in range(5010)]
+        self.assertEqual(len(set(numbers)), 5010)
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual({len(number) for number in numbers}, {13})
+        # Worker id in bits 12-21, whatever the timestamp
+        self.assertEqual(decode_base32(numbers[0]) >> 12 & 1023, 7)
+
+        other = SnowflakeGenerator(worker_id=8, clock=lambda: 1_800_000_000_000)
+        self.assertNotIn(other(), numbers)
+
+        ulid = UlidGenerator(clock=lambda: 1_800_000_000_000)
+        numbers = [ulid() for _ in range(100)]
+        self.assertEqual(numbers, sorted(set(numbers)))
+
+    @override_settings(ORDER_NUMBER_GENERATOR='botanical.order_numbers.RandomGenerator')
+    def test_save_retries_a_taken_number(self):
+        user = User.objects.create_user(username='carl', password='testpass123')
+        Order.objects.create(user=user, order_number='TAKEN', total=1, final_total=1)
+        with mock.patch.object(Order, 'new_order_number', side_effect=['TAKEN', 'FRESH']):
+            order = Order.objects.create(user=user, total=1, final_total=1)
+        self.assertEqual(order.order_number, 'FRESH')
+        self.assertEqual(len(Order.objects.create(user=user, total=1, final_total=1).order_number), 10)
+
+
+class OrderHistoryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dora', password='testpass123')
+        self.fern = Product.objects.create(name='Fern', price=Decimal('12.50'), description='Fern',
+                                           category='Plants', stock_quantity=3)
+
+    def place(self, count, status='Processing'):
+        items = []
+        for _ in range(count):
+            order = Order(user=self.user, status=status)
+            items += [OrderItem(order=order, product=self.fern, quantity=quantity, price=self.fern.price)
+                      for quantity in (1, 2)]
+        OrderItem.objects.bulk_create_items(items)
+
+    def counters(self):
+        profile = UserProfile.objects.get(user=self.user)
+        return profile.order_count, profile.lifetime_spend
+
+    def test_counters_follow_orders(self):
+        order = Order.objects.create(user=self.user, total=20, final_total=20)
+        self.assertEqual(self.counters(), (1, Decimal('20.00')))
+        self.assertEqual(UserProfile.objects.get(user=self.user).last_order_at, order.created_at)
+
+        # A stale profile copy must not write old counters back
+        profile = self.user.profile
+        self.place(2)
+        profile.city = 'Leafton'
+        profile.save()
+        self.assertEqual(self.counters(), (3, Decimal('95.00')))
+
+        order.status = 'Cancelled'
+        order.save()
+        self.assertEqual(self.counters(), (2, Decimal('75.00')))
+        order.status = 'Shipped'
+        order.save()
+        self.assertEqual(self.counters(), (3, Decimal('95.00')))
+        Order.objects.get(pk=order.pk).delete()
+        self.assertEqual(self.counters(), (2, Decimal('75.00')))
+
+        UserProfile.objects.update(order_count=0, lifetime_spend=0)
+        call_command('recompute_order_counters', stdout=StringIO())
+        self.assertEqual(self.counters(), (2, Decimal('75.00')))
+
+    def test_orders_page_queries_do_not_grow_with_orders(self):
+        self.client.force_login(self.user)
+        self.place(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/orders/')
+        self.place(8)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/orders/')
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(response.context['orders']), 10)
+
+        self.place(1, status='Shipped')
+        response = self.client.get('/orders/?status=Shipped')
+        self.assertEqual([order.status for order in response.context['orders']], ['Shipped'])
+        with self.assertNumQueries(0):
+            self.assertEqual(response.context['profile'].order_count, 11)
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='erin', password='testpass123')
+        self.fern = Product.objects.create(name='Fern', price=Decimal('12.50'), description='Fern',
+                                           category='Plants', stock_quantity=3)
+        self.pot = Product.objects.create(name='Pot', price=Decimal('8.00'), description='Pot',
+                                          category='Accessories', stock_quantity=10)
+
+    def rollups(self):
+        return {
+            (r.period, r.dimension, r.start, r.value): (r.revenue, r.units, r.orders)
+            for r in SalesRollup.objects.all() if r.revenue or r.units or r.orders
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        today = timezone.now().date()
+        rebuild_sales_rollups(today, today)
+        self.assertEqual(incremental, self.rollups())
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        first, second = Order(user=self.user, shipping_state='GR'), Order(user=self.user, shipping_state='KA')
+        OrderItem.objects.bulk_create_items([
+            OrderItem(order=first, product=self.fern, quantity=2, price=self.fern.price),
+            OrderItem(order=first, product=self.pot, quantity=1, price=self.pot.price),
+            OrderItem(order=second, product=self.fern, quantity=1, price=self.fern.price),
+        ])
+        day = self.rollups()
+        self.assertIn(('day', 'category', timezone.now().replace(hour=0, minute=0, second=0, microsecond=0),
+                       'Plants'), day)
+        self.assertMatchesRebuild()
+
+        item = OrderItem.objects.create(order=second, product=self.pot, quantity=3, price=self.pot.price)
+        self.assertMatchesRebuild()
+        item.quantity = 1
+        item.product = self.fern
+        item.save()
+        self.assertMatchesRebuild()
+        OrderItem.objects.get(pk=item.pk).delete()
+        self.assertMatchesRebuild()
+
+        first.status = 'Cancelled'
+        first.save()
+        self.assertMatchesRebuild()
+        first.status = 'Processing'
+        first.save()
+        self.assertMatchesRebuild()
+        Order.objects.get(pk=first.pk).delete()
+        self.assertMatchesRebuild()
+
+    def test_dashboard(self):
+        order = Order(user=self.user, shipping_state='GR')
+        OrderItem.objects.bulk_create_items([OrderItem(order=order, product=self.fern, quantity=2,
+                                                       price=self.fern.price)])
+        self.client.force_login(self.user)
+        self.assertNotIn('sales', self.client.get('/sales/').context)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/sales/?days=7&by=state')
+        sales = response.context['sales']
+        self.assertEqual([t['current'] for t in sales['totals']], [25.0, 2, 1])
+        self.assertEqual(sales['breakdown'][0]['value'], 'GR')
+        self.assertEqual(sales['daily'][0]['revenue'], 25.0)
+        self.assertEqual(sum(hour['revenue'] for hour in sales['hours']), 25.0)
+        self.assertEqual(len([q for q in queries if 'botanical_salesrollup' in q['sql']]), 3)
+
+    def test_dashboard_ignores_future_dated_orders(self):
+        order = Order(user=self.user, shipping_state='GR')
+        OrderItem.objects.bulk_create_items([OrderItem(order=order, product=self.fern, quantity=1,
+                                                       price=self.fern.price)])
+        later = timezone.now() + datetime.timedelta(hours=3)
+        Order.objects.filter(pk=order.pk).update(created_at=later)
+        rebuild_sales_rollups(timezone.now().date(), later.date())
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.client.force_login(self.user)
+        response = self.client.get('/sales/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(hour['revenue'] for hour in response.context['sales']['hours']), 0)
+
+
+class AdminChangelistTest(TestCase):
+    CHANGELISTS = ['userprofile', 'product', 'review', 'wishlist', 'order', 'plantdiagnosis', 'diagnosisjob']
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'testpass123')
+        self.seeded = 0
+
+    def seed(self, count):
+        # bulk_create skips the signals, so profiles are created here too
+        rows = range(self.seeded, count)
+        users = User.objects.bulk_create([User(username=f'shopper{i}') for i in rows])
+        products = Product.objects.bulk_create([
+            Product(name=f'Plant {i}', price=Decimal('9.99'), description='A plant', category='Plants',
+                    rating_sum=4, rating_count=1, rating_4_count=1) for i in rows
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        Review.objects.bulk_create([Review(user=u, product=p, rating=4, comment='Good') for u, p in zip(users, products)])
+        Wishlist.objects.bulk_create([Wishlist(user=u, product=p) for u, p in zip(users, products)])
+        Order.objects.bulk_create([
+            Order(user=user, order_number=Order.new_order_number(), total=10, final_total=10) for user in users
+        ])
+        diagnoses = PlantDiagnosis.objects.bulk_create([
+            PlantDiagnosis(user=user, image='diagnoses/leaf.jpg', diagnosis='Healthy', recommendations='Water')
+            for user in users
+        ])
+        DiagnosisJob.objects.bulk_create([
+            DiagnosisJob(user=user, image='diagnoses/leaf.jpg', content_hash='0' * 64, diagnosis=diagnosis)
+            for user, diagnosis in zip(users, diagnoses)
+        ])
+        self.seeded = count
+
+    def changelist_queries(self):
+        cache.clear()  # the unfiltered counts are cached
+        counts = {}
+        for model in self.CHANGELISTS:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/admin/botanical/{model}/')
+            self.assertEqual(response.status_code, 200)
+            counts[model] = len(queries)
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(self.admin)
+        self.seed(10)
+        few = self.changelist_queries()
+        self.seed(1000)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_actions_report_updated_rows(self):
+        self.seed(3)
+        order_admin = admin.site._registry[Order]
+        queryset = Order.objects.filter(pk__in=list(Order.objects.values_list('pk', flat=True)[:2]))
+        with mock.patch.object(order_admin, 'message_user') as message_user, self.assertNumQueries(1):
+            order_admin.mark_as_shipped(None, queryset)
+        message_user.assert_called_once_with(None, '2 orders marked as shipped.')
+        self.assertEqual(Order.objects.filter(status='Shipped').count(), 2)
+
+    def test_actions_leave_cancelled_orders_alone(self):
+        self.seed(3)
+        order_admin = admin.site._registry[Order]
+        cancelled = Order.objects.first()
+        Order.objects.filter(pk=cancelled.pk).update(status='Cancelled')
+        with mock.patch.object(order_admin, 'message_user') as message_user:
+            order_admin.mark_as_shipped(None, Order.objects.all())
+            order_admin.mark_as_delivered(None, Order.objects.all())
+        self.assertEqual([c.args[1] for c in message_user.call_args_list],
+                         ['2 orders marked as shipped.', '2 orders marked as delivered.'])
+        cancelled.refresh_from_db()
+        self.assertEqual((cancelled.status, cancelled.delivered_at), ('Cancelled', None))
+
+
+class LargeTableAdminTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@example.com', 'testpass123'))
+        self.user = User.objects.create_user(username='dora', email='dora@example.com', password='testpass123')
+        self.fern = Product.objects.create(name='Boston Fern', price=Decimal('12.50'), description='Fern',
+                                           category='Plants')
+
+    def changelist(self, model, **params):
+        response = self.client.get(f'/admin/botanical/{model}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def results(self, model, **params):
+        return list(self.changelist(model, **params).context['cl'].result_list)
+
+    def test_search_goes_through_indexes(self):
+        order = Order.objects.create(user=self.user, total=10, final_total=10, tracking_number='TRK42')
+        Order.objects.create(user=User.objects.create_user(username='other'), total=10, final_total=10)
+        self.assertEqual(self.results('order', q=order.order_number.lower()), [order])
+        self.assertEqual(self.results('order', q='TRK42'), [order])
+        self.assertEqual(self.results('order', q='dora@example'), [order])
+
+        review = Review.objects.create(product=self.fern, user=self.user, rating=4, comment='Lovely fronds')
+        self.assertEqual(self.results('review', q='frond'), [review])
+        self.assertEqual(self.results('review', q='boston'), [review])
+        review.comment = 'Wilted'
+        review.save()
+        self.assertEqual(self.results('review', q='frond'), [])
+
+        diagnosis = PlantDiagnosis.objects.create(user=None, image='diagnoses/leaf.jpg', diagnosis='Root rot',
+                                                  recommendations='Water less')
+        self.assertEqual(self.results('plantdiagnosis', q='"water les"'), [diagnosis])
+        diagnosis.delete()
+        self.assertEqual(self.results('plantdiagnosis', q='rot'), [])
+
+    def test_other_admins_keep_the_stock_date_hierarchy(self):
+        Newsletter.objects.create(email='fern@example.com', name='Fern')
+        with mock.patch.object(admin.site._registry[Newsletter], 'date_hierarchy', 'subscribed_at', create=True):
+            self.assertContains(self.changelist('newsletter'), 'class="toplinks"')
+
+    def test_counts_filters_and_date_hierarchy(self):
+        dates = [datetime.datetime(2025, 12, 30, 12, tzinfo=datetime.timezone.utc),
+                 datetime.datetime(2026, 1, 5, 9, tzinfo=datetime.timezone.utc),
+                 datetime.datetime(2026, 1, 5, 18, tzinfo=datetime.timezone.utc),
+                 datetime.datetime(2026, 3, 1, 0, tzinfo=datetime.timezone.utc)]
+        for created, state in zip(dates, ['GR', 'KA', 'KA', 'TN']):
+            order = Order.objects.create(user=self.user, total=10, final_total=10, shipping_state=state)
+            Order.objects.filter(pk=order.pk).update(created_at=created)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(changelists.period_starts(Order.objects.all(), 'created_at', kind),
+                             list(Order.objects.datetimes('created_at', kind)))
+
+        response = self.changelist('order')
+        self.assertContains(response, '?created_at__year=2026')
+        self.assertContains(response, '?shipping_state=TN')
+        response = self.changelist('order', created_at__year=2026, created_at__month=1)
+        self.assertContains(response, 'created_at__day=5')
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+        # Unfiltered lists past the limit show the (here stale) statistics estimate
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Order.objects.create(user=self.user, total=10, final_total=10)
+        with self.settings(ADMIN_EXACT_COUNT_LIMIT=2):
+            self.assertEqual(self.changelist('order').context['cl'].result_count, 4)
+            self.assertEqual(self.changelist('order', shipping_state='KA').context['cl'].result_count, 2)
+        cache.clear()
+        self.assertEqual(self.changelist('order').context['cl'].result_count, 5)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dora', email='dora@example.com', password='testpass123')
+        self.fern = Product.objects.create(name='Boston Fern', price=Decimal('12.50'), description='Fern',
+                                           category='Plants')
+        self.orders = []
+        for day in (1, 2, 3):
+            order = Order.objects.create(user=self.user, total=25, final_total=25, shipping_state='KA')
+            OrderItem.objects.create(order=order, product=self.fern, quantity=2, price=Decimal('12.50'),
+                                     subtotal=Decimal('25.00'))
+            Order.objects.filter(pk=order.pk).update(
+                created_at=datetime.datetime(2026, 3, day, 12, tzinfo=datetime.timezone.utc))
+            self.orders.append(order)
+
+    def test_command_streams_a_date_range(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'items.jsonl.gz')
+        call_command('export_data', 'order_items', '--format', 'jsonl', '--gzip', '--output', path,
+                     '--start', '2026-03-02', '--end', '2026-03-03', '--chunk-size', '1', stdout=StringIO())
+        with gzip.open(path, 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['order_number'] for row in rows], [o.order_number for o in self.orders[1:]])
+        self.assertEqual(rows[0]['product'], 'Boston Fern')
+        self.assertEqual(rows[0]['subtotal'], '25.00')
+
+    def test_admin_actions_stream_in_one_query(self):
+        request = RequestFactory().post('/admin/botanical/order/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = export_as_csv(None, request, Order.objects.all())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        with self.assertNumQueries(1):
+            body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([row['username'] for row in rows], ['dora'] * 3)
+
+        request = RequestFactory().post('/admin/botanical/order/')
+        response = export_order_items_as_csv(None, request, Order.objects.filter(pk=self.orders[0].pk))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['order_number'] for row in rows], [self.orders[0].order_number])
+
+    def test_diagnoses_export(self):
+        PlantDiagnosis.objects.create(user=self.user, image='diagnoses/leaf.jpg', diagnosis='Root rot',
+                                      recommendations='Water less')
+        PlantDiagnosis.objects.create(user=None, image='diagnoses/moss.jpg', diagnosis='Healthy',
+                                      recommendations='Carry on')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'diagnoses.jsonl')
+        call_command('export_data', 'diagnoses', '--format', 'jsonl', '--output', path, stdout=StringIO())
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([(row['username'], row['diagnosis'], row['image']) for row in rows],
+                         [('dora', 'Root rot', 'diagnoses/leaf.jpg'), (None, 'Healthy', 'diagnoses/moss.jpg')])
+
+        self.assertIn(export_as_csv, admin.site._registry[PlantDiagnosis].actions)
+        request = RequestFactory().post('/admin/botanical/plantdiagnosis/')
+        response = export_as_csv(None, request, PlantDiagnosis.objects.all())
+        self.assertIn('attachment; filename="diagnoses-', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['recommendations'] for row in rows], ['Carry on', 'Water less'])
+
+
+class ProductImportTest(TestCase):
+    FEED = (
+        'sku,name,scientific_name,price,category,description,tags,stock_quantity\n'
+        'FERN-1,Boston Fern,Nephrolepis exaltata,12.5,plants,Arching fronds,"indoor, shade",10\n'
+        'IVY-1,English Ivy,Hedera helix,8.00,Plants,Trailing vine,trailing,4\n'
+        'BAD-1,Mystery,,free,Plants,,,1\n'
+        'BAD-2,Mystery,,NaN,Plants,,,1\n'
+    )
+
+    def import_feed(self, feed, *args, suffix='.csv'):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, f'feed{suffix}')
+        with open(path, 'w') as f:
+            f.write(feed)
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_products', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_upserts_by_sku_and_skips_unchanged_rows(self):
+        version = get_catalog_version()
+        out, err = self.import_feed(self.FEED)
+        self.assertIn('2 created, 0 updated, 0 unchanged, 2 invalid', out)
+        self.assertIn("line 4: price 'free' is not a number", err)
+        self.assertIn("line 5: price 'NaN' is not a number", err)
+        fern = Product.objects.get(sku='FERN-1')
+        self.assertEqual((fern.price, fern.category, fern.tags), (Decimal('12.50'), 'Plants', ['indoor', 'shade']))
+        # The indexes the Product signals keep are refreshed once at the end
+        self.assertEqual(list(search_products(Product.objects.all(), 'nephrolepis')), [fern])
+        self.assertEqual(list(filter_by_tags(Product.objects.all(), ['shade'])), [fern])
+        self.assertNotEqual(get_catalog_version(), version)
+
+        version = get_catalog_version()
+        with self.assertNumQueries(3):  # the batch lookup, inside a savepoint
+            out, err = self.import_feed(self.FEED)
+        self.assertIn('0 created, 0 updated, 2 unchanged', out)
+        self.assertEqual(get_catalog_version(), version)
+
+        feed = '\n'.join([json.dumps({'sku': 'FERN-1', 'name': 'Boston Fern', 'price': '14.00', 'tags': ['outdoor']}),
+                          json.dumps({'sku': 'IVY-1', 'name': 'English Ivy', 'price': 8})])
+        out, err = self.import_feed(feed, suffix='.jsonl')
+        self.assertIn('0 created, 1 updated, 1 unchanged', out)
+        fern.refresh_from_db()
+        self.assertEqual((fern.price, fern.description, fern.stock_quantity), (Decimal('14.00'), 'Arching fronds', 10))
+        self.assertEqual(list(filter_by_tags(Product.objects.all(), ['shade'])), [])
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_indexes_refreshed_when_an_import_fails_part_way(self):
+        def rows():
+            yield 2, {'sku': 'FERN-1', 'name': 'Boston Fern', 'price': '12.50', 'category': 'Plants', 'tags': 'shade'}
+            raise OSError('feed connection dropped')
+        version = get_catalog_version()
+        with self.assertRaises(OSError), self.captureOnCommitCallbacks(execute=True):
+            ProductImporter(batch_size=1).run(rows())
+        fern = Product.objects.get(sku='FERN-1')
+        self.assertEqual(list(filter_by_tags(Product.objects.all(), ['shade'])), [fern])
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_name_key_updates_products_made_by_hand(self):
+        ivy = Product.objects.create(name='English Ivy', scientific_name='Hedera helix', price=Decimal('7.00'),
+                                     description='Vine', category='Plants')
+        out, err = self.import_feed(self.FEED, '--key', 'name', '--batch-size', '1')
+        self.assertIn('1 created, 1 updated, 0 unchanged, 2 invalid', out)
+        ivy.refresh_from_db()
+        self.assertEqual((ivy.sku, ivy.price, ivy.tags), ('IVY-1', Decimal('8.00'), ['trailing']))
+        self.assertEqual(list(search_products(Product.objects.all(), 'trailing')), [ivy])
@@ -0,0 +1,139 @@
+"""
+Limits and normalisation for uploaded images.
+
+LimitedUploadHandler runs ahead of Django's memory/temporary-file handlers
+and drops any file over settings.UPLOAD_MAX_BYTES while it streams in, so
+an oversized upload is discarded chunk by chunk instead of being spooled to
+disk first; views find the rejected field names in `request.rejected_uploads`.
+
+prepare_image() then checks the pixel dimensions from the image header and
+re-encodes photos that are larger than UPLOAD_IMAGE_MAX_DIMENSION or carry
+EXIF metadata: they are turned upright, downscaled and saved without EXIF.
+Decoding a large photo is the memory-hungry step, so it runs on a small
+thread pool (UPLOAD_IMAGE_WORKERS) that caps how many are decoded at once.
+"""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Pillow format -> (file extension, save options) for re-encoded uploads
+OUTPUT_FORMATS = {
+    'JPEG': ('jpg', {'quality': 85, 'optimize': True}),
+    'PNG': ('png', {'optimize': True}),
+    'WEBP': ('webp', {'quality': 85}),
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(InvalidImage):
+    pass
+
+
+def max_upload_bytes():
+    return getattr(settings, 'UPLOAD_MAX_BYTES', 50 * 1024 * 1024)
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Skip uploaded files over settings.UPLOAD_MAX_BYTES, noting them on the request"""
+
+    def _reject(self):
+        if self.request is not None:
+            if not hasattr(self.request, 'rejected_uploads'):
+                self.request.rejected_uploads = set()
+            self.request.rejected_uploads.add(self.field_name)
+        raise SkipFile
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        # The part's declared length, when the client sent one
+        if self.content_length is not None and self.content_length > max_upload_bytes():
+            self._reject()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > max_upload_bytes():
+            self._reject()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def upload_rejected(request, field_name):
+    """True if LimitedUploadHandler dropped `field_name` from this request"""
+    request.FILES  # the body is parsed on first access
+    return field_name in getattr(request, 'rejected_uploads', ())
+
+
+def normalize_image(upload):
+    """
+    An upright, EXIF-free copy of an uploaded image no larger than
+    UPLOAD_IMAGE_MAX_DIMENSION pixels on its long edge, or the upload itself
+    when it already is one.
+
+    Raises InvalidImage for unreadable files and ImageTooLarge for images
+    over UPLOAD_MAX_IMAGE_PIXELS.
+    """
+    max_dimension = getattr(settings, 'UPLOAD_IMAGE_MAX_DIMENSION', 2048)
+    max_pixels = getattr(settings, 'UPLOAD_MAX_IMAGE_PIXELS', 100_000_000)
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            # Opening only reads the header; refuse decompression bombs before decoding
+            if image.width * image.height > max_pixels:
+                raise ImageTooLarge(f'{image.width}x{image.height} pixels')
+            too_big = max(image.size) > max_dimension
+            if not too_big and (not image.getexif() or getattr(image, 'is_animated', False)):
+                # Nothing to strip, or an animation better kept whole
+                return upload
+            pil_format = image.format if image.format in OUTPUT_FORMATS else 'JPEG'
+            if too_big:
+                # Let the JPEG decoder downscale by a power of two first, and
+                # shrink before rotating so only the small copy is turned
+                image.draft('RGB', (max_dimension, max_dimension))
+                image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            upright = ImageOps.exif_transpose(image)
+            if pil_format == 'JPEG' and upright.mode not in ('RGB', 'L'):
+                upright = upright.convert('RGB')
+            ext, options = OUTPUT_FORMATS[pil_format]
+            buffer = io.BytesIO()
+            # Saved without exif=, so the EXIF block (camera, GPS) is dropped;
+            # the colour profile is kept
+            upright.save(buffer, pil_format, icc_profile=image.info.get('icc_profile'), **options)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+    finally:
+        upload.seek(0)
+    name = os.path.splitext(os.path.basename(upload.name or 'image'))[0]
+    return ContentFile(buffer.getvalue(), name=f'{name}.{ext}')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'UPLOAD_IMAGE_WORKERS', 2),
+                thread_name_prefix='upload-images',
+            )
+        return _executor
+
+
+def prepare_image(upload):
+    """normalize_image() on the upload pool, waiting for the result"""
+    if not getattr(settings, 'UPLOAD_NORMALIZE_IMAGES', True):
+        return upload
+    return _get_executor().submit(normalize_image, upload).result()
@@ -21,9 +21,16 @@ urlpatterns = [
     
     # API Endpoints
     path('api/products/', views.api_products, name='api_products'),
+    path('api/products/tags/', views.api_product_tags, name='api_product_tags'),
+    path('api/products/facets/', views.api_product_facets, name='api_product_facets'),
+    path('api/catalog/stats/', views.api_catalog_cache_stats, name='api_catalog_cache_stats'),
     path('api/wishlist/toggle/', views.api_wishlist_toggle, name='api_wishlist_toggle'),
+    path('api/cart/', views.api_cart, name='api_cart'),
     path('api/cart/add/', views.api_cart_add, name='api_cart_add'),
+    path('api/checkout/', views.api_checkout, name='api_checkout'),
     path('api/diagnose-plant/', views.api_diagnose_plant, name='api_diagnose_plant'),
+    path('api/diagnose-plant/jobs/<uuid:job_id>/', views.api_diagnosis_job, name='api_diagnosis_job'),
+    path('api/diagnose-plant/stats/', views.api_diagnosis_backend_stats, name='api_diagnosis_backend_stats'),
     path('api/newsletter/subscribe/', views.api_newsletter_subscribe, name='api_newsletter_subscribe'),
     path('api/profile/update/', views.api_profile_update, name='api_profile_update'),
 ]
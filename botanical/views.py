@@ -1,25 +1,118 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Avg
+from django.db.models import Prefetch, Q, Count, Avg
 import json
 import os
 
 from .models import (
     Product, UserProfile, Order, OrderItem, 
-    Review, Wishlist, PlantDiagnosis, Newsletter,
-    MembershipPlan, MembershipPurchase
+    Review, Wishlist, PlantDiagnosis, Newsletter, DiagnosisJob,
+    MembershipPlan, MembershipPurchase, SalesRollup
 )
+from .catalog import (
+    PRODUCT_API_FIELDS, InvalidFields, catalog_snapshot, catalog_validators, get_catalog_version,
+    make_etag, paginate_products, parse_fields, product_values, serialize_products, serialize_row,
+    stream_products_json, version_datetime
+)
+from .checkout import (
+    CheckoutError, OutOfStock, add_to_cart, cart_summary, clear_cart, get_cart, place_order, set_cart_quantity
+)
+from .diagnosis import enqueue_diagnosis, queue_is_full, wait_for_job
+from .diagnosis_backends import get_diagnosis_backend
+from .facets import cached_catalog_facets
+from .pagination import CursorPaginator, page_querystrings
+from .sales import dashboard as sales_dashboard
+from .search import search_products
+from .tags import filter_by_tags, tag_counts
+from .uploads import ImageTooLarge, InvalidImage, prepare_image, upload_rejected
+from .wishlists import wishlist_product_ids
+
+
+# ============= CONDITIONAL GET =============
+
+def _requested_tags(request):
+    """Tags from ?tag=a&tag=b (or ?tag=a,b)"""
+    return [tag for value in request.GET.getlist('tag') for tag in value.split(',') if tag.strip()]
+
+
+def _catalog_queryset(request, by_category=True):
+    """Active products filtered by the request's category, tag and search parameters"""
+    category = request.GET.get('category', 'All')
+    search_query = request.GET.get('search', '')
+    tags = _requested_tags(request)
+    
+    products = Product.objects.filter(is_active=True)
+    if by_category and category != 'All':
+        products = products.filter(category=category)
+    if tags:
+        products = filter_by_tags(products, tags, request.GET.get('tag_match', 'any'))
+    if search_query:
+        products = search_products(products, search_query)
+    return products
+
+
+def _catalog_validators(request):
+    """ETag and Last-Modified of a catalog listing, computed once per request"""
+    if not hasattr(request, '_catalog_validators'):
+        request._catalog_validators = catalog_validators(_catalog_queryset(request), request.GET)
+    return request._catalog_validators
+
+
+def _catalog_facets(request):
+    """Sidebar facet counts for the request's filters, from the facet cache"""
+    return cached_catalog_facets(
+        _catalog_queryset(request, by_category=False), request.GET.get('category', 'All'), request.GET
+    )
+
+
+def _product_validators(request, pk):
+    """ETag and Last-Modified of a product page from its updated_at and the catalog version"""
+    if not hasattr(request, '_product_validators'):
+        updated_at = Product.objects.filter(pk=pk, is_active=True) \
+            .values_list('updated_at', flat=True).first()
+        validators = (None, None)
+        if updated_at is not None:
+            version = get_catalog_version()
+            validators = (make_etag(version, pk, updated_at.isoformat()),
+                          max(updated_at, version_datetime(version)))
+        request._product_validators = validators
+    return request._product_validators
+
+
+def _is_shared_page(request):
+    # Pages carrying per-user content (account links, wishlist hearts, flash
+    # messages) are always rendered
+    return not request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def _home_etag(request):
+    return _catalog_validators(request)[0] if _is_shared_page(request) else None
+
+
+def _home_last_modified(request):
+    return _catalog_validators(request)[1] if _is_shared_page(request) else None
+
+
+def _product_etag(request, pk):
+    return _product_validators(request, pk)[0] if _is_shared_page(request) else None
+
+
+def _product_last_modified(request, pk):
+    return _product_validators(request, pk)[1] if _is_shared_page(request) else None
 
 
 # ============= PAGE VIEWS =============
 
+@condition(etag_func=_home_etag, last_modified_func=_home_last_modified)
 def home(request):
     """Homepage with product listing"""
     # Get filter parameters
@@ -27,56 +120,68 @@ def home(request):
     search_query = request.GET.get('search', '')
     
     # Filter products
-    products = Product.objects.filter(is_active=True)
-
-    if category != 'All':
-        products = products.filter(category=category)
-
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(scientific_name__icontains=search_query)
-        )
+    products = _catalog_queryset(request)
+    current_tags = _requested_tags(request)
+    # Unfiltered listings are served from the in-process catalog snapshot
+    snapshot = None if search_query or current_tags else catalog_snapshot.products(category)
 
     # Get featured products
-    featured_products = Product.objects.filter(is_active=True, featured=True)[:6]
+    all_products = catalog_snapshot.products('All')
+    if all_products is not None:
+        featured_products = [p for p in all_products if p['featured']][:6]
+    else:
+        featured_products = serialize_products(Product.objects.filter(is_active=True, featured=True)[:6])
     # Get user wishlist
-    wishlist_ids = []
-    if request.user.is_authenticated:
-        wishlist_ids = list(request.user.wishlist_items.values_list('product_id', flat=True))
+    wishlist_ids = wishlist_product_ids(request.user)
     
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination: keyset cursors, with ?page= links still served by offset
+    cursor = request.GET.get('cursor')
+    if 'page' in request.GET:
+        page_obj = Paginator(product_values(products, PRODUCT_API_FIELDS), 12).get_page(request.GET.get('page'))
+        page_obj.object_list = [serialize_row(row, PRODUCT_API_FIELDS) for row in page_obj.object_list]
+    elif snapshot is not None:
+        page_obj = CursorPaginator(snapshot, 12, model=Product).get_page_or_first(cursor)
+    else:
+        page_obj = paginate_products(products, 12, cursor)
+    previous_query, next_query = page_querystrings(request, page_obj)
     
     context = {
         'products': page_obj,
+        'previous_query': previous_query,
+        'next_query': next_query,
         'featured_products': featured_products,
         'categories': Product.CATEGORY_CHOICES,
+        'facets': _catalog_facets(request),
         'current_category': category,
         'search_query': search_query,
+        'current_tags': current_tags,
         'wishlist_ids': wishlist_ids,
     }
     return render(request, 'botanical/home.html', context)
 
 
+@condition(etag_func=_product_etag, last_modified_func=_product_last_modified)
 def product_detail(request, pk):
     """Individual product detail page"""
     product = get_object_or_404(Product, pk=pk, is_active=True)
     reviews = product.reviews.all()[:10]
-    related_products = Product.objects.filter(
-        category=product.category,
+    # Precomputed co-occurrence neighbours (build_recommendations), topped up
+    # from the same category for products with too little behavioural data
+    related_products = serialize_products(Product.objects.filter(
+        neighbor_of__product=product,
         is_active=True
-    ).exclude(pk=pk)[:4]
+    ).order_by('neighbor_of__rank')[:4])
+    if len(related_products) < 4:
+        seen = {product.pk} | {p['id'] for p in related_products}
+        same_category = catalog_snapshot.products(product.category)
+        if same_category is None:
+            same_category = serialize_products(Product.objects.filter(
+                category=product.category,
+                is_active=True
+            ).exclude(pk__in=seen)[:4])
+        related_products += [p for p in same_category if p['id'] not in seen][:4 - len(related_products)]
     
-    is_in_wishlist = False
-    if request.user.is_authenticated:
-        is_in_wishlist = Wishlist.objects.filter(
-            user=request.user,
-            product=product
-        ).exists()
+    is_in_wishlist = product.pk in wishlist_product_ids(request.user)
     
     context = {
         'product': product,
@@ -255,19 +360,49 @@ def about_us(request):
 @login_required
 def orders(request):
     """User orders page"""
-    user_orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    status = request.GET.get('status')
+    user_orders = Order.objects.filter(user=request.user)
+    if status in dict(Order.STATUS_CHOICES):
+        user_orders = user_orders.filter(status=status)
+    else:
+        status = None
+    # One query for the page, one for the items of all its orders with their products
+    items = OrderItem.objects.select_related('product').only(
+        'order_id', 'quantity', 'subtotal', 'product__name'
+    ).order_by('pk')
+    user_orders = user_orders.prefetch_related(Prefetch('items', queryset=items)).order_by('-created_at', '-id')
+    page_obj = CursorPaginator(user_orders, 10).get_page_or_first(request.GET.get('cursor'))
+    previous_query, next_query = page_querystrings(request, page_obj)
     
     context = {
-        'orders': user_orders,
+        'orders': page_obj,
+        'previous_query': previous_query,
+        'next_query': next_query,
+        'status': status,
+        'status_choices': Order.STATUS_CHOICES,
+        'profile': request.user.profile,
     }
     return render(request, 'botanical/orders.html', context)
 
 
+SALES_DASHBOARD_DAYS = ('7', '30', '90')
+
+
 @login_required
 def sales(request):
-    """Sales dashboard for sellers"""
-    # This is a placeholder - you can extend it based on your needs
-    context = {}
+    """Sales dashboard, read from the sales rollups (staff only; others see the seller sign-up note)"""
+    if not request.user.is_staff:
+        return render(request, 'botanical/sales.html', {})
+    days = request.GET.get('days')
+    days = int(days) if days in SALES_DASHBOARD_DAYS else 30
+    breakdowns = [(value, label) for value, label in SalesRollup.DIMENSION_CHOICES if value != 'total']
+    dimension = request.GET.get('by')
+    dimension = dimension if dimension in dict(breakdowns) else 'category'
+    context = {
+        'sales': sales_dashboard(days, dimension),
+        'day_choices': [int(d) for d in SALES_DASHBOARD_DAYS],
+        'dimension_choices': breakdowns,
+    }
     return render(request, 'botanical/sales.html', context)
 
 
@@ -278,6 +413,17 @@ def account(request):
     wishlist_items = Wishlist.objects.filter(user=request.user)
     
     if request.method == 'POST':
+        picture = None
+        try:
+            if upload_rejected(request, 'profile_picture'):
+                raise ImageTooLarge
+            if 'profile_picture' in request.FILES:
+                picture = prepare_image(request.FILES['profile_picture'])
+        except InvalidImage as e:
+            messages.error(request, 'That picture is too large to upload.' if isinstance(e, ImageTooLarge)
+                           else 'That file is not a picture we can read.')
+            return redirect('botanical:account')
+
         # Update profile
         request.user.first_name = request.POST.get('name', request.user.first_name)
         request.user.email = request.POST.get('email', request.user.email)
@@ -289,8 +435,8 @@ def account(request):
         profile.state = request.POST.get('state', profile.state)
         profile.zip_code = request.POST.get('zip_code', profile.zip_code)
         
-        if 'profile_picture' in request.FILES:
-            profile.profile_picture = request.FILES['profile_picture']
+        if picture is not None:
+            profile.profile_picture = picture
         
         profile.save()
         messages.success(request, 'Profile updated successfully!')
@@ -305,29 +451,87 @@ def account(request):
 
 # ============= API ENDPOINTS =============
 
+API_PAGE_SIZE = 24
+API_MAX_PAGE_SIZE = 100
+
+
+def _api_products_etag(request):
+    return _catalog_validators(request)[0]
+
+
+def _api_products_last_modified(request):
+    return _catalog_validators(request)[1]
+
+
 @csrf_exempt
+@condition(etag_func=_api_products_etag, last_modified_func=_api_products_last_modified)
 def api_products(request):
-    """API endpoint to get products"""
-    category = request.GET.get('category', 'All')
+    """
+    API endpoint to get products.
+
+    `fields=id,name,...` limits the keys returned (and the columns loaded).
+    Passing `limit` or `cursor` switches to paginated mode, which returns
+    {"results": [...], "next": cursor, "previous": cursor}; otherwise the whole
+    list is served from the catalog snapshot, or streamed when the catalog is
+    too large to snapshot. Responses carry an ETag and Last-Modified, and a poll
+    with a matching If-None-Match costs one aggregate query and returns 304.
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        return JsonResponse({'error': f'Unknown fields: {e}'}, status=400)
     
-    products = Product.objects.filter(is_active=True)
-    if category != 'All':
-        products = products.filter(category=category)
+    products = _catalog_queryset(request)
     
-    data = [{
-        'id': p.id,
-        'name': p.name,
-        'scientificName': p.scientific_name,
-        'price': float(p.price),
-        'image': p.get_image_url,
-        'description': p.description,
-        'category': p.category,
-        'tags': p.tags,
-        'rating': p.average_rating,
-        'reviews': p.review_count,
-    } for p in products]
+    if 'limit' in request.GET or 'cursor' in request.GET:
+        try:
+            limit = min(max(int(request.GET.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid limit'}, status=400)
+        page = paginate_products(products, limit, request.GET.get('cursor'), fields)
+        return JsonResponse({
+            'results': page.object_list,
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+    
+    if not request.GET.get('search') and not _requested_tags(request):
+        body = catalog_snapshot.products_json(request.GET.get('category', 'All'), fields)
+        if body is not None:
+            return HttpResponse(body, content_type='application/json')
     
-    return JsonResponse(data, safe=False)
+    return StreamingHttpResponse(stream_products_json(products, fields), content_type='application/json')
+
+
+@csrf_exempt
+@condition(etag_func=_api_products_etag, last_modified_func=_api_products_last_modified)
+def api_product_tags(request):
+    """Tag facet counts for the products matching the catalog filters"""
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    counts = tag_counts(_catalog_queryset(request), limit=min(max(limit, 1), 500))
+    return JsonResponse({'tags': [{'tag': tag, 'count': count} for tag, count in counts]})
+
+
+@csrf_exempt
+@condition(etag_func=_api_products_etag, last_modified_func=_api_products_last_modified)
+def api_product_facets(request):
+    """Category, tag and price bucket counts for the products matching the catalog filters"""
+    return JsonResponse(_catalog_facets(request))
+
+
+@staff_member_required
+def api_catalog_cache_stats(request):
+    """Hit/miss counters of this worker's catalog snapshot"""
+    return JsonResponse(catalog_snapshot.stats())
+
+
+@staff_member_required
+def api_diagnosis_backend_stats(request):
+    """Call counts, latency and circuit state of this process's diagnosis backend"""
+    return JsonResponse(get_diagnosis_backend().stats())
 
 
 @csrf_exempt
@@ -353,58 +557,177 @@ def api_wishlist_toggle(request):
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+def _cart_data(request):
+    summary = cart_summary(get_cart(request.session), request.user.profile.discount_percentage)
+    for line in summary['lines']:
+        line['price'], line['subtotal'] = float(line['price']), float(line['subtotal'])
+    return {
+        'lines': summary['lines'],
+        'count': sum(line['quantity'] for line in summary['lines']),
+        'total': float(summary['total']),
+        'discount': float(summary['discount']),
+        'finalTotal': float(summary['finalTotal']),
+    }
+
+
+def _quantity(value, minimum):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity >= minimum else None
+
+
+@login_required
+def api_cart(request):
+    """The session cart with current prices and the member's discount"""
+    return JsonResponse(_cart_data(request))
+
+
 @csrf_exempt
 @login_required
 def api_cart_add(request):
-    """API endpoint to add to cart (placeholder)"""
+    """Add a product to the session cart, or with "set": true set its quantity (0 removes it)"""
     if request.method == 'POST':
-        data = json.loads(request.body)
-        product_id = data.get('product_id')
-        quantity = data.get('quantity', 1)
-        
-        # This is a simplified version
-        # You would typically store cart in session or database
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        replace = bool(data.get('set'))
+        quantity = _quantity(data.get('quantity', 1), 0 if replace else 1)
+        if quantity is None:
+            return JsonResponse({'error': 'Invalid quantity'}, status=400)
+        product = get_object_or_404(Product, pk=data.get('product_id'), is_active=True)
+        
+        if replace:
+            set_cart_quantity(request.session, product.pk, quantity)
+        else:
+            quantity = add_to_cart(request.session, product.pk, quantity)
         
-        return JsonResponse({'status': 'added', 'quantity': quantity})
+        return JsonResponse({'status': 'added', 'quantity': quantity, 'cart': _cart_data(request)})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+SHIPPING_FIELDS = {
+    'shipping_address': 'address',
+    'shipping_city': 'city',
+    'shipping_state': 'state',
+    'shipping_zip': 'zip_code',
+}
+
+
+@csrf_exempt
+@login_required
+def api_checkout(request):
+    """
+    Place an order for the session cart.
+
+    Shipping fields come as JSON or form data and default to the address on
+    the user's profile. Answers
+    201 with the order, or 409 naming the products that ran out of stock.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    data = request.POST
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or '{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    profile = request.user.profile
+    shipping = {field: data.get(field) or getattr(profile, attr) or '' for field, attr in SHIPPING_FIELDS.items()}
+    missing = [field for field, value in shipping.items() if not value]
+    if missing:
+        return JsonResponse({'error': 'Missing shipping details', 'fields': missing}, status=400)
+    
+    try:
+        order = place_order(request.user, get_cart(request.session), shipping)
+    except OutOfStock as e:
+        return JsonResponse({'error': 'Out of stock', 'products': e.product_ids}, status=409)
+    except CheckoutError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    clear_cart(request.session)
+    return JsonResponse({
+        'order': order.order_number,
+        'total': float(order.total),
+        'discount': float(order.discount),
+        'finalTotal': float(order.final_total),
+    }, status=201)
+
+
 @csrf_exempt
 def api_diagnose_plant(request):
-    """API endpoint for plant diagnosis using Gemini AI"""
+    """
+    Queue a plant photo for diagnosis.
+
+    Photos already diagnosed (or near-duplicates of one) are answered at once;
+    others return 202 with a job to poll at the status URL.
+    """
     if request.method == 'POST':
+        if upload_rejected(request, 'image'):
+            return JsonResponse({'error': 'Image too large'}, status=413)
         if 'image' not in request.FILES:
             return JsonResponse({'error': 'No image provided'}, status=400)
-        
-        image = request.FILES['image']
-        
-        # Save diagnosis record
-        diagnosis = PlantDiagnosis.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            image=image,
-            diagnosis='Analyzing plant health...',
-            recommendations='Please wait while we analyze the image.'
-        )
-        
-        # Here you would integrate with Gemini API
-        # For now, returning a placeholder response
-        
-        response_data = {
-            'diagnosis': 'Your plant appears to be healthy with some minor issues.',
-            'recommendations': 'Ensure adequate watering and sunlight. Consider using organic fertilizer.',
-        }
-        
-        # Update the diagnosis
-        diagnosis.diagnosis = response_data['diagnosis']
-        diagnosis.recommendations = response_data['recommendations']
-        diagnosis.save()
-        
-        return JsonResponse(response_data)
+        if queue_is_full():
+            response = JsonResponse({'error': 'Plant Doctor is busy. Please try again shortly.'}, status=503)
+            response['Retry-After'] = '30'
+            return response
+        
+        try:
+            job = enqueue_diagnosis(
+                prepare_image(request.FILES['image']),
+                user=request.user if request.user.is_authenticated else None,
+            )
+        except ImageTooLarge:
+            return JsonResponse({'error': 'Image too large'}, status=413)
+        except InvalidImage:
+            return JsonResponse({'error': 'Invalid image'}, status=400)
+        
+        return JsonResponse(_job_data(job), status=200 if job.is_finished else 202)
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+def _job_data(job):
+    data = {
+        'job': str(job.id),
+        'status': job.status,
+        'statusUrl': reverse('botanical:api_diagnosis_job', args=[job.id]),
+    }
+    if job.status == 'Done':
+        data.update({
+            'diagnosis': job.diagnosis.diagnosis,
+            'recommendations': job.diagnosis.recommendations,
+            'cached': job.cached,
+        })
+    elif job.status == 'Failed':
+        data['error'] = 'Diagnosis failed. Please try again.'
+    elif job.status == 'Queued':
+        data['position'] = DiagnosisJob.objects.filter(status='Queued', created_at__lt=job.created_at).count() + 1
+    return data
+
+
+# A long-poll holds a worker process for its whole wait, so keep it short:
+# clients simply ask again until the job has finished
+DIAGNOSIS_MAX_WAIT = 3
+
+
+def api_diagnosis_job(request, job_id):
+    """Status of a diagnosis job; ?wait=N long-polls up to N seconds for it to finish"""
+    job = get_object_or_404(DiagnosisJob, pk=job_id)
+    if job.user_id is not None and job.user_id != request.user.id:
+        raise Http404
+    try:
+        wait = min(max(float(request.GET.get('wait', 0)), 0), DIAGNOSIS_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid wait'}, status=400)
+    if wait and not job.is_finished:
+        job = wait_for_job(job.pk, wait)
+    return JsonResponse(_job_data(job))
+
+
 @csrf_exempt
 def api_newsletter_subscribe(request):
     """API endpoint for newsletter subscription"""
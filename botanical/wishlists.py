@@ -0,0 +1,38 @@
+"""
+Per-user cache of wishlisted product ids.
+
+Catalog pages only need to know which products get a filled heart, so each
+user's wishlist is cached as a frozenset of product ids. The Wishlist signals
+add and remove ids in place once the change commits (toggle API, admin, and
+cascades from Product or User deletion alike) instead of dropping the entry.
+"""
+from django.core.cache import cache
+
+from .models import Wishlist
+
+
+WISHLIST_CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(user_id):
+    return f'wishlist:{user_id}'
+
+
+def wishlist_product_ids(user):
+    """Frozenset of the product ids on `user`'s wishlist (empty for anonymous users)"""
+    if not user.is_authenticated:
+        return frozenset()
+    key = _cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Wishlist.objects.filter(user=user).values_list('product_id', flat=True))
+        cache.set(key, ids, WISHLIST_CACHE_TIMEOUT)
+    return ids
+
+
+def update_cached_wishlist(user_id, added=(), removed=()):
+    """Apply a change to a cached wishlist set; nothing to do if it is not cached"""
+    key = _cache_key(user_id)
+    ids = cache.get(key)
+    if ids is not None:
+        cache.set(key, (ids | frozenset(added)) - frozenset(removed), WISHLIST_CACHE_TIMEOUT)
@@ -33,6 +33,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'botanical.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,11 +58,109 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Cache
+# The catalog version key and the rate-limit buckets live here, so every
+# worker process must share it: set REDIS_URL (and pip install redis) in
+# production. The per-process LocMemCache fallback only suits a single
+# development server; `manage.py check --deploy` warns about it (botanical.W001).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Largest catalog each worker keeps as an in-process snapshot (botanical/catalog.py)
+CATALOG_SNAPSHOT_MAX_PRODUCTS = 20000
+
+# Image renditions (botanical/images.py) are built on a thread pool after upload
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# API rate limits (botanical/ratelimit.py): a token bucket per client and route,
+# refilling at `rate` and holding `burst` requests, kept in the default cache.
+# Behind a proxy set RATE_LIMIT_IP_HEADER = 'HTTP_X_FORWARDED_FOR' and
+# RATE_LIMIT_TRUSTED_PROXIES to the number of proxies in front of Django that
+# append to it: the client is the address the outermost of them added.
+# Test classes that send many API requests from one address turn it off with
+# override_settings(RATE_LIMIT_ENABLED=False).
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE = 'default'
+RATE_LIMIT_IP_HEADER = None
+RATE_LIMIT_TRUSTED_PROXIES = 1
+RATE_LIMITS = {
+    'botanical:api_products': {'rate': '120/m', 'burst': 60},
+    'botanical:api_diagnose_plant': {'rate': '20/h', 'burst': 5},
+    'botanical:api_diagnosis_job': {'rate': '120/m', 'burst': 30},
+    'botanical:api_newsletter_subscribe': {'rate': '5/h', 'burst': 3},
+}
+RATE_LIMIT_DEFAULT = {'rate': '300/m', 'burst': 100}
+# Requests to these routes running at once, across all processes; more get 503
+CONCURRENCY_LIMITS = {
+    'botanical:api_diagnose_plant': 8,
+}
+CONCURRENCY_SLOT_TIMEOUT = 60
+CONCURRENCY_RETRY_AFTER = 2
+
+# Upload limits (botanical/uploads.py). Files over UPLOAD_MAX_BYTES are dropped
+# while they stream in; photos larger than UPLOAD_IMAGE_MAX_DIMENSION pixels on
+# the long edge are downscaled, and EXIF is stripped, before they are stored.
+FILE_UPLOAD_HANDLERS = [
+    'botanical.uploads.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+UPLOAD_MAX_IMAGE_PIXELS = 100_000_000
+UPLOAD_IMAGE_MAX_DIMENSION = 2048
+UPLOAD_IMAGE_WORKERS = 2
+
+# Plant Doctor result cache (botanical/diagnosis.py): LRU size, and how many
+# differing dHash bits (0-3, 0 disables) still count as the same photo
+DIAGNOSIS_CACHE_MAX_ENTRIES = 10000
+DIAGNOSIS_NEAR_DUPLICATE_DISTANCE = 2
+
+# Plant Doctor model backend and job queue (run_diagnosis_worker). StubBackend
+# answers after DIAGNOSIS_STUB_LATENCY seconds for offline load tests.
+DIAGNOSIS_BACKEND = 'botanical.diagnosis_backends.PlaceholderBackend'
+DIAGNOSIS_STUB_LATENCY = 2.0
+DIAGNOSIS_WORKER_CONCURRENCY = 4
+DIAGNOSIS_JOB_TIMEOUT = 300
+DIAGNOSIS_JOB_MAX_ATTEMPTS = 3
+# New uploads are refused (503) while this many jobs wait for a worker
+DIAGNOSIS_MAX_QUEUED_JOBS = 500
+
+# Order numbers (botanical/order_numbers.py): time-ordered, 13 characters.
+# Give every worker process its own ORDER_NUMBER_WORKER_ID (0-1023) to rule
+# out collisions; when unset each process picks one at random.
+ORDER_NUMBER_GENERATOR = 'botanical.order_numbers.SnowflakeGenerator'
+ORDER_NUMBER_WORKER_ID = int(os.environ['ORDER_NUMBER_WORKER_ID']) if os.environ.get('ORDER_NUMBER_WORKER_ID') else None
+
+# Admin changelists of the large tables (botanical/changelists.py). Unfiltered
+# lists past ADMIN_EXACT_COUNT_LIMIT rows show the database's row estimate
+# (SQLite has one after ANALYZE or PRAGMA optimize) or, lacking statistics, an
+# exact count; either is cached for ADMIN_COUNT_CACHE_TIMEOUT seconds.
+ADMIN_EXACT_COUNT_LIMIT = 100_000
+ADMIN_COUNT_CACHE_TIMEOUT = 300
+
 # Database
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Checkout transactions write; take the write lock when they begin
+            # so concurrent checkouts wait their turn instead of failing
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -112,3 +211,12 @@ SESSION_SAVE_EVERY_REQUEST = True
 
 # Gemini API Key (load from environment variable)
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+# GeminiBackend (set DIAGNOSIS_BACKEND = 'botanical.diagnosis_backends.GeminiBackend').
+# GEMINI_API_ENDPOINT may point at `manage.py gemini_standin` for offline runs.
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
+GEMINI_API_ENDPOINT = os.environ.get('GEMINI_API_ENDPOINT') or None
+GEMINI_MAX_CONCURRENCY = 4
+GEMINI_TIMEOUT = 30
+GEMINI_MAX_RETRIES = 3
+GEMINI_CIRCUIT_THRESHOLD = 5
+GEMINI_CIRCUIT_RESET = 30